@@ -0,0 +1,29 @@
+"""
+測試共用設定
+需要 MongoDB 的測試使用 mongodb_url fixture，連不上本機 MongoDB（MONGODB_URL）時略過
+"""
+import os
+from functools import lru_cache
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+
+
+@lru_cache(maxsize=None)
+def mongo_available() -> bool:
+    try:
+        MongoClient(MONGODB_URL, serverSelectionTimeoutMS=500).admin.command('ping')
+        return True
+    except PyMongoError:
+        return False
+
+
+@pytest.fixture
+def mongodb_url() -> str:
+    """本機 MongoDB 的連線網址（連不上時略過測試）"""
+    if not mongo_available():
+        pytest.skip("需要本機 MongoDB")
+    return MONGODB_URL
@@ -60,3 +60,4 @@ class Collections:
     CHECKINS = "checkins"
     USER_PROGRESS = "user_progress"
     ROUTE_SESSIONS = "route_sessions"
+    CHECKIN_BATCHES = "checkin_batches"
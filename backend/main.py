@@ -2,10 +2,11 @@
 TownPass Backend - FastAPI Version with MongoDB
 整合 tsp_taipei_route_new.py 路線生成邏輯
 """
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
 from contextlib import asynccontextmanager
+from pymongo.errors import DuplicateKeyError
 import os
 from typing import List
 from dotenv import load_dotenv
@@ -17,16 +18,44 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
-from database import connect_to_mongo, close_mongo_connection, async_database, Collections
+import database
+from database import connect_to_mongo, close_mongo_connection, Collections
 from models import (
-    Route, Spot, RouteDetail, Waypoint, CheckInRequest, CheckIn, UserProgress,
-    RouteSession, StartRouteRequest, CompleteRouteRequest, CertificateRequest
+    Route, Spot, RouteDetail, RouteGeometryLevel, Waypoint, CheckInRequest, CheckIn, UserProgress,
+    CheckInBatchRequest, CheckInBatchResponse, RouteSession, StartRouteRequest, CompleteRouteRequest, CertificateRequest
+)
+from services.svg_service import generate_route_svg, svg_cache
+from services.thumbnail_service import (
+    ROUTE_IMAGE_MODE, THUMBNAIL_MEDIA_TYPES, ensure_route_thumbnails, is_thumbnail_name, read_thumbnail,
+    thumbnail_cache, touch_thumbnail
 )
-from services.route_generator import generate_route_for_shape
-from services.svg_service import generate_route_svg
 from services.shape_service import SHAPE_TEMPLATES, SHAPE_INFO
-from services.certificate_service import generate_certificate
-from tsp_taipei_route_new import get_osrm_route, haversine_distance
+from services.certificate_service import certificate_template_version
+from services.certificate_cache import certificate_cache, certificate_cache_key, get_or_render_certificate
+from services.checkin_store import (
+    CHECKIN_BATCH_MAX_ITEMS, IdempotencyKeyConflictError, checkin_batch_key, record_checkin,
+    record_checkin_batch
+)
+from services.youbike_store import remove_published_snapshots, start_youbike_refresher, stop_youbike_refresher
+from services.attractions_repository import get_attractions_repository
+from services.executor import job_executor, ExecutorBusyError
+from services.route_cache import get_routes, route_cache
+from services.route_store import create_route_handle, get_route_by_handle, route_handle_store
+from services.routing_backend import close_leg_pool, get_routing_backend
+from services.route_geometry import (
+    GEOMETRY_FORMATS, get_route_geometry, get_route_geometry_level, meters_per_pixel,
+    route_geometry_cache, viewport_meters_per_pixel
+)
+from services.routing_client import close_routing_client, get_routing_client
+from services.leg_cache import leg_cache
+from services.checkin_buffer import (
+    CHECKIN_WRITE_MODE, CheckinBufferClosedError, CheckinBufferFullError, checkin_buffer
+)
+from services.indexes import MONGODB_ENSURE_INDEXES, ensure_indexes
+from services.progress_query import (
+    CHECKIN_PAGE_SIZE, CHECKIN_PAGE_SIZE_MAX, get_user_progress as query_user_progress
+)
+from tsp_taipei_route_new import haversine_distance
 
 load_dotenv()
 
@@ -34,7 +63,25 @@ load_dotenv()
 async def lifespan(app: FastAPI):
     """應用程式生命週期管理"""
     await connect_to_mongo()
+    if database.async_database is not None and MONGODB_ENSURE_INDEXES:
+        try:
+            await ensure_indexes(database.async_database)
+        except Exception as e:
+            print(f"⚠️ 建立索引失敗: {e}")
+    get_attractions_repository()
+    job_executor.start()
+    await job_executor.run_io(get_routing_backend)
+    await start_youbike_refresher()
+    if CHECKIN_WRITE_MODE == "buffered":
+        checkin_buffer.start()
     yield
+    await checkin_buffer.stop()
+    await job_executor.shutdown()
+    await close_leg_pool()
+    await stop_youbike_refresher()
+    remove_published_snapshots()
+    await close_routing_client()
+    leg_cache.close()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -66,6 +113,22 @@ def health_check():
     """健康檢查端點"""
     return {"message": "Server is running healthy!"}
 
+@app.get("/api/v1/stats")
+def service_stats():
+    """執行池排隊狀況與快取命中統計"""
+    return {
+        "executor": job_executor.stats(),
+        "route_cache": route_cache.stats(),
+        "route_handles": route_handle_store.stats(),
+        "route_legs": leg_cache.stats(),
+        "routing_client": get_routing_client().stats(),
+        "route_geometry": route_geometry_cache.stats(),
+        "route_svg": svg_cache.stats(),
+        "thumbnails": thumbnail_cache.stats(),
+        "certificates": certificate_cache.stats(),
+        "checkin_buffer": checkin_buffer.stats()
+    }
+
 @app.get("/api/v1/routeList", response_model=List[Route])
 async def route_list(
     lat: float = Query(..., description="使用者緯度", example=25.0330),
@@ -83,8 +146,9 @@ async def route_list(
             - id: 圖形 ID (T, A, I, P, E, S, U, O, L)
             - name: 圖形名稱
             - description: 描述
-            - image: SVG 圖形（實際路線）
+            - image: 路線縮圖網址（ROUTE_IMAGE_MODE=svg 時為內嵌 SVG 圖形）
             - Spots: 景點陣列（YouBike 站點 + 附近景點）
+            - handle: 路線代碼（取得路線詳情時使用）
     """
     try:
         print(f"\n{'='*70}")
@@ -93,14 +157,27 @@ async def route_list(
         
         routes = []
         
-        # 為每個圖形生成路線
-        for shape_id in SHAPE_TEMPLATES.keys():
-            # 生成路線
-            route_result = generate_route_for_shape(shape_id, lat, lon)
-            
+        # 一次為所有圖形取得路線（快取未命中的圖形在執行池中批次生成）
+        route_results = await get_routes(list(SHAPE_TEMPLATES.keys()), lat, lon)
+        
+        # 路線縮圖（缺少的一次繪製，已存在的直接回傳網址）
+        thumbnail_urls = {}
+        if ROUTE_IMAGE_MODE == "url":
+            try:
+                thumbnail_urls = await ensure_route_thumbnails({
+                    shape_id: route_result['route_df']
+                    for shape_id, route_result in route_results.items()
+                    if route_result and route_result['success']
+                })
+            except ExecutorBusyError:
+                raise
+            except Exception as e:
+                print(f"  ⚠️ 縮圖生成失敗，改用內嵌 SVG: {e}")
+        
+        for shape_id, route_result in route_results.items():
             if route_result and route_result['success']:
-                # 生成 SVG
-                svg = generate_route_svg(route_result['route_df'])
+                # 縮圖網址，未啟用或失敗時生成 SVG
+                image = thumbnail_urls.get(shape_id) or generate_route_svg(route_result['route_df'])
                 
                 # 轉換 Spots
                 spots = [
@@ -123,8 +200,9 @@ async def route_list(
                     id=shape_id,
                     name=info['name'],
                     description=f"{info['description']} (相似度: {route_result['similarity']:.1%})",
-                    image=svg,
-                    Spots=spots
+                    image=image,
+                    Spots=spots,
+                    handle=create_route_handle(route_result)
                 )
                 
                 routes.append(route)
@@ -137,18 +215,38 @@ async def route_list(
         
         return routes
         
+    except ExecutorBusyError:
+        raise HTTPException(status_code=503, detail="伺服器忙碌中，請稍後再試")
     except Exception as e:
         print(f"❌ 錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"生成路線失敗: {str(e)}")
 
+async def resolve_route(shape: str, lat: float, lon: float, handle: str = None):
+    """取得路線：有代碼時直接使用 routeList 的結果，否則優先使用快取"""
+    if handle:
+        route_result = get_route_by_handle(handle)
+        if route_result is None:
+            raise HTTPException(status_code=404, detail="路線代碼不存在或已過期，請重新取得路線列表")
+        if route_result['shape'] != shape:
+            raise HTTPException(status_code=400, detail=f"路線代碼不屬於圖形 {shape}")
+    else:
+        route_result = (await get_routes([shape], lat, lon))[shape]
+    
+    if not route_result or not route_result['success']:
+        raise HTTPException(status_code=500, detail=f"{shape} 路線生成失敗")
+    return route_result
+
 @app.get("/api/v1/route/{shape}", response_model=RouteDetail)
 async def get_route_detail(
     shape: str,
     lat: float = Query(25.021777051200228, description="使用者緯度"),
     lon: float = Query(121.5354050968437, description="使用者經度"),
-    userId: str = Query(None, description="使用者 ID（可選，用於查詢完成狀態）")
+    userId: str = Query(None, description="使用者 ID（可選，用於查詢完成狀態）"),
+    handle: str = Query(None, description="routeList 回傳的路線代碼（可選，提供時直接使用同一條路線）"),
+    geometry_format: str = Query("full", description="幾何格式：full（完整座標）/ simplified（簡化座標）/ polyline（Google encoded polyline）"),
+    tolerance: float = Query(None, gt=0, le=1000, description="簡化容許誤差（公尺），simplified 預設 5，polyline 提供時先簡化再編碼")
 ):
     """
     取得指定圖形的詳細路線資訊
@@ -158,6 +256,9 @@ async def get_route_detail(
         lat: 使用者緯度
         lon: 使用者經度
         userId: 使用者 ID（可選）
+        handle: 路線代碼（可選）
+        geometry_format: 幾何格式（full / simplified / polyline）
+        tolerance: 簡化容許誤差（公尺，可選）
     
     Returns:
         RouteDetail: 包含路線幾何、景點、距離、完成時間等資訊
@@ -168,6 +269,9 @@ async def get_route_detail(
         if shape not in SHAPE_TEMPLATES:
             raise HTTPException(status_code=404, detail=f"不支援的圖形: {shape}")
         
+        if geometry_format not in GEOMETRY_FORMATS:
+            raise HTTPException(status_code=400, detail=f"不支援的幾何格式: {geometry_format}")
+        
         print(f"\n{'='*70}")
         print(f"📍 生成 {shape} 形路線")
         print(f"   使用者位置: ({lat}, {lon})")
@@ -175,30 +279,12 @@ async def get_route_detail(
             print(f"   使用者 ID: {userId}")
         print(f"{'='*70}")
         
-        # 生成路線
-        route_result = generate_route_for_shape(shape, lat, lon)
-        
-        if not route_result or not route_result['success']:
-            raise HTTPException(status_code=500, detail=f"{shape} 路線生成失敗")
+        route_result = await resolve_route(shape, lat, lon, handle)
         
-        # 使用 OSRM 計算實際路線
-        osrm_result = get_osrm_route(route_result['route_df'])
-        
-        # 準備路線幾何座標
-        route_geometry = []
-        distance_km = 0
-        duration_min = 0
-        
-        if osrm_result and osrm_result['success']:
-            route_geometry = [[coord[0], coord[1]] for coord in osrm_result['coords']]
-            distance_km = osrm_result['distance']
-            duration_min = osrm_result['duration']
-        else:
-            # 如果 OSRM 失敗，使用直線連接
-            route_geometry = [
-                [row['latitude'], row['longitude']] 
-                for _, row in route_result['route_df'].iterrows()
-            ]
+        # 計算實際路線並轉換成要求的幾何格式（OSRM 或本地道路圖；失敗時使用直線連接）
+        geometry = await get_route_geometry(route_result['route_df'], geometry_format, tolerance)
+        distance_km = geometry['distance']
+        duration_min = geometry['duration']
         
         # 轉換景點資料
         waypoints = []
@@ -225,9 +311,9 @@ async def get_route_detail(
         completed_time = None
         duration_hours = None
         
-        if userId and async_database is not None:
+        if userId and database.async_database is not None:
             try:
-                session = await async_database[Collections.ROUTE_SESSIONS].find_one({
+                session = await database.async_database[Collections.ROUTE_SESSIONS].find_one({
                     "userId": userId,
                     "shape": shape,
                     "status": "completed"
@@ -243,7 +329,9 @@ async def get_route_detail(
             shape=shape,
             name=info['name'],
             description=info['description'],
-            route_geometry=route_geometry,
+            route_geometry=geometry['route_geometry'],
+            route_polyline=geometry['route_polyline'],
+            geometry_format=geometry_format,
             waypoints=waypoints,
             distance_km=distance_km,
             duration_min=duration_min,
@@ -261,12 +349,145 @@ async def get_route_detail(
         
     except HTTPException:
         raise
+    except ExecutorBusyError:
+        raise HTTPException(status_code=503, detail="伺服器忙碌中，請稍後再試")
     except Exception as e:
         print(f"❌ 錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"生成路線詳情失敗: {str(e)}")
 
+@app.get("/api/v1/route/{shape}/geometry", response_model=RouteGeometryLevel)
+async def get_route_geometry_by_level(
+    shape: str,
+    lat: float = Query(25.021777051200228, description="使用者緯度"),
+    lon: float = Query(121.5354050968437, description="使用者經度"),
+    handle: str = Query(None, description="routeList 回傳的路線代碼（可選）"),
+    level: int = Query(None, ge=0, description="層級編號（0 最粗略）"),
+    zoom: float = Query(None, ge=0, le=24, description="地圖縮放等級（未指定 level 時用來選擇層級）"),
+    bbox: str = Query(None, description="可視範圍 minLat,minLon,maxLat,maxLon（未指定 level 與 zoom 時搭配 width/height 選擇層級）"),
+    width: int = Query(None, gt=0, description="可視範圍寬度（像素）"),
+    height: int = Query(None, gt=0, description="可視範圍高度（像素）"),
+    geometry_format: str = Query("full", description="幾何格式：full（座標陣列）/ polyline（Google encoded polyline）")
+):
+    """
+    取得路線幾何金字塔的指定層級
+    
+    可直接指定 level，或提供 zoom（或 bbox + width/height）自動選擇在該縮放等級下
+    誤差不超過約 1 像素的最粗略層級；都未提供時回傳最粗略的層級
+    
+    Returns:
+        RouteGeometryLevel: 層級資訊與幾何
+    """
+    try:
+        shape = shape.upper()
+        
+        if shape not in SHAPE_TEMPLATES:
+            raise HTTPException(status_code=404, detail=f"不支援的圖形: {shape}")
+        
+        if geometry_format not in ("full", "polyline"):
+            raise HTTPException(status_code=400, detail=f"不支援的幾何格式: {geometry_format}")
+        
+        meters_per_px = None
+        if level is None and zoom is not None:
+            meters_per_px = meters_per_pixel(zoom, lat)
+        elif level is None and bbox:
+            try:
+                min_lat, min_lon, max_lat, max_lon = [float(value) for value in bbox.split(",")]
+            except ValueError:
+                raise HTTPException(status_code=400, detail="bbox 格式應為 minLat,minLon,maxLat,maxLon")
+            if not width or not height:
+                raise HTTPException(status_code=400, detail="使用 bbox 時必須提供 width 與 height")
+            meters_per_px = viewport_meters_per_pixel(min_lat, min_lon, max_lat, max_lon, width, height)
+        
+        route_result = await resolve_route(shape, lat, lon, handle)
+        geometry = await get_route_geometry_level(
+            route_result['route_df'], level=level, meters_per_px=meters_per_px,
+            encoded=geometry_format == "polyline"
+        )
+        
+        return RouteGeometryLevel(
+            shape=shape,
+            level=geometry['level'],
+            levels=geometry['levels'],
+            tolerance_m=geometry['tolerance_m'],
+            num_points=geometry['num_points'],
+            route_geometry=geometry['route_geometry'],
+            route_polyline=geometry['route_polyline'],
+            distance_km=geometry['distance'],
+            duration_min=geometry['duration']
+        )
+        
+    except HTTPException:
+        raise
+    except ExecutorBusyError:
+        raise HTTPException(status_code=503, detail="伺服器忙碌中，請稍後再試")
+    except Exception as e:
+        print(f"❌ 錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"取得路線幾何失敗: {str(e)}")
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 是否包含 etag（弱比較，* 代表任何版本）"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+@app.get("/api/v1/thumbnails/{name}")
+async def get_thumbnail(
+    name: str,
+    if_none_match: str = Header(None, description="先前取得的 ETag")
+):
+    """
+    取得路線縮圖
+    
+    檔名為路線內容的雜湊，內容永遠不變，因此使用強 ETag 並允許長期快取
+    
+    Args:
+        name: 縮圖檔名（routeList 回傳的 Route.image 網址）
+    
+    Returns:
+        PNG / WebP 圖片（縮圖存在且 ETag 相符時回傳 304）
+    """
+    if not is_thumbnail_name(name):
+        raise HTTPException(status_code=404, detail="縮圖不存在")
+    
+    etag = f'"{name}"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    
+    if etag_matches(if_none_match, etag):
+        # 縮圖可能已被淘汰，仍需確認存在才能回傳 304
+        if not await job_executor.run_io(touch_thumbnail, name):
+            raise HTTPException(status_code=404, detail="縮圖不存在")
+        return Response(status_code=304, headers=cache_headers)
+    
+    content = await job_executor.run_io(read_thumbnail, name)
+    if content is None:
+        raise HTTPException(status_code=404, detail="縮圖不存在")
+    
+    return Response(
+        content=content,
+        media_type=THUMBNAIL_MEDIA_TYPES[name.rsplit(".", 1)[1]],
+        headers=cache_headers
+    )
+
+def verify_checkin_location(request: CheckInRequest):
+    """
+    驗證打卡位置
+
+    Returns:
+        (距離（公尺）, 是否通過)
+    """
+    # 簡化邏輯：自動通過驗證
+    # 模擬一個合理的距離（10-50 公尺之間）
+    import random
+    return random.uniform(10, 50), True
+
 @app.post("/api/v1/checkin")
 async def check_in(request: CheckInRequest):
     """
@@ -286,14 +507,10 @@ async def check_in(request: CheckInRequest):
         print(f"   位置: ({request.userLat}, {request.userLon})")
         print(f"{'='*70}")
         
-        # 簡化邏輯：自動通過驗證
-        # 模擬一個合理的距離（10-50 公尺之間）
-        import random
-        distance = random.uniform(10, 50)
-        verified = True
+        distance, verified = verify_checkin_location(request)
         
         # 如果有資料庫連線，保存打卡記錄
-        if async_database is not None:
+        if database.async_database is not None:
             try:
                 checkin_data = {
                     "userId": request.userId,
@@ -305,37 +522,18 @@ async def check_in(request: CheckInRequest):
                     "distance": distance
                 }
                 
-                await async_database[Collections.CHECKINS].insert_one(checkin_data)
-                print(f"✅ 打卡記錄已保存到 MongoDB")
-                
-                # 更新使用者進度
-                progress = await async_database[Collections.USER_PROGRESS].find_one({
-                    "userId": request.userId,
-                    "shape": request.shape
-                })
-                
-                if progress:
-                    # 更新現有進度
-                    if request.waypointId not in progress['checkins']:
-                        await async_database[Collections.USER_PROGRESS].update_one(
-                            {"userId": request.userId, "shape": request.shape},
-                            {
-                                "$push": {"checkins": request.waypointId},
-                                "$inc": {"completed_waypoints": 1},
-                                "$set": {"last_updated": datetime.now()}
-                            }
-                        )
-                        # 重新計算完成率
-                        updated_progress = await async_database[Collections.USER_PROGRESS].find_one({
-                            "userId": request.userId,
-                            "shape": request.shape
-                        })
-                        if updated_progress:
-                            completion_rate = updated_progress['completed_waypoints'] / updated_progress['total_waypoints']
-                            await async_database[Collections.USER_PROGRESS].update_one(
-                                {"userId": request.userId, "shape": request.shape},
-                                {"$set": {"completion_rate": completion_rate}}
-                            )
+                if checkin_buffer.running:
+                    # 放進寫入佇列，由背景任務批次寫入
+                    await checkin_buffer.submit(checkin_data)
+                    print(f"✅ 打卡記錄已放入寫入佇列")
+                else:
+                    # 先寫入打卡記錄再更新進度，進度在伺服器上一次更新完成
+                    progress = await record_checkin(database.async_database, checkin_data)
+                    print(f"✅ 打卡記錄已保存到 MongoDB")
+                    if progress:
+                        print(f"   進度: {progress.get('completed_waypoints')}/{progress.get('total_waypoints')}")
+            except (CheckinBufferFullError, CheckinBufferClosedError):
+                raise HTTPException(status_code=503, detail="伺服器忙碌中，請稍後再試")
             except Exception as db_error:
                 print(f"⚠️ MongoDB 操作失敗: {db_error}")
                 print(f"⚠️ 繼續執行，但打卡記錄未保存")
@@ -354,23 +552,117 @@ async def check_in(request: CheckInRequest):
             "timestamp": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ 打卡錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"打卡失敗: {str(e)}")
 
+@app.post("/api/v1/checkin/batch", response_model=CheckInBatchResponse)
+async def check_in_batch(
+    request: CheckInBatchRequest,
+    idempotency_key: str = Header(None, alias="Idempotency-Key", description="冪等鍵（重送時帶上回應中的 idempotencyKey）")
+):
+    """
+    批次打卡 API - 收訊不佳時 App 暫存的打卡一次補傳
+    
+    批次內重複的打卡只記錄第一筆；打卡記錄以一次 insert_many 寫入，
+    使用者進度以一次 bulk_write 更新。結果依 (使用者, 冪等鍵) 保存，重送同一批次時直接回傳；
+    同一個冪等鍵用於內容不同的批次時回傳 422
+    
+    Args:
+        request: 打卡陣列
+        idempotency_key: 冪等鍵（未提供時依批次內容計算）
+    
+    Returns:
+        每筆打卡的結果與冪等鍵
+    """
+    try:
+        print(f"\n{'='*70}")
+        print(f"📍 批次打卡: {len(request.checkins)} 筆")
+        print(f"{'='*70}")
+        
+        if len(request.checkins) > CHECKIN_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"單次最多 {CHECKIN_BATCH_MAX_ITEMS} 筆打卡")
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= 128:
+            raise HTTPException(status_code=400, detail="Idempotency-Key 長度應為 1-128 個字元")
+        
+        # 補傳的打卡需要確實保存，沒有資料庫時讓 App 稍後重送
+        if database.async_database is None:
+            raise HTTPException(status_code=503, detail="資料庫連線不可用")
+        
+        # 以 App 送出的內容計算，重送時（未提供打卡時間的項目）仍會相同
+        fingerprint = checkin_batch_key([item.model_dump() for item in request.checkins])
+        if idempotency_key is None:
+            idempotency_key = fingerprint
+        
+        now = datetime.now()
+        checkins = []
+        for item in request.checkins:
+            distance, verified = verify_checkin_location(item)
+            timestamp = item.timestamp or now
+            if timestamp.tzinfo is not None:
+                # 與其他打卡記錄相同，保存為伺服器當地時間
+                timestamp = timestamp.astimezone().replace(tzinfo=None)
+            checkins.append({
+                "userId": item.userId,
+                "waypointId": item.waypointId,
+                "shape": item.shape,
+                "timestamp": timestamp,
+                "location": {"lat": item.userLat, "lon": item.userLon},
+                "verified": verified,
+                "distance": distance
+            })
+        
+        try:
+            result, replayed = await record_checkin_batch(
+                database.async_database, idempotency_key, checkins, fingerprint
+            )
+        except IdempotencyKeyConflictError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        
+        if replayed:
+            print(f"✅ 批次已處理過，回傳先前的結果")
+        else:
+            print(f"✅ 已記錄 {result['recorded']} 筆，重複 {result['duplicates']} 筆")
+        print(f"{'='*70}\n")
+        
+        return CheckInBatchResponse(
+            success=True,
+            idempotencyKey=idempotency_key,
+            replayed=replayed,
+            **result
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ 批次打卡錯誤: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"批次打卡失敗: {str(e)}")
+
 @app.get("/api/v1/progress/{userId}")
 async def get_user_progress(
     userId: str,
-    shape: str = Query(None, description="指定圖形 ID（可選）")
+    shape: str = Query(None, description="指定圖形 ID（可選）"),
+    limit: int = Query(CHECKIN_PAGE_SIZE, ge=1, le=CHECKIN_PAGE_SIZE_MAX, description="每頁打卡記錄數"),
+    after: str = Query(None, description="上一次回傳的 next_cursor（只取之後的打卡記錄）")
 ):
     """
     取得使用者進度
     
+    進度、打卡記錄與路線會話以一次 aggregation 查詢；
+    打卡記錄依打卡時間排序並分頁，next_cursor 傳給 after 取得下一頁；has_more 為 false 時仍會回傳
+    next_cursor，定期查詢時帶入 after 只會取得新的打卡
+    
     Args:
         userId: 使用者 ID
         shape: 圖形 ID（可選，不指定則回傳所有圖形的進度）
+        limit: 每頁打卡記錄數
+        after: 分頁游標
     
     Returns:
         使用者的打卡記錄和完成進度
@@ -383,7 +675,7 @@ async def get_user_progress(
             print(f"   圖形: {shape}")
         print(f"{'='*70}")
         
-        if async_database is None:
+        if database.async_database is None:
             print(f"⚠️ 無 MongoDB 連線")
             return {
                 "userId": userId,
@@ -391,62 +683,20 @@ async def get_user_progress(
                 "total_checkins": 0
             }
         
-        # 查詢進度
-        query = {"userId": userId}
-        if shape:
-            query["shape"] = shape.upper()
-        
-        progress_list = await async_database[Collections.USER_PROGRESS].find(query).to_list(length=100)
-        
-        # 查詢打卡記錄
-        checkin_query = {"userId": userId}
-        if shape:
-            checkin_query["shape"] = shape.upper()
-        
-        checkins = await async_database[Collections.CHECKINS].find(checkin_query).to_list(length=1000)
-        
-        # 查詢路線會話狀態
-        session_query = {"userId": userId}
-        if shape:
-            session_query["shape"] = shape.upper()
-        
-        sessions = await async_database[Collections.ROUTE_SESSIONS].find(session_query).to_list(length=100)
+        try:
+            result = await query_user_progress(database.async_database, userId, shape, limit, after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        print(f"✅ 找到 {len(progress_list)} 個進度記錄")
-        print(f"✅ 找到 {len(checkins)} 個打卡記錄")
-        print(f"✅ 找到 {len(sessions)} 個會話記錄")
+        print(f"✅ 找到 {len(result['progress'])} 個進度記錄")
+        print(f"✅ 找到 {len(result['checkins'])}/{result['total_checkins']} 個打卡記錄")
+        print(f"✅ 找到 {len(result['sessions'])} 個會話記錄")
         print(f"{'='*70}\n")
         
-        # 轉換 ObjectId 為字串
-        for p in progress_list:
-            if '_id' in p:
-                p['_id'] = str(p['_id'])
-            if 'last_updated' in p and isinstance(p['last_updated'], datetime):
-                p['last_updated'] = p['last_updated'].isoformat()
-        
-        for c in checkins:
-            if '_id' in c:
-                c['_id'] = str(c['_id'])
-            if 'timestamp' in c and isinstance(c['timestamp'], datetime):
-                c['timestamp'] = c['timestamp'].isoformat()
-        
-        # 處理會話資料
-        for s in sessions:
-            if '_id' in s:
-                s['_id'] = str(s['_id'])
-            if 'start_time' in s and isinstance(s['start_time'], datetime):
-                s['start_time'] = s['start_time'].isoformat()
-            if 'end_time' in s and isinstance(s['end_time'], datetime):
-                s['end_time'] = s['end_time'].isoformat()
-        
-        return {
-            "userId": userId,
-            "progress": progress_list,
-            "checkins": checkins,
-            "sessions": sessions,
-            "total_checkins": len(checkins)
-        }
+        return {"userId": userId, **result}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ 查詢進度錯誤: {str(e)}")
         import traceback
@@ -471,7 +721,7 @@ async def start_route(request: StartRouteRequest):
         print(f"   圖形: {request.shape}")
         print(f"{'='*70}")
         
-        if async_database is None:
+        if database.async_database is None:
             # 無 MongoDB 連線時，返回模擬成功響應
             print(f"⚠️ 無 MongoDB 連線，返回模擬響應")
             start_time = datetime.now()
@@ -487,7 +737,7 @@ async def start_route(request: StartRouteRequest):
             }
         
         # 檢查是否已有進行中或已完成的會話
-        existing_session = await async_database[Collections.ROUTE_SESSIONS].find_one({
+        existing_session = await database.async_database[Collections.ROUTE_SESSIONS].find_one({
             "userId": request.userId,
             "shape": request.shape.upper()
         })
@@ -524,7 +774,22 @@ async def start_route(request: StartRouteRequest):
             "duration_hours": None
         }
         
-        await async_database[Collections.ROUTE_SESSIONS].insert_one(session_data)
+        try:
+            await database.async_database[Collections.ROUTE_SESSIONS].insert_one(session_data)
+        except DuplicateKeyError:
+            # 同一使用者同時開始同一條路線，會話已由另一個請求建立
+            existing_session = await database.async_database[Collections.ROUTE_SESSIONS].find_one({
+                "userId": request.userId,
+                "shape": request.shape.upper()
+            })
+            return {
+                "success": True,
+                "message": "路線已在進行中",
+                "session": {
+                    "status": "started",
+                    "start_time": existing_session['start_time'].isoformat()
+                }
+            }
         
         print(f"✅ 路線已開始")
         print(f"{'='*70}\n")
@@ -564,7 +829,7 @@ async def complete_route(request: CompleteRouteRequest):
         print(f"   圖形: {request.shape}")
         print(f"{'='*70}")
         
-        if async_database is None:
+        if database.async_database is None:
             # 無 MongoDB 連線時，返回模擬成功響應
             print(f"⚠️ 無 MongoDB 連線，返回模擬響應")
             end_time = datetime.now()
@@ -584,7 +849,7 @@ async def complete_route(request: CompleteRouteRequest):
             }
         
         # 查詢路線會話
-        session = await async_database[Collections.ROUTE_SESSIONS].find_one({
+        session = await database.async_database[Collections.ROUTE_SESSIONS].find_one({
             "userId": request.userId,
             "shape": request.shape.upper(),
             "status": "started"
@@ -600,7 +865,7 @@ async def complete_route(request: CompleteRouteRequest):
         duration_hours = duration_seconds / 3600
         
         # 更新會話狀態
-        await async_database[Collections.ROUTE_SESSIONS].update_one(
+        await database.async_database[Collections.ROUTE_SESSIONS].update_one(
             {"_id": session['_id']},
             {
                 "$set": {
@@ -635,10 +900,17 @@ async def complete_route(request: CompleteRouteRequest):
         raise HTTPException(status_code=500, detail=f"完成路線失敗: {str(e)}")
 
 @app.get("/api/v1/certificate/{userId}/{shape}")
-async def get_certificate(userId: str, shape: str):
+async def get_certificate(
+    userId: str,
+    shape: str,
+    if_none_match: str = Header(None, description="先前取得的 ETag")
+):
     """
     生成並下載完成證書
     
+    證書依 (使用者, 圖形, 完成時間, 模板版本) 快取在磁碟上，並以同一個雜湊作為 ETag；
+    If-None-Match 相符時回傳 304，只需要查詢一次資料庫
+    
     Args:
         userId: 使用者 ID
         shape: 圖形 ID
@@ -653,11 +925,11 @@ async def get_certificate(userId: str, shape: str):
         print(f"   圖形: {shape}")
         print(f"{'='*70}")
         
-        if async_database is None:
+        if database.async_database is None:
             raise HTTPException(status_code=503, detail="資料庫連線不可用")
         
         # 查詢已完成的路線會話
-        session = await async_database[Collections.ROUTE_SESSIONS].find_one({
+        session = await database.async_database[Collections.ROUTE_SESSIONS].find_one({
             "userId": userId,
             "shape": shape.upper(),
             "status": "completed"
@@ -666,15 +938,30 @@ async def get_certificate(userId: str, shape: str):
         if not session:
             raise HTTPException(status_code=404, detail="找不到已完成的路線記錄")
         
+        # 同一次完成（完成時間）與同一版模板的證書內容不變
+        template_version = await job_executor.run_io(certificate_template_version)
+        cache_key = certificate_cache_key(userId, shape, session['end_time'], template_version)
+        etag = f'"{cache_key}"'
+        cache_headers = {
+            "ETag": etag,
+            # 同一網址在重新完成路線後內容會改變，因此每次都需要以 ETag 驗證
+            "Cache-Control": "private, no-cache"
+        }
+        
+        if etag_matches(if_none_match, etag):
+            print(f"✅ 證書未變更（304）")
+            return Response(status_code=304, headers=cache_headers)
+        
         # 生成證書
         # 使用者名稱可以從 userId 或者從其他地方獲取，這裡暫時使用 userId
         # 在實際應用中，應該從用戶資料表中獲取真實姓名
         user_name = userId  # 可以改為從資料庫獲取真實姓名
         
-        certificate_bytes = generate_certificate(
+        certificate_bytes = await get_or_render_certificate(
+            cache_key,
             user_name=user_name,
-            shape=shape.upper(),
-            completed_time=session['end_time'].isoformat(),
+            shape=shape,
+            end_time=session['end_time'],
             duration_hours=session.get('duration_hours', 0)
         )
         
@@ -686,12 +973,15 @@ async def get_certificate(userId: str, shape: str):
             content=certificate_bytes,
             media_type="image/png",
             headers={
+                **cache_headers,
                 "Content-Disposition": f"attachment; filename=certificate_{shape}_{userId}.png"
             }
         )
         
     except HTTPException:
         raise
+    except ExecutorBusyError:
+        raise HTTPException(status_code=503, detail="伺服器忙碌中，請稍後再試")
     except Exception as e:
         print(f"❌ 生成證書錯誤: {str(e)}")
         import traceback
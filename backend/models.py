@@ -36,8 +36,9 @@ class Route(BaseModel):
     id: str = Field(..., description="路線 ID")
     name: str = Field(..., description="路線名稱")
     description: str = Field(..., description="路線描述")
-    image: str = Field(..., description="SVG 圖形")
+    image: str = Field(..., description="路線縮圖網址（ROUTE_IMAGE_MODE=svg 時為內嵌 SVG 圖形）")
     Spots: List[Spot] = Field(default=[], description="景點陣列")
+    handle: Optional[str] = Field(None, description="路線代碼（傳給 /api/v1/route/{shape} 以取得同一條路線）")
 
 class ApiResponse(BaseModel):
     """標準 API 回應"""
@@ -62,13 +63,27 @@ class RouteDetail(BaseModel):
     shape: str = Field(..., description="圖形 ID")
     name: str = Field(..., description="路線名稱")
     description: str = Field(..., description="路線描述")
-    route_geometry: List[List[float]] = Field(..., description="路線幾何座標 [[lat, lon], ...]")
+    route_geometry: List[List[float]] = Field(default_factory=list, description="路線幾何座標 [[lat, lon], ...]（polyline 格式時為空）")
+    route_polyline: Optional[str] = Field(None, description="Google encoded polyline（精度 5，geometry_format=polyline 時提供）")
+    geometry_format: str = Field(default="full", description="幾何格式 (full / simplified / polyline)")
     waypoints: List[Waypoint] = Field(..., description="路徑點陣列")
     distance_km: float = Field(default=0, description="總距離（公里）")
     duration_min: float = Field(default=0, description="預估時間（分鐘）")
     completed_time: Optional[str] = Field(None, description="完成時間 (ISO 格式)")
     duration_hours: Optional[float] = Field(None, description="耗時（小時）")
 
+class RouteGeometryLevel(BaseModel):
+    """路線幾何金字塔的一個層級"""
+    shape: str = Field(..., description="圖形 ID")
+    level: int = Field(..., description="層級編號（0 最粗略）")
+    levels: List[float] = Field(..., description="各層級的容許誤差（公尺），最後一層為完整幾何 (0)")
+    tolerance_m: float = Field(..., description="此層級的簡化容許誤差（公尺）")
+    num_points: int = Field(..., description="座標點數")
+    route_geometry: List[List[float]] = Field(default_factory=list, description="路線幾何座標 [[lat, lon], ...]（polyline 格式時為空）")
+    route_polyline: Optional[str] = Field(None, description="Google encoded polyline（精度 5，geometry_format=polyline 時提供）")
+    distance_km: float = Field(default=0, description="總距離（公里）")
+    duration_min: float = Field(default=0, description="預估時間（分鐘）")
+
 class CheckInRequest(BaseModel):
     """打卡請求"""
     userId: str = Field(..., description="使用者 ID")
@@ -77,6 +92,34 @@ class CheckInRequest(BaseModel):
     userLat: float = Field(..., description="使用者緯度")
     userLon: float = Field(..., description="使用者經度")
 
+class CheckInBatchItem(CheckInRequest):
+    """批次打卡中的一筆打卡"""
+    timestamp: Optional[datetime] = Field(None, description="打卡時間（離線打卡時由 App 記錄，未提供時使用伺服器時間）")
+
+class CheckInBatchRequest(BaseModel):
+    """批次打卡請求（離線補傳）"""
+    checkins: List[CheckInBatchItem] = Field(..., min_length=1, description="打卡陣列（依打卡順序）")
+
+class CheckInBatchResult(BaseModel):
+    """批次打卡中一筆打卡的結果"""
+    index: int = Field(..., description="在請求陣列中的索引")
+    waypointId: str = Field(..., description="路徑點 ID")
+    shape: str = Field(..., description="圖形 ID")
+    status: str = Field(..., description="狀態 (recorded: 已記錄 / duplicate: 與前面的打卡重複)")
+    duplicateOf: Optional[int] = Field(None, description="重複時，第一次出現的索引")
+    verified: bool = Field(..., description="是否驗證通過")
+    distance: float = Field(..., description="與景點的距離（公尺）")
+    timestamp: str = Field(..., description="打卡時間 (ISO 格式)")
+
+class CheckInBatchResponse(BaseModel):
+    """批次打卡回應"""
+    success: bool = Field(..., description="是否成功")
+    idempotencyKey: str = Field(..., description="冪等鍵（重送同一批打卡時帶在 Idempotency-Key 標頭）")
+    replayed: bool = Field(default=False, description="是否為先前已處理的批次（直接回傳當時的結果）")
+    recorded: int = Field(..., description="已記錄的打卡數")
+    duplicates: int = Field(..., description="重複的打卡數")
+    results: List[CheckInBatchResult] = Field(..., description="每筆打卡的結果（與請求順序相同）")
+
 class CheckIn(BaseModel):
     """打卡記錄"""
     userId: str = Field(..., description="使用者 ID")
@@ -0,0 +1,104 @@
+"""
+景點資料庫服務
+啟動時讀取一次 taipei_attractions.csv，只保留路線生成需要的欄位，所有呼叫端共用同一份唯讀資料
+"""
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.spatial_index import GeoPointIndex
+
+# CSV 檔案路徑（專案根目錄）
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+parent_dir = os.path.dirname(backend_dir)
+ATTRACTIONS_CSV_PATH = os.path.join(parent_dir, 'taipei_attractions.csv')
+
+# 路線生成需要的欄位（其餘如 introduction 等長文字不讀取）
+ATTRACTION_COLUMNS = ['id', 'name', 'address', 'nlat', 'elong', 'category']
+
+
+class AttractionsRepository:
+    """景點資料（唯讀）"""
+    def __init__(self, df: pd.DataFrame):
+        df = df.reset_index(drop=True)
+        self.df = df
+
+        # 座標以連續的 float64 陣列保存，方便向量化計算
+        self.lat = np.ascontiguousarray(df['nlat'].to_numpy(dtype=np.float64))
+        self.lon = np.ascontiguousarray(df['elong'].to_numpy(dtype=np.float64))
+        self.lat.setflags(write=False)
+        self.lon.setflags(write=False)
+
+        self.ids = df['id'].to_numpy()
+        self.names = df['name'].to_numpy(dtype=object)
+        self.addresses = df['address'].to_numpy(dtype=object)
+        self.categories = df['category'].to_numpy(dtype=object)
+
+        self.index = GeoPointIndex(self.lat, self.lon)
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def find_nearby_batch(self, lats, lons, radius_meters: float = 300) -> List[List[Dict[str, Any]]]:
+        """
+        批次查詢多個站點附近的景點（結果與 find_nearby_attractions 相同）
+
+        Args:
+            lats, lons: 站點座標陣列
+            radius_meters: 搜尋半徑（公尺）
+
+        Returns:
+            每個站點一個景點列表，依距離由近到遠排序
+        """
+        results = []
+        for idx, distances in self.index.query_radius(lats, lons, radius_meters):
+            results.append([
+                {
+                    'name': self.names[i],
+                    'address': self.addresses[i],
+                    'distance': distance,
+                    'lat': self.lat[i],
+                    'lon': self.lon[i]
+                }
+                for i, distance in zip(idx, distances)
+            ])
+        return results
+
+
+def load_attractions_repository(path: str = ATTRACTIONS_CSV_PATH) -> AttractionsRepository:
+    """從 CSV 讀取景點資料"""
+    print("🏛️ 正在讀取台北景點資料...")
+    try:
+        df = pd.read_csv(path, usecols=ATTRACTION_COLUMNS, encoding='utf-8-sig')
+        df = df[pd.notna(df['nlat']) & pd.notna(df['elong'])]
+        print(f"✅ 讀取 {len(df)} 個景點")
+    except FileNotFoundError:
+        print(f"❌ 找不到 {path}")
+        df = pd.DataFrame({
+            'id': pd.Series(dtype='int64'),
+            'name': pd.Series(dtype=object),
+            'address': pd.Series(dtype=object),
+            'nlat': pd.Series(dtype='float64'),
+            'elong': pd.Series(dtype='float64'),
+            'category': pd.Series(dtype=object),
+        })
+    return AttractionsRepository(df)
+
+
+# 共用的景點資料（整個行程只讀取一次）
+_repository: Optional[AttractionsRepository] = None
+_load_lock = threading.Lock()
+
+
+def get_attractions_repository() -> AttractionsRepository:
+    """取得共用的景點資料（尚未載入時才讀取 CSV）"""
+    global _repository
+    if _repository is None:
+        with _load_lock:
+            if _repository is None:
+                _repository = load_attractions_repository()
+    return _repository
@@ -0,0 +1,302 @@
+"""
+批次發放證書
+活動結束時以游標逐批讀取已完成的 route_sessions，在行程池中繪製證書（每個行程只載入一次模板），
+輸出到目錄（可再打包成 zip）；完成的證書記錄在 manifest.jsonl，中斷後重新執行會略過已完成的部分
+
+用法: python -m services.certificate_batch <輸出目錄> [--shape T] [--since 2025-11-01] [--archive certificates.zip]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from services.certificate_cache import certificate_cache_key
+from services.certificate_service import (
+    CERTIFICATE_TEMPLATE_PATH, CertificateRenderer, certificate_template_version
+)
+from services.executor import CPU_WORKERS
+
+# 已完成證書的記錄檔（每行一筆 JSON）
+MANIFEST_NAME = "manifest.jsonl"
+
+# 每批從 MongoDB 取回的會話數
+SESSION_BATCH_SIZE = 500
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+# 行程池中每個行程的繪製器
+_worker_renderer: Optional[CertificateRenderer] = None
+
+
+def certificate_file_name(user_id: str, shape: str, key: str) -> str:
+    """
+    證書檔名（與 API 下載的檔名相同）
+
+    userId 含有不適合當檔名的字元時改為底線，並加上快取鍵前 8 碼避免撞名
+    """
+    safe_user_id = _SAFE_NAME.sub("_", user_id)
+    if safe_user_id != user_id:
+        safe_user_id = f"{safe_user_id}_{key[:8]}"
+    return f"certificate_{shape.upper()}_{safe_user_id}.png"
+
+
+def load_manifest(output_dir: str) -> Dict[str, str]:
+    """讀取已完成的證書 {檔名: 快取鍵}（最後一行中斷時略過）"""
+    done = {}
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[entry["file"]] = entry["key"]
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _init_worker(template_path: str):
+    """行程池初始化：載入模板與字型"""
+    global _worker_renderer
+    _worker_renderer = CertificateRenderer(template_path)
+
+
+def _render_to_file(path: str, user_name: str, completed_time: str) -> int:
+    """在行程中繪製證書並寫入檔案（先寫暫存檔再改名），回傳檔案大小"""
+    certificate_bytes = _worker_renderer.render(user_name, completed_time)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(certificate_bytes)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(certificate_bytes)
+
+
+class BatchProgress:
+    """批次進度與吞吐量"""
+    def __init__(self, total: Optional[int] = None, interval: float = 5.0):
+        self.total = total
+        self.interval = interval
+        self.rendered = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    @property
+    def processed(self) -> int:
+        return self.rendered + self.skipped + self.failed
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def rate(self) -> float:
+        """每秒繪製的證書數（不含略過的）"""
+        elapsed = self.elapsed()
+        return self.rendered / elapsed if elapsed > 0 else 0.0
+
+    def report(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+
+        rate = self.rate()
+        line = f"  📜 {self.processed}"
+        if self.total:
+            line += f"/{self.total} ({self.processed / self.total:.1%})"
+        line += f" | 繪製 {self.rendered} 略過 {self.skipped} 失敗 {self.failed} | {rate:.1f} 張/秒"
+        if self.total and rate > 0:
+            remaining = max(self.total - self.processed, 0)
+            line += f" | 預估剩餘 {remaining / rate:.0f} 秒"
+        print(line, flush=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "rendered": self.rendered,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "seconds": round(self.elapsed(), 3),
+            "per_second": round(self.rate(), 2),
+        }
+
+
+def render_certificates(
+    sessions: Iterable[Dict[str, Any]],
+    output_dir: str,
+    total: Optional[int] = None,
+    template_path: str = CERTIFICATE_TEMPLATE_PATH,
+    workers: int = CPU_WORKERS,
+    max_pending: Optional[int] = None,
+    progress_interval: float = 5.0
+) -> Dict[str, Any]:
+    """
+    批次繪製證書
+
+    會話逐筆讀取，同時送出的工作不超過 max_pending，不會一次載入所有會話；
+    manifest 中相同檔名且快取鍵相同（同一次完成、同一版模板）的證書直接略過
+
+    Args:
+        sessions: 已完成的會話（包含 userId, shape, end_time, duration_hours）
+        output_dir: 輸出目錄
+        total: 會話總數（用於顯示進度）
+        template_path: 證書模板
+        workers: 行程數
+        max_pending: 同時送出的工作上限（預設為行程數的 4 倍）
+
+    Returns:
+        統計資料
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_manifest(output_dir)
+    template_version = certificate_template_version(template_path)
+    max_pending = max_pending or workers * 4
+    progress = BatchProgress(total, progress_interval)
+    pending: Dict[Future, Dict[str, str]] = {}
+
+    def collect(futures):
+        for future in futures:
+            entry = pending.pop(future)
+            try:
+                progress.bytes += future.result()
+            except BrokenProcessPool:
+                # 行程異常結束時中止，已完成的部分記錄在 manifest，可重新執行
+                raise
+            except Exception as e:
+                progress.failed += 1
+                print(f"  ❌ {entry['file']}: {e}")
+                continue
+            progress.rendered += 1
+            manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            manifest.flush()
+            done[entry["file"]] = entry["key"]
+
+    context = multiprocessing.get_context("spawn")
+    with open(os.path.join(output_dir, MANIFEST_NAME), "a", encoding="utf-8") as manifest, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                initializer=_init_worker, initargs=(template_path,)) as pool:
+        for session in sessions:
+            user_id = str(session["userId"])
+            shape = session["shape"].upper()
+            end_time = session["end_time"]
+            key = certificate_cache_key(user_id, shape, end_time, template_version)
+            file_name = certificate_file_name(user_id, shape, key)
+            path = os.path.join(output_dir, file_name)
+
+            if done.get(file_name) == key and os.path.exists(path):
+                progress.skipped += 1
+                progress.report()
+                continue
+
+            # 使用者名稱與 API 相同，暫時使用 userId
+            future = pool.submit(_render_to_file, path, user_id, end_time.isoformat())
+            pending[future] = {
+                "file": file_name,
+                "key": key,
+                "userId": user_id,
+                "shape": shape,
+                "end_time": end_time.isoformat(),
+            }
+            if len(pending) >= max_pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            progress.report()
+
+        collect(list(wait(pending)[0]))
+
+    progress.report(force=True)
+    return progress.stats()
+
+
+def write_archive(output_dir: str, archive_path: str) -> int:
+    """
+    將輸出目錄中 manifest 記錄的證書打包成 zip（PNG 已壓縮，直接存放）
+
+    Returns:
+        打包的證書數
+    """
+    done = load_manifest(output_dir)
+    archive_dir = os.path.dirname(os.path.abspath(archive_path))
+    fd, tmp_path = tempfile.mkstemp(dir=archive_dir, suffix=".tmp")
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+            for file_name in sorted(done):
+                path = os.path.join(output_dir, file_name)
+                if os.path.exists(path):
+                    archive.write(path, file_name)
+            archive.write(os.path.join(output_dir, MANIFEST_NAME), MANIFEST_NAME)
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(done)
+
+
+def completed_sessions_query(shape: Optional[str] = None, since: Optional[datetime] = None) -> Dict[str, Any]:
+    """已完成會話的查詢條件"""
+    query: Dict[str, Any] = {"status": "completed"}
+    if shape:
+        query["shape"] = shape.upper()
+    if since:
+        query["end_time"] = {"$gte": since}
+    return query
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批次發放完成證書')
+    parser.add_argument('output_dir', type=str, help='輸出目錄（重新執行時略過已完成的證書）')
+    parser.add_argument('--shape', type=str, default=None, help='只處理指定圖形')
+    parser.add_argument('--since', type=datetime.fromisoformat, default=None, help='只處理此時間之後完成的路線（ISO 格式）')
+    parser.add_argument('--workers', type=int, default=CPU_WORKERS, help='繪製行程數')
+    parser.add_argument('--archive', type=str, default=None, help='完成後打包成 zip')
+    args = parser.parse_args()
+
+    from database import Collections, get_sync_database
+
+    collection = get_sync_database()[Collections.ROUTE_SESSIONS]
+    query = completed_sessions_query(args.shape, args.since)
+    total = collection.count_documents(query)
+    print(f"🎓 批次發放證書: {total} 筆已完成路線 → {args.output_dir}（{args.workers} 個行程）")
+
+    cursor = collection.find(
+        query,
+        projection={"_id": 0, "userId": 1, "shape": 1, "end_time": 1, "duration_hours": 1},
+        batch_size=SESSION_BATCH_SIZE
+    )
+    try:
+        stats = render_certificates(cursor, args.output_dir, total=total, workers=args.workers)
+    finally:
+        cursor.close()
+
+    print(f"✅ 繪製 {stats['rendered']} 張、略過 {stats['skipped']} 張、失敗 {stats['failed']} 張，"
+          f"耗時 {stats['seconds']:.1f} 秒（{stats['per_second']:.1f} 張/秒）")
+
+    if args.archive:
+        count = write_archive(args.output_dir, args.archive)
+        print(f"📦 已打包 {count} 張證書 → {args.archive}")
+
+    if stats['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
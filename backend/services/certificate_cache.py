@@ -0,0 +1,54 @@
+"""
+證書快取
+已完成路線的證書內容不會改變，以 (使用者, 圖形, 完成時間, 模板版本) 的雜湊為檔名保存在本機磁碟，
+限制總容量並淘汰最久未下載的證書；同一個雜湊也作為 ETag
+"""
+import hashlib
+import os
+from datetime import datetime
+
+from services.certificate_service import generate_certificate
+from services.disk_cache import DiskLRUCache
+from services.executor import job_executor
+from services.paths import backend_path
+
+# 快取目錄與容量上限（MB）
+CERTIFICATE_CACHE_DIR = backend_path("CERTIFICATE_CACHE_DIR", "cache", "certificates")
+CERTIFICATE_CACHE_MAX_MB = float(os.getenv("CERTIFICATE_CACHE_MAX_MB", "512"))
+
+certificate_cache = DiskLRUCache(
+    CERTIFICATE_CACHE_DIR, int(CERTIFICATE_CACHE_MAX_MB * 1024 * 1024), suffix=".png"
+)
+
+
+def certificate_cache_key(user_id: str, shape: str, end_time: datetime, template_version: str) -> str:
+    """證書快取鍵（SHA-1 十六進位）"""
+    raw = "\0".join([user_id, shape.upper(), end_time.isoformat(), template_version])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+async def get_or_render_certificate(key: str, user_name: str, shape: str,
+                                    end_time: datetime, duration_hours: float) -> bytes:
+    """
+    取得證書（快取沒有時在執行池中繪製並保存）
+
+    Args:
+        key: certificate_cache_key 的結果
+        user_name: 證書上的名稱
+        shape: 圖形 ID
+        end_time: 完成時間
+        duration_hours: 耗時（小時）
+    """
+    certificate_bytes = await job_executor.run_io(certificate_cache.get, key)
+    if certificate_bytes is not None:
+        return certificate_bytes
+
+    certificate_bytes = await job_executor.run_cpu(
+        generate_certificate,
+        user_name=user_name,
+        shape=shape.upper(),
+        completed_time=end_time.isoformat(),
+        duration_hours=duration_hours
+    )
+    await job_executor.run_io(certificate_cache.put, key, certificate_bytes)
+    return certificate_bytes
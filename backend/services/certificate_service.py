@@ -1,15 +1,18 @@
 """
 Certificate Generation Service
 使用 PIL (Pillow) 在證書模板上疊加個人化資訊
+模板與字型只讀取一次，固定文字預先合成，每張證書只繪製名稱與日期
 """
 from PIL import Image, ImageDraw, ImageFont
+import hashlib
 import io
 import os
+import threading
 from datetime import datetime
 from typing import Optional
 
 # 證書模板路徑
-CERTIFICATE_TEMPLATE_PATH = os.path.join(
+CERTIFICATE_TEMPLATE_PATH = os.getenv("CERTIFICATE_TEMPLATE_PATH") or os.path.join(
     os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
     "Certificate template.png"
 )
@@ -38,6 +41,148 @@ def get_shape_name(shape: str) -> str:
     }
     return shape_names.get(shape.upper(), f'{shape.upper()} 字形')
 
+# 金色文字顏色
+GOLD_COLOR = (218, 165, 32)
+
+# 固定文字（預先合成到模板上）與各行位置
+COMPLETION_TEXT = "於本年度完成台北通台北騎跡挑戰-"
+COMPLETION_TEXT2 = "YouBike景點巡禮"
+REWARD_TEXT = "特頒此狀，以茲鼓勵"
+NAME_Y = 600
+COMPLETION_Y = 800
+COMPLETION2_Y = 860
+REWARD_Y = 950
+DATE_Y = 1070
+
+# 證書版面改變時遞增（連同模板內容一起組成 template_version）
+CERTIFICATE_LAYOUT_VERSION = 1
+
+# PNG 壓縮等級（0-9，越低編碼越快、檔案越大）
+CERTIFICATE_PNG_COMPRESS_LEVEL = int(os.getenv("CERTIFICATE_PNG_COMPRESS_LEVEL", "6"))
+
+
+def _template_version(template_bytes: bytes, font_path_regular: str, font_path_bold: str) -> str:
+    """模板內容、字型與版面版本的雜湊"""
+    return hashlib.sha1(
+        template_bytes + f"|{font_path_regular}|{font_path_bold}|{CERTIFICATE_LAYOUT_VERSION}".encode('utf-8')
+    ).hexdigest()[:16]
+
+
+_template_versions = {}
+
+
+def certificate_template_version(
+    template_path: str = CERTIFICATE_TEMPLATE_PATH,
+    font_path_regular: str = FONT_PATH_REGULAR,
+    font_path_bold: str = FONT_PATH_BOLD
+) -> str:
+    """
+    證書模板版本（與 CertificateRenderer.template_version 相同）
+
+    不需載入字型與解碼圖片，模板檔案沒有變動時直接使用上次的結果
+    """
+    stat = os.stat(template_path)
+    cache_key = (template_path, stat.st_mtime_ns, stat.st_size, font_path_regular, font_path_bold)
+    version = _template_versions.get(cache_key)
+    if version is None:
+        with open(template_path, 'rb') as f:
+            version = _template_version(f.read(), font_path_regular, font_path_bold)
+        _template_versions[cache_key] = version
+    return version
+
+
+def format_certificate_date(completed_time: str) -> str:
+    """將完成時間（ISO 格式）轉換為證書上的日期文字"""
+    try:
+        dt = datetime.fromisoformat(completed_time.replace('Z', '+00:00'))
+        return f"西元{dt.year}年{dt.month}月{dt.day}日"
+    except:
+        return "西元2025年11月9日"
+
+
+class CertificateRenderer:
+    """
+    證書繪製器
+    模板與字型只在建立時讀取一次，固定文字預先合成到底圖上，
+    每次請求只複製底圖並繪製使用者名稱與日期
+    """
+    def __init__(
+        self,
+        template_path: str = CERTIFICATE_TEMPLATE_PATH,
+        font_path_regular: str = FONT_PATH_REGULAR,
+        font_path_bold: str = FONT_PATH_BOLD,
+        compress_level: int = CERTIFICATE_PNG_COMPRESS_LEVEL
+    ):
+        with open(template_path, 'rb') as f:
+            template_bytes = f.read()
+        template = Image.open(io.BytesIO(template_bytes))
+        template.load()
+
+        # 載入字型（如果失敗則使用預設字型）
+        try:
+            self.font_name = ImageFont.truetype(font_path_bold, 120)  # 使用者名稱
+            self.font_details = ImageFont.truetype(font_path_regular, 50)  # 詳細資訊
+            self.font_date = ImageFont.truetype(font_path_regular, 40)  # 日期
+        except:
+            self.font_name = ImageFont.load_default()
+            self.font_details = ImageFont.load_default()
+            self.font_date = ImageFont.load_default()
+
+        self.compress_level = compress_level
+        self.template_version = _template_version(template_bytes, font_path_regular, font_path_bold)
+
+        # 預先合成固定文字
+        draw = ImageDraw.Draw(template)
+        for text, y in ((COMPLETION_TEXT, COMPLETION_Y), (COMPLETION_TEXT2, COMPLETION2_Y), (REWARD_TEXT, REWARD_Y)):
+            self._draw_centered(draw, template.size[0], text, y, self.font_details)
+        self.base = template
+
+        # FreeType 字型物件不可同時在多個執行緒中使用
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _draw_centered(draw: ImageDraw.ImageDraw, width: int, text: str, y: int, font):
+        """水平置中繪製一行文字"""
+        bbox = draw.textbbox((0, 0), text, font=font)
+        x = (width - (bbox[2] - bbox[0])) // 2
+        draw.text((x, y), text, font=font, fill=GOLD_COLOR)
+
+    def render_image(self, user_name: str, completed_time: str) -> Image.Image:
+        """繪製個人化證書圖片"""
+        with self._lock:
+            image = self.base.copy()
+            draw = ImageDraw.Draw(image)
+            width = image.size[0]
+
+            # 1. 使用者名稱（中央偏上，大字體）
+            self._draw_centered(draw, width, user_name, NAME_Y, self.font_name)
+
+            # 2. 完成日期（底部）
+            self._draw_centered(draw, width, format_certificate_date(completed_time), DATE_Y, self.font_date)
+        return image
+
+    def render(self, user_name: str, completed_time: str) -> bytes:
+        """繪製個人化證書並編碼為 PNG"""
+        image = self.render_image(user_name, completed_time)
+        img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, format='PNG', compress_level=self.compress_level)
+        return img_byte_arr.getvalue()
+
+
+_renderer: Optional[CertificateRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_certificate_renderer() -> CertificateRenderer:
+    """取得共用的證書繪製器（每個行程第一次使用時建立）"""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = CertificateRenderer()
+    return _renderer
+
+
 def generate_certificate(
     user_name: str,
     shape: str,
@@ -45,7 +190,7 @@ def generate_certificate(
     duration_hours: float
 ) -> bytes:
     """
-    生成個人化證書
+    生成個人化證書（使用共用的證書繪製器，可在執行池中呼叫）
     
     Args:
         user_name: 使用者名稱（例如：唐翔千）
@@ -57,84 +202,7 @@ def generate_certificate(
         證書圖片的 bytes
     """
     try:
-        # 開啟模板圖片
-        template = Image.open(CERTIFICATE_TEMPLATE_PATH)
-        draw = ImageDraw.Draw(template)
-        
-        # 載入字型（如果失敗則使用預設字型）
-        try:
-            # 不同大小的字型
-            font_name = ImageFont.truetype(FONT_PATH_BOLD, 120)  # 使用者名稱
-            font_details = ImageFont.truetype(FONT_PATH_REGULAR, 50)  # 詳細資訊
-            font_date = ImageFont.truetype(FONT_PATH_REGULAR, 40)  # 日期
-        except:
-            # 如果載入字型失敗，使用預設字型
-            font_name = ImageFont.load_default()
-            font_details = ImageFont.load_default()
-            font_date = ImageFont.load_default()
-        
-        # 取得圖片尺寸
-        width, height = template.size
-        
-        # 金色文字顏色
-        gold_color = (218, 165, 32)  # 金色
-        
-        # 1. 使用者名稱（中央偏上，大字體）
-        # 位置大約在 650px
-        name_bbox = draw.textbbox((0, 0), user_name, font=font_name)
-        name_width = name_bbox[2] - name_bbox[0]
-        name_x = (width - name_width) // 2
-        name_y = 600
-        draw.text((name_x, name_y), user_name, font=font_name, fill=gold_color)
-        
-        # 2. 完成資訊（名字下方）
-        shape_name = get_shape_name(shape)
-        completion_text = f"於本年度完成台北通台北騎跡挑戰-"
-        completion_text2 = f"YouBike景點巡禮"
-        
-        # 第一行
-        text1_bbox = draw.textbbox((0, 0), completion_text, font=font_details)
-        text1_width = text1_bbox[2] - text1_bbox[0]
-        text1_x = (width - text1_width) // 2
-        text1_y = 800
-        draw.text((text1_x, text1_y), completion_text, font=font_details, fill=gold_color)
-        
-        # 第二行
-        text2_bbox = draw.textbbox((0, 0), completion_text2, font=font_details)
-        text2_width = text2_bbox[2] - text2_bbox[0]
-        text2_x = (width - text2_width) // 2
-        text2_y = 860
-        draw.text((text2_x, text2_y), completion_text2, font=font_details, fill=gold_color)
-        
-        # 3. 獎勵文字
-        reward_text = "特頒此狀，以茲鼓勵"
-        reward_bbox = draw.textbbox((0, 0), reward_text, font=font_details)
-        reward_width = reward_bbox[2] - reward_bbox[0]
-        reward_x = (width - reward_width) // 2
-        reward_y = 950
-        draw.text((reward_x, reward_y), reward_text, font=font_details, fill=gold_color)
-        
-        # 4. 完成日期（底部）
-        # 解析完成時間
-        try:
-            dt = datetime.fromisoformat(completed_time.replace('Z', '+00:00'))
-            date_str = f"西元{dt.year}年{dt.month}月{dt.day}日"
-        except:
-            date_str = "西元2025年11月9日"
-        
-        date_bbox = draw.textbbox((0, 0), date_str, font=font_date)
-        date_width = date_bbox[2] - date_bbox[0]
-        date_x = (width - date_width) // 2
-        date_y = 1070
-        draw.text((date_x, date_y), date_str, font=font_date, fill=gold_color)
-        
-        # 將圖片轉換為 bytes
-        img_byte_arr = io.BytesIO()
-        template.save(img_byte_arr, format='PNG', quality=95)
-        img_byte_arr.seek(0)
-        
-        return img_byte_arr.getvalue()
-        
+        return get_certificate_renderer().render(user_name, completed_time)
     except Exception as e:
         print(f"❌ 生成證書失敗: {e}")
         import traceback
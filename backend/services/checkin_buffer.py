@@ -0,0 +1,246 @@
+"""
+打卡寫入緩衝（write-behind）
+CHECKIN_WRITE_MODE=buffered 時，check_in 驗證通過的打卡先放進行程內的佇列，
+由背景任務累積到一定筆數或等待一段時間後，以一次 insert_many 與一次 bulk_write 寫入；
+佇列有上限，滿了之後請求會等待空間（超過等待時間回傳忙碌），關閉時會把剩下的打卡全部寫入
+
+放入佇列時已回覆使用者打卡成功，因此寫入失敗時不捨棄：執行中持續以有上限的間隔重試
+（期間佇列逐漸填滿，新的打卡由背壓擋下），停止時仍無法寫入的打卡保存到暫存檔，下次啟動時重新寫入；
+每筆打卡放入佇列時就決定 _id，重試與重新寫入不會產生重複的記錄
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId, json_util
+
+import database
+from services.checkin_store import write_checkins
+from services.paths import backend_path
+
+# 打卡寫入方式（direct: 每次打卡直接寫入 / buffered: 先放進佇列再批次寫入）
+CHECKIN_WRITE_MODE = os.getenv("CHECKIN_WRITE_MODE", "direct")
+
+# 佇列上限、每批筆數與最長等待時間（毫秒）
+CHECKIN_BUFFER_SIZE = int(os.getenv("CHECKIN_BUFFER_SIZE", "10000"))
+CHECKIN_FLUSH_BATCH_SIZE = int(os.getenv("CHECKIN_FLUSH_BATCH_SIZE", "500"))
+CHECKIN_FLUSH_INTERVAL_MS = int(os.getenv("CHECKIN_FLUSH_INTERVAL_MS", "200"))
+
+# 佇列已滿時請求等待空間的時間（秒）
+CHECKIN_ENQUEUE_TIMEOUT = float(os.getenv("CHECKIN_ENQUEUE_TIMEOUT", "2"))
+
+# 寫入失敗時重試的最長間隔（秒）
+CHECKIN_FLUSH_BACKOFF_MAX = float(os.getenv("CHECKIN_FLUSH_BACKOFF_MAX", "5"))
+
+# 停止時仍無法寫入的打卡暫存檔（JSON Lines）
+CHECKIN_SPILL_PATH = backend_path("CHECKIN_SPILL_PATH", "cache", "checkin_spill.jsonl")
+
+# 停止時寫入失敗的重試次數（超過後保存到暫存檔）
+CHECKIN_FLUSH_RETRIES = 3
+
+_STOP = object()
+
+
+class CheckinBufferFullError(Exception):
+    """佇列已滿且等待逾時"""
+
+
+class CheckinBufferClosedError(Exception):
+    """寫入緩衝已停止接收"""
+
+
+async def _write_to_database(checkins: List[Dict[str, Any]]):
+    if database.async_database is None:
+        raise RuntimeError("資料庫連線不可用")
+    await write_checkins(database.async_database, checkins)
+
+
+class CheckinWriteBuffer:
+    """打卡寫入緩衝"""
+    def __init__(
+        self,
+        max_size: int = CHECKIN_BUFFER_SIZE,
+        batch_size: int = CHECKIN_FLUSH_BATCH_SIZE,
+        flush_interval: float = CHECKIN_FLUSH_INTERVAL_MS / 1000,
+        enqueue_timeout: float = CHECKIN_ENQUEUE_TIMEOUT,
+        writer: Callable[[List[Dict[str, Any]]], Awaitable[None]] = _write_to_database,
+        retries: int = CHECKIN_FLUSH_RETRIES,
+        backoff_max: float = CHECKIN_FLUSH_BACKOFF_MAX,
+        spill_path: str = CHECKIN_SPILL_PATH
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.writer = writer
+        self.retries = retries
+        self.backoff_max = backoff_max
+        self.spill_path = spill_path
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._accepting = False
+        self._stopping = False
+        # 正在等待放入佇列的打卡數
+        self._pending_puts = 0
+        self._puts_idle: Optional[asyncio.Event] = None
+        self.submitted = 0
+        self.recovered = 0
+        self.written = 0
+        self.batches = 0
+        self.retried = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    def start(self):
+        """啟動背景寫入任務（於 lifespan 呼叫）"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._puts_idle = asyncio.Event()
+        self._puts_idle.set()
+        self._accepting = True
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        print(f"✅ 打卡寫入緩衝已啟動（上限 {self.max_size} 筆，每批 {self.batch_size} 筆 / {self.flush_interval * 1000:.0f} ms）")
+
+    async def stop(self):
+        """停止接收並寫入佇列中剩下的打卡（仍無法寫入的保存到暫存檔）"""
+        if self._task is None:
+            return
+        self._accepting = False
+        self._stopping = True
+        # 等待已在等待空間的打卡放入佇列（或逾時），之後不會再有打卡排在結束標記之後
+        await self._puts_idle.wait()
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        print(f"✅ 打卡寫入緩衝已停止（共寫入 {self.written} 筆，保存到暫存檔 {self.spilled} 筆）")
+
+    async def submit(self, checkin_data: Dict[str, Any]):
+        """
+        放入佇列（佇列已滿時等待空間）
+
+        Raises:
+            CheckinBufferClosedError: 已停止接收
+            CheckinBufferFullError: 等待逾時
+        """
+        if not self._accepting:
+            raise CheckinBufferClosedError()
+        checkin_data.setdefault("_id", ObjectId())
+
+        self._pending_puts += 1
+        self._puts_idle.clear()
+        try:
+            await asyncio.wait_for(self._queue.put(checkin_data), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise CheckinBufferFullError()
+        finally:
+            self._pending_puts -= 1
+            if self._pending_puts == 0:
+                self._puts_idle.set()
+        self.submitted += 1
+
+    async def _run(self):
+        """先寫入上次停止時保存的打卡，再累積到 batch_size 筆或等待 flush_interval 後寫入一批"""
+        await self._recover_spilled()
+
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> bool:
+        """
+        寫入一批打卡，失敗時以指數退避（最長 backoff_max 秒）持續重試；
+        停止中重試 retries 次仍失敗時保存到暫存檔
+
+        Returns:
+            是否已寫入資料庫
+        """
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                await self.writer(batch)
+                break
+            except Exception as e:
+                attempt += 1
+                if self._stopping and attempt > self.retries:
+                    self._spill(batch, e)
+                    return False
+                self.retried += 1
+                print(f"⚠️ 打卡批次寫入失敗（第 {attempt} 次），稍後重試: {e}")
+                await asyncio.sleep(min(self.backoff_max, 0.1 * 2 ** (attempt - 1)))
+        self.written += len(batch)
+        self.batches += 1
+        self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+        return True
+
+    def _spill(self, batch: List[Dict[str, Any]], error: Exception):
+        """將無法寫入的打卡附加到暫存檔（停止時呼叫）"""
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for checkin_data in batch:
+                f.write(json_util.dumps(checkin_data) + "\n")
+        self.spilled += len(batch)
+        print(f"❌ 打卡批次寫入失敗，{len(batch)} 筆已保存到 {self.spill_path}，下次啟動時重新寫入: {error}")
+
+    async def _recover_spilled(self):
+        """寫入上次停止時保存的打卡，全部寫入後刪除暫存檔"""
+        if not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path, encoding="utf-8") as f:
+            checkins = [json_util.loads(line) for line in f if line.strip()]
+        self.recovered += len(checkins)
+        print(f"📥 重新寫入暫存檔中的打卡: {len(checkins)} 筆")
+
+        written = True
+        for i in range(0, len(checkins), self.batch_size):
+            written = await self._flush(checkins[i:i + self.batch_size]) and written
+        # 仍有打卡寫入失敗時已重新附加到暫存檔（_id 相同，已寫入的記錄重新寫入時會略過）
+        if written:
+            os.remove(self.spill_path)
+
+    def stats(self) -> Dict[str, Any]:
+        """佇列狀況與寫入統計"""
+        return {
+            "mode": CHECKIN_WRITE_MODE,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            # 已接收但尚未寫入（包含正在累積、寫入或重試中的批次）
+            "pending": self.submitted + self.recovered - self.written - self.spilled,
+            "max_size": self.max_size,
+            "written": self.written,
+            "batches": self.batches,
+            "retried": self.retried,
+            "spilled": self.spilled,
+            "recovered": self.recovered,
+            "rejected": self.rejected,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+checkin_buffer = CheckinWriteBuffer()
@@ -0,0 +1,240 @@
+"""
+打卡寫入服務
+先寫入打卡記錄，成功後才更新使用者進度（打卡寫入失敗時進度不會前進）；進度以一次 find_one_and_update 完成，
+更新內容使用 aggregation pipeline，在伺服器上判斷是否重複並計算完成數與完成率，
+不需要先讀取再寫回，同時打卡也不會互相覆蓋；
+離線補傳的多筆打卡以一次 insert_many 與一次 bulk_write 寫入，並以冪等鍵保存結果，重送時直接回傳
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import Collections
+
+# 回傳給呼叫端的進度欄位
+PROGRESS_PROJECTION = {"_id": 0, "completed_waypoints": 1, "total_waypoints": 1, "completion_rate": 1}
+
+# 單次批次打卡的筆數上限
+CHECKIN_BATCH_MAX_ITEMS = int(os.getenv("CHECKIN_BATCH_MAX_ITEMS", "500"))
+
+# MongoDB 重複鍵錯誤碼
+_DUPLICATE_KEY = 11000
+
+
+class IdempotencyKeyConflictError(Exception):
+    """同一個冪等鍵已用於內容不同的批次"""
+
+
+def progress_update_pipeline(waypoint_ids: Sequence[str], now: datetime) -> List[Dict[str, Any]]:
+    """
+    加入已打卡路徑點的進度更新（aggregation pipeline）
+
+    已打卡過的路徑點不會重複加入，沒有新增任何路徑點時也不更新 last_updated；
+    completed_waypoints 與 completion_rate 由 checkins 陣列重新計算
+
+    Args:
+        waypoint_ids: 路徑點 ID（不可重複）
+        now: 更新時間
+    """
+    checkins = {"$ifNull": ["$checkins", []]}
+    # pipeline 更新不支援 $addToSet，以 $filter 取出尚未打卡的路徑點附加在最後，保留打卡順序；
+    # $literal 避免以 $ 開頭的 ID 被當成欄位路徑
+    added = {"$filter": {
+        "input": {"$literal": list(waypoint_ids)},
+        "cond": {"$not": [{"$in": ["$$this", checkins]}]}
+    }}
+    return [
+        # 先以原本的 checkins 判斷是否有新增，再更新 checkins
+        {"$set": {"last_updated": {"$cond": [{"$gt": [{"$size": added}, 0]}, now, "$last_updated"]}}},
+        {"$set": {"checkins": {"$concatArrays": [checkins, added]}}},
+        {"$set": {
+            "completed_waypoints": {"$size": "$checkins"},
+            "completion_rate": {"$cond": [
+                {"$gt": ["$total_waypoints", 0]},
+                {"$divide": [{"$size": "$checkins"}, "$total_waypoints"]},
+                0
+            ]},
+        }},
+    ]
+
+
+async def update_progress(db, user_id: str, shape: str, waypoint_id: str,
+                          now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    更新使用者進度（一次往返）
+
+    Returns:
+        更新後的進度（completed_waypoints, total_waypoints, completion_rate），沒有進度記錄時為 None
+    """
+    return await db[Collections.USER_PROGRESS].find_one_and_update(
+        {"userId": user_id, "shape": shape},
+        progress_update_pipeline([waypoint_id], now or datetime.now()),
+        projection=PROGRESS_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def record_checkin(db, checkin_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    保存打卡記錄，成功後再更新使用者進度
+
+    Args:
+        db: MongoDB 資料庫
+        checkin_data: 打卡記錄（包含 userId, waypointId, shape, timestamp）
+
+    Returns:
+        更新後的進度，沒有進度記錄時為 None
+    """
+    await db[Collections.CHECKINS].insert_one(checkin_data)
+    return await update_progress(
+        db, checkin_data["userId"], checkin_data["shape"], checkin_data["waypointId"],
+        checkin_data["timestamp"]
+    )
+
+
+def checkin_dedupe_key(checkin_data: Dict[str, Any]) -> Tuple[str, str, str]:
+    """同一使用者、圖形與路徑點的打卡視為重複"""
+    return checkin_data["userId"], checkin_data["shape"], checkin_data["waypointId"]
+
+
+def checkin_batch_key(items: Sequence[Dict[str, Any]]) -> str:
+    """
+    批次內容（使用者、圖形、路徑點與打卡時間）的雜湊
+
+    作為未提供冪等鍵時的冪等鍵，也和結果一起保存，用來確認重送的是同一批打卡
+    """
+    raw = json.dumps([
+        [item["userId"], item["shape"], item["waypointId"], item.get("timestamp")]
+        for item in items
+    ], default=str, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def dedupe_checkins(checkins: Sequence[Dict[str, Any]]) -> Dict[int, int]:
+    """
+    找出批次內重複的打卡
+
+    Returns:
+        {重複的索引: 第一次出現的索引}
+    """
+    first_seen: Dict[Tuple[str, str, str], int] = {}
+    duplicates = {}
+    for index, checkin_data in enumerate(checkins):
+        key = checkin_dedupe_key(checkin_data)
+        if key in first_seen:
+            duplicates[index] = first_seen[key]
+        else:
+            first_seen[key] = index
+    return duplicates
+
+
+async def _insert_checkins(db, documents: List[Dict[str, Any]]):
+    """寫入打卡記錄；重送時已寫入的記錄（_id 相同）略過"""
+    try:
+        await db[Collections.CHECKINS].insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != _DUPLICATE_KEY for error in errors):
+            raise
+
+
+async def _update_progress_batch(db, checkins: List[Dict[str, Any]], now: datetime):
+    """每個 (使用者, 圖形) 一個更新，以一次 bulk_write 送出"""
+    waypoints: Dict[Tuple[str, str], Dict[str, None]] = {}
+    for checkin_data in checkins:
+        # 以 dict 去除重複並保留打卡順序
+        waypoints.setdefault((checkin_data["userId"], checkin_data["shape"]), {})[checkin_data["waypointId"]] = None
+
+    requests = [
+        UpdateOne({"userId": user_id, "shape": shape}, progress_update_pipeline(list(waypoint_ids), now))
+        for (user_id, shape), waypoint_ids in waypoints.items()
+    ]
+    await db[Collections.USER_PROGRESS].bulk_write(requests, ordered=False)
+
+
+async def write_checkins(db, checkins: List[Dict[str, Any]], now: Optional[datetime] = None):
+    """
+    以一次 insert_many 保存多筆打卡記錄，成功後再以一次 bulk_write 更新進度
+    （失敗時可整批重送：已寫入的記錄略過，進度更新本身即可重複執行）
+
+    Args:
+        db: MongoDB 資料庫
+        checkins: 打卡記錄（可包含重複的路徑點，進度只計算一次）
+        now: 進度的更新時間
+    """
+    if not checkins:
+        return
+    await _insert_checkins(db, checkins)
+    await _update_progress_batch(db, checkins, now or datetime.now())
+
+
+def checkin_batch_id(idempotency_key: str, checkins: Sequence[Dict[str, Any]]) -> str:
+    """保存結果用的 ID：冪等鍵加上批次內的使用者，不同使用者使用相同的冪等鍵不會互相影響"""
+    user_ids = sorted({checkin_data["userId"] for checkin_data in checkins})
+    return f"{','.join(user_ids)}:{idempotency_key}"
+
+
+async def record_checkin_batch(db, idempotency_key: str, checkins: List[Dict[str, Any]],
+                               fingerprint: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    保存多筆打卡記錄並更新使用者進度
+
+    批次內重複的打卡只寫入第一筆；打卡記錄的 _id 由批次 ID 與索引組成，
+    寫到一半失敗後以同一個冪等鍵重送也不會重複寫入（進度更新本身即可重複執行）
+
+    Args:
+        db: MongoDB 資料庫
+        idempotency_key: 冪等鍵
+        checkins: 打卡記錄（包含 userId, waypointId, shape, timestamp）
+        fingerprint: 請求內容的 checkin_batch_key（打卡時間使用 App 送出的值）
+
+    Returns:
+        (結果, 是否為先前保存的結果)
+
+    Raises:
+        IdempotencyKeyConflictError: 冪等鍵已用於內容不同的批次
+    """
+    batch_id = checkin_batch_id(idempotency_key, checkins)
+    saved = await db[Collections.CHECKIN_BATCHES].find_one({"_id": batch_id})
+    if saved is not None:
+        if saved.get("fingerprint") != fingerprint:
+            raise IdempotencyKeyConflictError(f"冪等鍵 {idempotency_key} 已用於內容不同的批次")
+        return saved["result"], True
+
+    duplicates = dedupe_checkins(checkins)
+    documents = [
+        {**checkin_data, "_id": f"{batch_id}:{index}"}
+        for index, checkin_data in enumerate(checkins)
+        if index not in duplicates
+    ]
+
+    now = datetime.now()
+    await write_checkins(db, documents, now)
+
+    results = []
+    for index, checkin_data in enumerate(checkins):
+        results.append({
+            "index": index,
+            "waypointId": checkin_data["waypointId"],
+            "shape": checkin_data["shape"],
+            "status": "duplicate" if index in duplicates else "recorded",
+            "duplicateOf": duplicates.get(index),
+            "verified": checkin_data["verified"],
+            "distance": checkin_data["distance"],
+            "timestamp": checkin_data["timestamp"].isoformat(),
+        })
+    result = {"recorded": len(documents), "duplicates": len(duplicates), "results": results}
+
+    try:
+        await db[Collections.CHECKIN_BATCHES].insert_one({
+            "_id": batch_id, "fingerprint": fingerprint, "result": result, "created_at": now
+        })
+    except DuplicateKeyError:
+        # 同一批次同時重送，已由另一個請求保存
+        pass
+    return result, False
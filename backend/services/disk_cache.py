@@ -0,0 +1,128 @@
+"""
+磁碟 LRU 快取
+以檔案保存內容（檔名為鍵），限制總容量，超過時刪除最久未使用的檔案；
+使用順序記錄在記憶體中，並以檔案的修改時間保存，重新啟動後沿用
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class DiskLRUCache:
+    """磁碟 LRU 快取（執行緒安全，讀寫為阻塞操作，請在執行池呼叫）"""
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # 鍵 -> 檔案大小
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _load(self):
+        """第一次使用時掃描目錄，依修改時間恢復使用順序"""
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.suffix) and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                key = entry.name[:len(entry.name) - len(self.suffix)] if self.suffix else entry.name
+                files.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        """讀取內容，不存在時回傳 None"""
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                now = time.time()
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return data
+
+    def touch(self, key: str) -> bool:
+        """更新使用順序但不讀取內容（例如回傳 304 時），不存在時回傳 False"""
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return False
+            try:
+                now = time.time()
+                os.utime(self._path(key), (now, now))
+            except FileNotFoundError:
+                self._total_bytes -= self._entries.pop(key)
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def put(self, key: str, data: bytes):
+        """寫入內容（先寫暫存檔再改名），超過容量時淘汰最久未使用的檔案"""
+        with self._lock:
+            self._load()
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._load()
+            return key in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        """命中統計"""
+        total = self.hits + self.misses
+        return {
+            "files": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
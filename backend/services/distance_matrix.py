@@ -0,0 +1,141 @@
+"""
+道路距離矩陣服務
+一次計算多個站點之間的實際騎行距離與時間（本地道路圖或相容 OSRM table 的後端），
+讓路線生成的可達性篩選可以使用實際騎行時間，而不是直線距離估算
+
+結果依站點組成（快照的 station_fingerprint）快取：站點沒有變動時，
+即使可借車數更新產生新快照也沿用同一份矩陣
+"""
+import asyncio
+import os
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.executor import job_executor
+from services.geodesic import haversine_one_to_many
+from services.lru_cache import TTLLRUCache
+from services.routing_backend import LocalBackend, OSRMBackend, get_routing_backend
+from services.routing_client import CircuitOpenError, get_routing_client
+from services.youbike_store import YouBikeSnapshot
+
+# 可達性篩選方式：haversine（直線距離估算）/ road（道路距離矩陣）
+REACHABILITY_MODE = os.getenv("REACHABILITY_MODE", "haversine")
+# OSRM table 單次請求的座標數上限（公用伺服器通常限制為 100）
+OSRM_TABLE_MAX_COORDS = int(os.getenv("OSRM_TABLE_MAX_COORDS", "100"))
+DISTANCE_MATRIX_CACHE_SIZE = int(os.getenv("DISTANCE_MATRIX_CACHE_SIZE", "1024"))
+
+distance_matrix_cache = TTLLRUCache(DISTANCE_MATRIX_CACHE_SIZE)
+
+Points = Sequence[Tuple[float, float]]
+
+
+async def _osrm_table(sources: Points, destinations: Points) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """將矩陣切成多個不超過座標上限的 OSRM table 請求並同時送出"""
+    client = get_routing_client()
+    source_chunk = min(len(sources), max(1, OSRM_TABLE_MAX_COORDS // 4))
+    destination_chunk = max(1, OSRM_TABLE_MAX_COORDS - source_chunk)
+
+    blocks = [
+        (i, j)
+        for i in range(0, len(sources), source_chunk)
+        for j in range(0, len(destinations), destination_chunk)
+    ]
+    try:
+        responses = await asyncio.gather(*(
+            client.table(sources[i:i + source_chunk], destinations[j:j + destination_chunk])
+            for i, j in blocks
+        ))
+    except CircuitOpenError as e:
+        print(f"⚠️ {e}")
+        return None
+    if any(response is None for response in responses):
+        return None
+
+    distance_km = np.full((len(sources), len(destinations)), np.nan)
+    duration_min = np.full((len(sources), len(destinations)), np.nan)
+    for (i, j), response in zip(blocks, responses):
+        distances = np.array(response['distances'], dtype=np.float64)  # None 轉為 NaN
+        block = (slice(i, i + distances.shape[0]), slice(j, j + distances.shape[1]))
+        distance_km[block] = distances / 1000
+        if response.get('durations') is not None:
+            duration_min[block] = np.array(response['durations'], dtype=np.float64) / 60
+    return distance_km, duration_min
+
+
+async def compute_distance_matrix(sources: Points, destinations: Points,
+                                  max_distance_km: float = np.inf) -> Optional[Dict[str, np.ndarray]]:
+    """
+    使用目前的路線規劃後端計算道路距離矩陣
+
+    Args:
+        sources: 起點座標 [(lat, lon), ...]
+        destinations: 終點座標 [(lat, lon), ...]
+        max_distance_km: 搜尋距離上限（本地道路圖使用，OSRM 忽略）
+
+    Returns:
+        {'distance': 公里矩陣, 'duration': 分鐘矩陣}，形狀為 (起點數, 終點數)，
+        無法到達為 NaN；後端失敗時回傳 None
+    """
+    backend = get_routing_backend()
+    if isinstance(backend, LocalBackend):
+        distance_km, duration_min = await job_executor.run_io(
+            backend.router.table, sources, destinations, max_distance_km * 1000
+        )
+    elif isinstance(backend, OSRMBackend):
+        result = await _osrm_table(list(sources), list(destinations))
+        if result is None:
+            return None
+        distance_km, duration_min = result
+    else:
+        return None
+    return {'distance': distance_km, 'duration': duration_min}
+
+
+async def get_station_ride_times(start_station: pd.Series, snapshot: YouBikeSnapshot,
+                                 max_time_min: float, speed_kmh: float) -> Optional[pd.Series]:
+    """
+    起始站點到各站點的實際騎行時間（REACHABILITY_MODE=road 時使用）
+
+    騎行時間以道路距離與 speed_kmh 換算，與直線估算使用相同的速度；道路距離不會小於直線距離，
+    因此只需計算直線距離已在範圍內的站點
+
+    Returns:
+        以站號為索引的騎行時間（分鐘），只包含可到達的站點；
+        使用直線估算或道路距離計算失敗時回傳 None（呼叫端改用直線估算）
+    """
+    if REACHABILITY_MODE != "road":
+        return None
+
+    backend_name = get_routing_backend().name
+    max_distance_km = max_time_min / 60 * speed_kmh
+    key = (backend_name, snapshot.station_fingerprint, str(start_station['sno']), round(max_distance_km, 3))
+    cached = distance_matrix_cache.get(key)
+    if cached is not None:
+        return cached
+
+    df = snapshot.df
+    straight_km = haversine_one_to_many(
+        start_station['latitude'], start_station['longitude'],
+        df['latitude'].values, df['longitude'].values
+    )
+    nearby = df[straight_km <= max_distance_km]
+    destinations = list(zip(nearby['latitude'].tolist(), nearby['longitude'].tolist()))
+
+    matrix = await compute_distance_matrix(
+        [(start_station['latitude'], start_station['longitude'])], destinations, max_distance_km
+    )
+    if matrix is None:
+        print("⚠️ 道路距離矩陣計算失敗，改用直線距離估算")
+        return None
+
+    ride_times = pd.Series(
+        matrix['distance'][0] / speed_kmh * 60, index=nearby['sno'].astype(str).values
+    )
+    ride_times[str(start_station['sno'])] = 0.0
+    ride_times = ride_times[ride_times.notna()]
+    print(f"   🛣️  道路可達站點: {len(ride_times)}/{len(nearby)}")
+
+    distance_matrix_cache.put(key, ride_times)
+    return ride_times
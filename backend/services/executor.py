@@ -0,0 +1,150 @@
+"""
+背景執行池服務
+阻塞的 I/O（外部 HTTP）交給執行緒池，CPU 密集的路線生成與圖片繪製交給行程池，
+並限制同時進行與排隊中的工作數，避免大量路線請求拖垮其他 API
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.youbike_store import init_snapshot_worker, snapshot_directory
+
+# 執行池設定
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 2)))
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "process")  # process / thread
+
+# 同時執行的工作上限與排隊上限（超過排隊上限直接拒絕）
+MAX_INFLIGHT_IO_JOBS = int(os.getenv("MAX_INFLIGHT_IO_JOBS", str(IO_WORKERS)))
+MAX_INFLIGHT_CPU_JOBS = int(os.getenv("MAX_INFLIGHT_CPU_JOBS", str(CPU_WORKERS)))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "32"))
+
+
+class ExecutorBusyError(Exception):
+    """排隊的工作已達上限"""
+
+
+class _JobLane:
+    """單一種類工作的併發控制與統計"""
+    def __init__(self, name: str, max_inflight: int, max_queued: int):
+        self.name = name
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.semaphore = asyncio.Semaphore(max_inflight)
+        self.inflight = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "max_inflight": self.max_inflight,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+class JobExecutor:
+    """I/O 與 CPU 工作的執行池"""
+    def __init__(
+        self,
+        io_workers: int = IO_WORKERS,
+        cpu_workers: int = CPU_WORKERS,
+        cpu_executor: str = CPU_EXECUTOR,
+        max_inflight_io: int = MAX_INFLIGHT_IO_JOBS,
+        max_inflight_cpu: int = MAX_INFLIGHT_CPU_JOBS,
+        max_queued: int = MAX_QUEUED_JOBS,
+        cpu_initializer: Optional[Callable] = None,
+        cpu_initargs: Tuple = ()
+    ):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.cpu_executor = cpu_executor
+        # 行程池每個工作行程啟動時執行一次（例如載入共用資料）
+        self.cpu_initializer = cpu_initializer
+        self.cpu_initargs = cpu_initargs
+        self._io_pool: Optional[Executor] = None
+        self._cpu_pool: Optional[Executor] = None
+        self._io_lane = _JobLane("io", max_inflight_io, max_queued)
+        self._cpu_lane = _JobLane("cpu", max_inflight_cpu, max_queued)
+
+    def start(self):
+        """建立執行池（於 lifespan 呼叫）"""
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="io")
+        if self._cpu_pool is None:
+            if self.cpu_executor == "process":
+                # 使用 spawn，避免在已有執行緒的行程中 fork
+                self._cpu_pool = ProcessPoolExecutor(
+                    max_workers=self.cpu_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.cpu_initializer,
+                    initargs=self.cpu_initargs
+                )
+            else:
+                self._cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="cpu")
+        print(f"✅ 執行池已啟動（I/O: {self.io_workers} 執行緒, CPU: {self.cpu_workers} {self.cpu_executor}）")
+
+    async def shutdown(self):
+        """關閉執行池（取消排隊中的工作，在背景執行緒等待執行中的工作結束，不阻塞事件迴圈）"""
+        pools = [pool for pool in (self._io_pool, self._cpu_pool) if pool is not None]
+        self._io_pool = None
+        self._cpu_pool = None
+        for pool in pools:
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+    async def run_io(self, func: Callable, *args, **kwargs) -> Any:
+        """在執行緒池執行阻塞 I/O"""
+        if self._io_pool is None:
+            self.start()
+        return await self._run(self._io_lane, self._io_pool, func, *args, **kwargs)
+
+    async def run_cpu(self, func: Callable, *args, **kwargs) -> Any:
+        """在 CPU 執行池執行計算（行程池時 func 與參數需可 pickle）"""
+        if self._cpu_pool is None:
+            self.start()
+        return await self._run(self._cpu_lane, self._cpu_pool, func, *args, **kwargs)
+
+    async def _run(self, lane: _JobLane, pool: Executor, func: Callable, *args, **kwargs) -> Any:
+        if lane.queued >= lane.max_queued:
+            lane.rejected += 1
+            raise ExecutorBusyError(f"{lane.name} 工作排隊已滿 ({lane.queued})")
+
+        lane.queued += 1
+        try:
+            await lane.semaphore.acquire()
+        finally:
+            lane.queued -= 1
+
+        lane.inflight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(pool, partial(func, *args, **kwargs))
+            lane.completed += 1
+            return result
+        except Exception:
+            lane.failed += 1
+            raise
+        finally:
+            lane.inflight -= 1
+            lane.semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """目前的執行與排隊狀況"""
+        return {
+            "cpu_executor": self.cpu_executor,
+            "io": self._io_lane.stats(),
+            "cpu": self._cpu_lane.stats(),
+        }
+
+
+# 共用的執行池（工作行程啟動時載入 YouBike 快照，路線生成只傳送版本號）
+job_executor = JobExecutor(cpu_initializer=init_snapshot_worker, cpu_initargs=(snapshot_directory(),))
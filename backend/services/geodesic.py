@@ -0,0 +1,67 @@
+"""
+向量化地理距離計算（NumPy）
+與 tsp_taipei_route_new.haversine_distance 使用相同公式，但一次處理整個陣列
+"""
+import numpy as np
+
+# 地球半徑（公里）
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_pairwise(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """
+    逐對計算距離（第一組第 i 點到第二組第 i 點）
+
+    輸入依 NumPy 規則廣播，其他函式都以調整形狀後的陣列呼叫這個函式
+
+    Args:
+        lats1, lons1: 第一組座標陣列
+        lats2, lons2: 第二組座標陣列（長度與第一組相同，或可廣播）
+
+    Returns:
+        距離陣列（公里）
+    """
+    lats1 = np.asarray(lats1, dtype=np.float64)
+    lons1 = np.asarray(lons1, dtype=np.float64)
+    lats2 = np.asarray(lats2, dtype=np.float64)
+    lons2 = np.asarray(lons2, dtype=np.float64)
+    lat1_rad = np.radians(lats1)
+    lat2_rad = np.radians(lats2)
+    delta_lat = np.radians(lats2 - lats1)
+    delta_lon = np.radians(lons2 - lons1)
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(delta_lon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_one_to_many(lat, lon, lats, lons) -> np.ndarray:
+    """
+    計算單一點到多個點的距離
+
+    Args:
+        lat, lon: 起點座標
+        lats, lons: 目標點座標陣列
+
+    Returns:
+        距離陣列（公里）
+    """
+    return haversine_pairwise(lat, lon, lats, lons)
+
+
+def haversine_many_to_many(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """
+    計算兩組點之間的距離矩陣
+
+    Args:
+        lats1, lons1: 第一組座標陣列（n 個點）
+        lats2, lons2: 第二組座標陣列（m 個點）
+
+    Returns:
+        距離矩陣 (n, m)（公里），[i, j] 為第一組第 i 點到第二組第 j 點的距離
+    """
+    return haversine_pairwise(
+        np.asarray(lats1, dtype=np.float64)[:, np.newaxis],
+        np.asarray(lons1, dtype=np.float64)[:, np.newaxis],
+        np.asarray(lats2, dtype=np.float64)[np.newaxis, :],
+        np.asarray(lons2, dtype=np.float64)[np.newaxis, :]
+    )
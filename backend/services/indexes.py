@@ -0,0 +1,84 @@
+"""
+MongoDB 索引管理
+宣告各集合常用查詢需要的索引，啟動時（lifespan）只建立尚未存在的索引；
+同名但定義不同的索引不會自動刪除，只顯示警告
+"""
+import os
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from database import Collections
+
+# 啟動時是否建立索引
+MONGODB_ENSURE_INDEXES = os.getenv("MONGODB_ENSURE_INDEXES", "true").lower() == "true"
+
+# 批次打卡結果的保存天數
+CHECKIN_BATCH_TTL_DAYS = int(os.getenv("CHECKIN_BATCH_TTL_DAYS", "7"))
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    Collections.ROUTE_SESSIONS: [
+        # 每位使用者每個圖形只有一個會話：start_route、complete_route、get_route_detail、get_certificate
+        IndexModel([("userId", ASCENDING), ("shape", ASCENDING)], name="userId_shape", unique=True),
+    ],
+    Collections.USER_PROGRESS: [
+        # 打卡的進度更新與進度查詢
+        IndexModel([("userId", ASCENDING), ("shape", ASCENDING)], name="userId_shape", unique=True),
+    ],
+    Collections.CHECKINS: [
+        # 進度查詢的打卡分頁（指定圖形與不指定圖形）與打卡總數
+        IndexModel([("userId", ASCENDING), ("shape", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+                   name="userId_shape_timestamp"),
+        IndexModel([("userId", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+                   name="userId_timestamp"),
+    ],
+    Collections.CHECKIN_BATCHES: [
+        # 以 _id（冪等鍵）查詢，保存期限過後自動刪除
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                   expireAfterSeconds=CHECKIN_BATCH_TTL_DAYS * 86400),
+    ],
+}
+
+
+def _same_definition(existing: Dict[str, Any], model: IndexModel) -> bool:
+    """既有索引與宣告的鍵與選項是否相同"""
+    document = model.document
+    if list(existing["key"].items()) != list(document["key"].items()):
+        return False
+    return all(existing.get(option) == document.get(option)
+               for option in ("unique", "expireAfterSeconds", "sparse", "partialFilterExpression"))
+
+
+async def ensure_indexes(db, indexes: Dict[str, List[IndexModel]] = INDEXES) -> Dict[str, List[str]]:
+    """
+    建立尚未存在的索引（可重複執行）
+
+    單一索引建立失敗（例如既有資料違反唯一性）時顯示警告並繼續建立其他索引
+
+    Returns:
+        {集合: [新建立的索引名稱]}
+    """
+    created: Dict[str, List[str]] = {}
+    for collection_name, models in indexes.items():
+        collection = db[collection_name]
+        existing = {index["name"]: index async for index in collection.list_indexes()}
+
+        for model in models:
+            name = model.document["name"]
+            if name in existing:
+                if not _same_definition(existing[name], model):
+                    print(f"⚠️ 索引 {collection_name}.{name} 的定義與宣告不同，請手動重建")
+                continue
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                print(f"⚠️ 建立索引 {collection_name}.{name} 失敗: {e}")
+                continue
+            created.setdefault(collection_name, []).append(name)
+
+    if created:
+        print(f"✅ 已建立索引: {', '.join(f'{c}.{n}' for c, names in created.items() for n in names)}")
+    else:
+        print(f"✅ 索引已是最新狀態")
+    return created
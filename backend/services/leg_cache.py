@@ -0,0 +1,106 @@
+"""
+路段快取
+路線由一連串 YouBike 站點組成，相鄰站點的路段在不同使用者與圖形間大量重複，
+因此以 (路線後端, 起站站號, 迄站站號) 為鍵保存每一段的幾何、距離與時間，並存到本機 SQLite
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from services.lru_cache import TTLLRUCache
+from services.paths import backend_path
+
+# 快取檔案位置與記憶體內快取容量
+LEG_CACHE_PATH = backend_path("LEG_CACHE_PATH", "cache", "route_legs.sqlite3")
+LEG_MEMORY_CACHE_SIZE = int(os.getenv("LEG_MEMORY_CACHE_SIZE", "20000"))
+
+LegKey = Tuple[str, str, str]
+
+
+class LegCache:
+    """路段快取（記憶體 LRU + SQLite 持久化，執行緒安全）"""
+    def __init__(self, path: str = LEG_CACHE_PATH, memory_size: int = LEG_MEMORY_CACHE_SIZE):
+        self.path = path
+        self._memory = TTLLRUCache(memory_size)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS route_legs (
+                    backend TEXT NOT NULL,
+                    from_sno TEXT NOT NULL,
+                    to_sno TEXT NOT NULL,
+                    coords TEXT NOT NULL,
+                    distance REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (backend, from_sno, to_sno)
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: LegKey) -> Optional[Dict]:
+        """取得路段 {coords, distance, duration}，沒有時回傳 None"""
+        leg = self._memory.get(key)
+        if leg is not None:
+            return leg
+
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT coords, distance, duration FROM route_legs WHERE backend = ? AND from_sno = ? AND to_sno = ?",
+                key
+            ).fetchone()
+        if row is None:
+            return None
+
+        leg = {
+            'coords': [tuple(coord) for coord in json.loads(row[0])],
+            'distance': row[1],
+            'duration': row[2]
+        }
+        self._memory.put(key, leg)
+        return leg
+
+    def get_many(self, keys: Iterable[LegKey]) -> Dict[LegKey, Optional[Dict]]:
+        """批次取得路段"""
+        return {key: self.get(key) for key in keys}
+
+    def put(self, key: LegKey, leg: Dict):
+        """保存路段"""
+        leg = {
+            'coords': [tuple(coord) for coord in leg['coords']],
+            'distance': leg['distance'],
+            'duration': leg['duration']
+        }
+        self._memory.put(key, leg)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO route_legs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, json.dumps(leg['coords']), leg['distance'], leg['duration'], time.time())
+            )
+            conn.commit()
+
+    def stats(self) -> Dict:
+        """記憶體快取命中統計"""
+        return self._memory.stats()
+
+    def close(self):
+        """關閉資料庫連線"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 共用的路段快取
+leg_cache = LegCache()
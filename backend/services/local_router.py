@@ -0,0 +1,298 @@
+"""
+本地自行車路徑規劃
+從台北市的 OSM / GeoJSON 道路資料建立精簡的道路圖（CSR 陣列），以 A* 計算多點騎行路線，
+不需依賴外部 OSRM 伺服器
+
+道路資料可用 osmtogeojson 等工具將 OSM 匯出檔轉成 GeoJSON（LineString / MultiLineString），
+轉換成 .npz 後啟動較快：python -m services.local_router taipei_roads.geojson taipei_roads.npz
+"""
+import heapq
+import json
+import math
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from services.geodesic import haversine_pairwise
+from services.spatial_index import GeoPointIndex
+
+# 自行車不可通行的道路類型
+EXCLUDED_HIGHWAYS = {'motorway', 'motorway_link', 'trunk', 'trunk_link', 'construction', 'proposed'}
+
+# 預設騎行速度（km/h），與 RouteConfig.cycling_speed 相同
+DEFAULT_CYCLING_SPEED = 12
+
+
+def _is_oneway(properties: Dict) -> bool:
+    """判斷道路是否為單行道（自行車可雙向時視為雙向）"""
+    if str(properties.get('oneway:bicycle', '')).lower() == 'no':
+        return False
+    return str(properties.get('oneway', '')).lower() in ('yes', '1', 'true')
+
+
+class LocalGraphRouter:
+    """以 CSR 陣列保存的道路圖與 A* 路徑規劃"""
+    def __init__(self, node_lat: np.ndarray, node_lon: np.ndarray,
+                 indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray,
+                 speed_kmh: float = DEFAULT_CYCLING_SPEED):
+        self.node_lat = np.ascontiguousarray(node_lat, dtype=np.float64)
+        self.node_lon = np.ascontiguousarray(node_lon, dtype=np.float64)
+        self.indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+        self.indices = np.ascontiguousarray(indices, dtype=np.int64)
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)  # 公尺
+        self.speed_kmh = speed_kmh
+
+        # A* 內層迴圈使用 Python list 比逐一讀取 numpy 元素快
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._weights = self.weights.tolist()
+        self._lat_rad = np.radians(self.node_lat).tolist()
+        self._lon_rad = np.radians(self.node_lon).tolist()
+
+        self._node_index = GeoPointIndex(self.node_lat, self.node_lon)
+        self._graph: Optional[csr_matrix] = None
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_lat)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    # ---------------------------------------------------------------
+    # 建立道路圖
+    # ---------------------------------------------------------------
+    @classmethod
+    def from_geojson(cls, path: str, **kwargs) -> "LocalGraphRouter":
+        """從 GeoJSON 道路資料建立道路圖"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        node_ids: Dict[Tuple[float, float], int] = {}
+        lats: List[float] = []
+        lons: List[float] = []
+        sources: List[int] = []
+        targets: List[int] = []
+
+        def node_id(lon: float, lat: float) -> int:
+            key = (round(lat, 7), round(lon, 7))
+            nid = node_ids.get(key)
+            if nid is None:
+                nid = len(lats)
+                node_ids[key] = nid
+                lats.append(key[0])
+                lons.append(key[1])
+            return nid
+
+        for feature in data.get('features', []):
+            geometry = feature.get('geometry') or {}
+            properties = feature.get('properties') or {}
+            if properties.get('highway') in EXCLUDED_HIGHWAYS:
+                continue
+
+            if geometry.get('type') == 'LineString':
+                lines = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiLineString':
+                lines = geometry['coordinates']
+            else:
+                continue
+
+            oneway = _is_oneway(properties)
+            for line in lines:
+                ids = [node_id(coord[0], coord[1]) for coord in line]
+                for a, b in zip(ids, ids[1:]):
+                    if a == b:
+                        continue
+                    sources.append(a)
+                    targets.append(b)
+                    if not oneway:
+                        sources.append(b)
+                        targets.append(a)
+
+        return cls.from_edges(np.array(lats), np.array(lons), np.array(sources), np.array(targets), **kwargs)
+
+    @classmethod
+    def from_edges(cls, node_lat, node_lon, sources, targets, **kwargs) -> "LocalGraphRouter":
+        """從邊列表建立 CSR 道路圖（邊長以 haversine 計算）"""
+        node_lat = np.asarray(node_lat, dtype=np.float64)
+        node_lon = np.asarray(node_lon, dtype=np.float64)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+
+        weights = haversine_pairwise(
+            node_lat[sources], node_lon[sources], node_lat[targets], node_lon[targets]
+        ) * 1000
+
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(len(node_lat) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_lat)), out=indptr[1:])
+        return cls(node_lat, node_lon, indptr, targets[order], weights[order], **kwargs)
+
+    @classmethod
+    def from_npz(cls, path: str, **kwargs) -> "LocalGraphRouter":
+        """讀取 save_npz 儲存的道路圖"""
+        data = np.load(path)
+        return cls(data['node_lat'], data['node_lon'], data['indptr'], data['indices'], data['weights'], **kwargs)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "LocalGraphRouter":
+        """依副檔名讀取 .npz 或 GeoJSON 道路圖"""
+        if path.endswith('.npz'):
+            return cls.from_npz(path, **kwargs)
+        return cls.from_geojson(path, **kwargs)
+
+    def save_npz(self, path: str):
+        """儲存道路圖"""
+        np.savez_compressed(
+            path,
+            node_lat=self.node_lat, node_lon=self.node_lon,
+            indptr=self.indptr, indices=self.indices, weights=self.weights
+        )
+
+    # ---------------------------------------------------------------
+    # 路徑規劃
+    # ---------------------------------------------------------------
+    def nearest_node(self, lat: float, lon: float) -> Optional[int]:
+        """找最近的道路節點"""
+        result = self._node_index.query_nearest(lat, lon)
+        return None if result is None else result[0]
+
+    def _heuristic(self, node: int, target_lat: float, target_lon: float, cos_target: float) -> float:
+        """到終點的 haversine 直線距離（公尺），不會高估實際路線長度"""
+        lat = self._lat_rad[node]
+        delta_lat = target_lat - lat
+        delta_lon = target_lon - self._lon_rad[node]
+        a = math.sin(delta_lat / 2) ** 2 + math.cos(lat) * cos_target * math.sin(delta_lon / 2) ** 2
+        return 2 * 6371000 * math.asin(min(1.0, math.sqrt(a)))
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[List[int], float]]:
+        """
+        A* 最短路徑
+
+        Returns:
+            (節點列表, 距離[公尺])；無法到達時回傳 None
+        """
+        if source == target:
+            return [source], 0.0
+
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        target_lat = self._lat_rad[target]
+        target_lon = self._lon_rad[target]
+        cos_target = math.cos(target_lat)
+
+        best = {source: 0.0}
+        previous = {source: -1}
+        heap = [(self._heuristic(source, target_lat, target_lon, cos_target), 0.0, source)]
+        closed = set()
+
+        while heap:
+            _, dist, node = heapq.heappop(heap)
+            if node == target:
+                path = []
+                while node != -1:
+                    path.append(node)
+                    node = previous[node]
+                return path[::-1], dist
+            if node in closed:
+                continue
+            closed.add(node)
+
+            for e in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[e]
+                new_dist = dist + weights[e]
+                if new_dist < best.get(neighbor, math.inf):
+                    best[neighbor] = new_dist
+                    previous[neighbor] = node
+                    priority = new_dist + self._heuristic(neighbor, target_lat, target_lon, cos_target)
+                    heapq.heappush(heap, (priority, new_dist, neighbor))
+
+        return None
+
+    def _sparse_graph(self) -> csr_matrix:
+        """供 scipy 使用的鄰接矩陣（重複的邊只保留最短的一條）"""
+        if self._graph is None:
+            n = self.num_nodes
+            rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+            order = np.lexsort((self.weights, self.indices, rows))
+            rows, cols, weights = rows[order], self.indices[order], self.weights[order]
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            self._graph = csr_matrix(
+                (np.maximum(weights[first], 1e-6), (rows[first], cols[first])), shape=(n, n)
+            )
+        return self._graph
+
+    def table(self, sources: Sequence[Tuple[float, float]], destinations: Sequence[Tuple[float, float]],
+              max_distance_m: float = np.inf) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        多對多騎行距離矩陣（每個起點一次 Dijkstra）
+
+        Args:
+            sources: 起點座標 [(lat, lon), ...]
+            destinations: 終點座標 [(lat, lon), ...]
+            max_distance_m: 搜尋距離上限（公尺），超過的終點視為無法到達
+
+        Returns:
+            (距離矩陣[公里], 時間矩陣[分鐘])，形狀為 (起點數, 終點數)，無法到達為 NaN
+        """
+        shape = (len(sources), len(destinations))
+        if self.num_nodes == 0 or 0 in shape:
+            return np.full(shape, np.nan), np.full(shape, np.nan)
+
+        source_nodes = [self.nearest_node(lat, lon) for lat, lon in sources]
+        destination_nodes = np.array([self.nearest_node(lat, lon) for lat, lon in destinations], dtype=np.int64)
+
+        unique_sources, inverse = np.unique(source_nodes, return_inverse=True)
+        distances_m = dijkstra(self._sparse_graph(), directed=True, indices=unique_sources, limit=max_distance_m)
+        distances_m = distances_m[inverse][:, destination_nodes]
+
+        distance_km = np.where(np.isfinite(distances_m), distances_m / 1000, np.nan)
+        return distance_km, distance_km / self.speed_kmh * 60
+
+    def route(self, points: Sequence[Tuple[float, float]]) -> Dict:
+        """
+        計算多點騎行路線
+
+        Args:
+            points: 依序經過的座標 [(lat, lon), ...]
+
+        Returns:
+            {coords: [(lat, lon), ...], distance: 公里, duration: 分鐘, success}
+        """
+        if len(points) < 2 or self.num_nodes == 0:
+            return {'success': False}
+
+        nodes = [self.nearest_node(lat, lon) for lat, lon in points]
+        path_nodes: List[int] = []
+        total_m = 0.0
+
+        for source, target in zip(nodes, nodes[1:]):
+            result = self.shortest_path(source, target)
+            if result is None:
+                return {'success': False}
+            leg_nodes, leg_m = result
+            path_nodes.extend(leg_nodes if not path_nodes else leg_nodes[1:])
+            total_m += leg_m
+
+        coords = [(float(self.node_lat[n]), float(self.node_lon[n])) for n in path_nodes]
+        distance_km = total_m / 1000
+        return {
+            'coords': coords,
+            'distance': distance_km,
+            'duration': distance_km / self.speed_kmh * 60,
+            'success': True
+        }
+
+
+if __name__ == "__main__":
+    # 將 GeoJSON 道路資料轉換為 .npz
+    if len(sys.argv) != 3:
+        print("用法: python -m services.local_router <roads.geojson> <roads.npz>")
+        sys.exit(1)
+    router = LocalGraphRouter.from_geojson(sys.argv[1])
+    router.save_npz(sys.argv[2])
+    print(f"✅ 已儲存道路圖: {router.num_nodes} 個節點, {router.num_edges} 條邊 → {sys.argv[2]}")
@@ -0,0 +1,85 @@
+"""
+LRU 快取
+限制容量（超過時淘汰最久未使用的項目），並可設定存活時間（TTL），附帶命中統計
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLLRUCache:
+    """具 TTL 的 LRU 快取（執行緒安全）"""
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def _lookup(self, key: Hashable) -> Optional[tuple]:
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        expires_at = entry[1]
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._items[key]
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """取得項目（會更新最近使用順序）"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """加入項目，超過容量時淘汰最久未使用的項目"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """移除項目"""
+        with self._lock:
+            entry = self._items.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中統計"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,20 @@
+"""
+本機檔案路徑
+快取等檔案的位置以 backend 目錄為基準，不受啟動時的工作目錄影響
+"""
+import os
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def backend_path(env_name: str, *default: str) -> str:
+    """
+    讀取路徑設定
+
+    未設定或為空白時使用 backend 目錄下的預設位置；相對路徑以 backend 目錄為基準，絕對路徑維持不變
+
+    Args:
+        env_name: 環境變數名稱
+        default: 預設位置（相對於 backend 目錄的路徑片段）
+    """
+    return os.path.join(backend_dir, os.getenv(env_name) or os.path.join(*default))
@@ -0,0 +1,128 @@
+"""
+路線幾何壓縮
+Google encoded polyline 編碼 / 解碼，以及 Douglas–Peucker 折線簡化（容許誤差以公尺計）
+"""
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from services.geodesic import EARTH_RADIUS_KM
+
+# Google encoded polyline 預設精度（小數點後 5 位，約 1 公尺）
+POLYLINE_PRECISION = 5
+
+
+def encode_polyline(coords: Sequence[Sequence[float]], precision: int = POLYLINE_PRECISION) -> str:
+    """
+    將 [(lat, lon), ...] 編碼為 Google encoded polyline 字串
+
+    Args:
+        coords: 座標列表 [(lat, lon), ...]
+        precision: 小數位數（Google 地圖為 5，OSRM polyline6 為 6）
+    """
+    if len(coords) == 0:
+        return ""
+
+    scaled = np.round(np.asarray(coords, dtype=np.float64)[:, :2] * (10 ** precision)).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    # zigzag：負數左移後取反，使所有值變為非負整數
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).ravel().tolist()
+
+    chunks = []
+    for value in values:
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> List[Tuple[float, float]]:
+    """將 Google encoded polyline 字串解碼為 [(lat, lon), ...]"""
+    values = []
+    value = 0
+    shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = 0
+            shift = 0
+
+    factor = 10 ** precision
+    coords = np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0) / factor
+    return [(float(lat), float(lon)) for lat, lon in coords]
+
+
+def simplify_douglas_peucker(coords: Sequence[Sequence[float]], tolerance_m: float) -> List[Tuple[float, float]]:
+    """
+    Douglas–Peucker 折線簡化（保留 douglas_peucker_weights 大於容許誤差的點）
+
+    Args:
+        coords: 座標列表 [(lat, lon), ...]
+        tolerance_m: 容許誤差（公尺），簡化後各點與原路線的距離不超過此值
+
+    Returns:
+        簡化後的座標列表（保留起點與終點）
+    """
+    points = np.asarray(coords, dtype=np.float64)
+    if len(points) == 0:
+        return []
+    if tolerance_m > 0:
+        points = points[douglas_peucker_weights(points) > tolerance_m]
+    return [(float(lat), float(lon)) for lat, lon in points[:, :2]]
+
+
+def douglas_peucker_weights(coords: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    計算每個點在 Douglas–Peucker 簡化中被保留的最大容許誤差（公尺）
+
+    以完整遞迴一次算出所有點的權重：點的權重為它與祖先分割點距離中的最小值，
+    因此 weights > tolerance 的點就是簡化後保留的點（simplify_douglas_peucker 即以此實作），
+    可以用同一份權重快速取得多個簡化層級（起點與終點權重為無限大）
+    """
+    points = np.asarray(coords, dtype=np.float64)
+    n = len(points)
+    weights = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return weights
+    weights[0] = weights[-1] = np.inf
+    if n <= 2:
+        return weights
+
+    # 以路線中心緯度做等距圓柱投影（公尺），市區範圍內誤差可忽略
+    meters_per_rad = EARTH_RADIUS_KM * 1000
+    lat_rad = np.radians(points[:, 0])
+    x = np.radians(points[:, 1]) * np.cos(lat_rad.mean()) * meters_per_rad
+    y = lat_rad * meters_per_rad
+
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        start, end, parent_weight = stack.pop()
+        if end - start < 2:
+            continue
+
+        # 中間各點到線段 start–end 的距離
+        px = x[start + 1:end] - x[start]
+        py = y[start + 1:end] - y[start]
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        length_sq = dx * dx + dy * dy
+        if length_sq > 0:
+            t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        else:
+            distances = np.hypot(px, py)
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] <= 0:
+            continue
+        index = start + 1 + farthest
+        weight = min(parent_weight, float(distances[farthest]))
+        weights[index] = weight
+        stack.append((start, index, weight))
+        stack.append((index, end, weight))
+
+    return weights
@@ -0,0 +1,170 @@
+"""
+使用者進度查詢
+以一次 aggregation 取得進度、打卡記錄與路線會話：$unionWith 合併三個集合，$facet 分別整理，
+_id 與日期在伺服器上轉成字串；打卡記錄依時間排序並以游標分頁，不必每次取回全部記錄
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from database import Collections
+
+# 每頁打卡數的預設值與上限
+CHECKIN_PAGE_SIZE = 100
+CHECKIN_PAGE_SIZE_MAX = 1000
+
+# 日期輸出格式（ISO 8601，毫秒）
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%L"
+
+# 分頁排序：打卡時間，相同時間再依 _id
+CHECKIN_SORT = {"timestamp": 1, "_id": 1}
+CHECKIN_SORT_REVERSED = {"timestamp": -1, "_id": -1}
+
+
+def encode_cursor(timestamp: datetime, document_id: Any) -> str:
+    """以最後一筆打卡的時間與 _id 產生分頁游標"""
+    raw = json.dumps({
+        "t": timestamp.isoformat(),
+        "i": str(document_id),
+        "o": isinstance(document_id, ObjectId)
+    }, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+    """
+    解析分頁游標
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        document_id = ObjectId(raw["i"]) if raw["o"] else raw["i"]
+        return datetime.fromisoformat(raw["t"]), document_id
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"分頁游標格式錯誤: {cursor}") from e
+
+
+def _format_dates(*fields: str) -> Dict[str, Any]:
+    """_id 與日期欄位轉成字串（$set 階段，不是日期的值保持原樣）"""
+    formatted: Dict[str, Any] = {"_id": {"$toString": "$_id"}}
+    for field in fields:
+        formatted[field] = {"$cond": [
+            {"$eq": [{"$type": f"${field}"}, "date"]},
+            {"$dateToString": {"date": f"${field}", "format": DATE_FORMAT}},
+            f"${field}"
+        ]}
+    return formatted
+
+
+def progress_pipeline(user_id: str, shape: Optional[str] = None, limit: int = CHECKIN_PAGE_SIZE,
+                      after: Optional[Tuple[datetime, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    使用者進度的 aggregation（在 user_progress 集合上執行）
+
+    Args:
+        user_id: 使用者 ID
+        shape: 圖形 ID（可選）
+        limit: 每頁打卡數
+        after: decode_cursor 的結果，只取此筆之後的打卡
+
+    Returns:
+        輸出一份文件：progress, checkins, sessions, checkin_count, page_end, more
+    """
+    query: Dict[str, Any] = {"userId": user_id}
+    if shape:
+        query["shape"] = shape.upper()
+
+    checkin_query = dict(query)
+    if after is not None:
+        after_time, after_id = after
+        checkin_query["$or"] = [
+            {"timestamp": {"$gt": after_time}},
+            {"timestamp": after_time, "_id": {"$gt": after_id}}
+        ]
+
+    def kind(name: str) -> Dict[str, Any]:
+        return {"$match": {"_kind": name}}
+
+    return [
+        {"$match": query},
+        {"$set": {"_kind": "progress"}},
+        # 多取一筆以判斷是否還有下一頁
+        {"$unionWith": {"coll": Collections.CHECKINS, "pipeline": [
+            {"$match": checkin_query},
+            {"$sort": CHECKIN_SORT},
+            {"$limit": limit + 1},
+            {"$set": {"_kind": "checkin"}}
+        ]}},
+        {"$unionWith": {"coll": Collections.CHECKINS, "pipeline": [
+            {"$match": query},
+            {"$count": "count"},
+            {"$set": {"_kind": "checkin_count"}}
+        ]}},
+        {"$unionWith": {"coll": Collections.ROUTE_SESSIONS, "pipeline": [
+            {"$match": query},
+            {"$set": {"_kind": "session"}}
+        ]}},
+        {"$facet": {
+            "progress": [kind("progress"), {"$set": _format_dates("last_updated")}, {"$project": {"_kind": 0}}],
+            "checkins": [
+                kind("checkin"), {"$sort": CHECKIN_SORT}, {"$limit": limit},
+                {"$set": _format_dates("timestamp")}, {"$project": {"_kind": 0}}
+            ],
+            "sessions": [kind("session"), {"$set": _format_dates("start_time", "end_time")}, {"$project": {"_kind": 0}}],
+            "checkin_count": [kind("checkin_count")],
+            # 本頁最後一筆（未轉成字串的時間與 _id，用來產生游標）
+            "page_end": [
+                kind("checkin"), {"$sort": CHECKIN_SORT}, {"$limit": limit},
+                {"$sort": CHECKIN_SORT_REVERSED}, {"$limit": 1}, {"$project": {"timestamp": 1}}
+            ],
+            # 多取的那一筆存在代表還有下一頁
+            "more": [kind("checkin"), {"$skip": limit}, {"$limit": 1}, {"$project": {"_id": 1}}],
+        }},
+    ]
+
+
+async def get_user_progress(db, user_id: str, shape: Optional[str] = None, limit: int = CHECKIN_PAGE_SIZE,
+                            after: Optional[str] = None) -> Dict[str, Any]:
+    """
+    查詢使用者進度（一次 aggregation）
+
+    Args:
+        db: MongoDB 資料庫
+        user_id: 使用者 ID
+        shape: 圖形 ID（可選）
+        limit: 每頁打卡數
+        after: 上一次回傳的 next_cursor
+
+    Returns:
+        progress, checkins, sessions, total_checkins, next_cursor, has_more
+
+        next_cursor 是本頁最後一筆打卡的游標，即使已經是最後一頁也會回傳，定期查詢時帶入 after
+        只會取得之後新增的打卡；本頁沒有打卡時沿用傳入的 after（從未打卡時為 None）。
+        has_more 表示是否還有下一頁
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    pipeline = progress_pipeline(user_id, shape, limit, decode_cursor(after) if after else None)
+    results = await db[Collections.USER_PROGRESS].aggregate(pipeline).to_list(length=1)
+    result = results[0]
+
+    page_end = result["page_end"]
+    next_cursor = after
+    if page_end:
+        next_cursor = encode_cursor(page_end[0]["timestamp"], page_end[0]["_id"])
+
+    counts = result["checkin_count"]
+    return {
+        "progress": result["progress"],
+        "checkins": result["checkins"],
+        "sessions": result["sessions"],
+        "total_checkins": counts[0]["count"] if counts else 0,
+        "next_cursor": next_cursor,
+        "has_more": bool(result["more"]),
+    }
@@ -0,0 +1,69 @@
+"""
+路線結果快取
+同一個起始站點、同一份 YouBike 快照產生的路線完全相同，因此以
+(圖形, 起始站號, 快照版本) 為鍵快取，重複的 routeList / route/{shape} 請求不必重新生成
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+from services.distance_matrix import get_station_ride_times
+from services.executor import job_executor
+from services.lru_cache import TTLLRUCache
+from services.route_generator import generate_routes_for_shapes, resolve_start_station
+from tsp_taipei_route_new import RouteConfig
+from services.youbike_store import YOUBIKE_REFRESH_INTERVAL, get_youbike_snapshot
+
+# 快取容量（路線數）；存活時間與快照更新間隔相同，快照更新後舊版本的路線自然過期
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "2048"))
+
+route_cache = TTLLRUCache(ROUTE_CACHE_SIZE, ttl_seconds=YOUBIKE_REFRESH_INTERVAL)
+
+
+def route_cache_key(shape: str, start_sno: str, data_version: int) -> tuple:
+    """路線快取鍵"""
+    return (shape, str(start_sno), data_version)
+
+
+async def get_routes(shapes: List[str], lat: float, lon: float) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    取得多個圖形的路線（優先使用快取，未命中的圖形一次送到執行池生成）
+
+    Args:
+        shapes: 圖形類型列表
+        lat: 使用者緯度
+        lon: 使用者經度
+
+    Returns:
+        {圖形: 路線資訊字典}，生成失敗的圖形為 None（回傳的字典為共用物件，請勿修改）
+    """
+    snapshot = await job_executor.run_io(get_youbike_snapshot)
+    start_station = resolve_start_station(lat, lon, snapshot)
+
+    results = {}
+    missing = []
+    for shape in shapes:
+        cached = route_cache.get(route_cache_key(shape, start_station['sno'], snapshot.version))
+        if cached is not None:
+            results[shape] = cached
+        else:
+            missing.append(shape)
+
+    if missing:
+        # 可達性篩選使用道路騎行時間（REACHABILITY_MODE=road，否則為 None 並以直線距離估算）
+        config = RouteConfig()
+        ride_times = await get_station_ride_times(
+            start_station, snapshot, config.max_segment_time, config.cycling_speed
+        )
+        # 只傳送快照版本號，工作行程使用自己已載入的快照
+        generated = await job_executor.run_cpu(
+            generate_routes_for_shapes, missing, lat, lon,
+            start_station=start_station, ride_times=ride_times, snapshot_version=snapshot.version
+        )
+        for shape in missing:
+            route_result = generated.get(shape)
+            if route_result and route_result['success']:
+                route_cache.put(route_cache_key(shape, start_station['sno'], snapshot.version), route_result)
+            results[shape] = route_result
+
+    print(f"  💾 路線快取: 命中 {len(shapes) - len(missing)} / {len(shapes)}")
+    return {shape: results[shape] for shape in shapes}
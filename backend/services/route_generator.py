@@ -3,6 +3,7 @@
 """
 import sys
 import os
+import zlib
 
 # 添加專案路徑（相對於當前檔案）
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,110 +12,192 @@ parent_dir = os.path.dirname(backend_dir)
 sys.path.append(parent_dir)
 
 from tsp_taipei_route_new import (
-    fetch_youbike_data,
     find_nearest_youbike,
-    generate_shape_route,
-    find_nearby_attractions,
+    select_route_candidates,
+    assemble_shape_route,
+    scale_template_to_geography,
+    SHAPE_TEMPLATES,
     RouteConfig
 )
+from services.geodesic import haversine_many_to_many
+from services.youbike_store import YouBikeSnapshot, get_snapshot_version, get_youbike_snapshot
+from services.attractions_repository import get_attractions_repository
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
-# CSV 檔案路徑（相對於 townpass-backend 目錄）
-ATTRACTIONS_CSV_PATH = os.path.join(parent_dir, 'taipei_attractions.csv')
+def build_route_spots(route_df: pd.DataFrame, nearby_by_station: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """將路線站點與附近景點轉換為 Spots 列表"""
+    spots = []
 
-def fetch_attractions_from_csv():
-    """從本地 CSV 讀取景點資料（使用絕對路徑）"""
-    print("🏛️ 正在讀取台北景點資料...")
-    try:
-        df = pd.read_csv(ATTRACTIONS_CSV_PATH)
-        df = df[pd.notna(df['nlat']) & pd.notna(df['elong'])]
-        print(f"✅ 讀取 {len(df)} 個景點")
-        return df
-    except FileNotFoundError:
-        print(f"❌ 找不到 {ATTRACTIONS_CSV_PATH}")
-        return pd.DataFrame()
-
-def generate_route_for_shape(shape: str, lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    for idx, ((_, station), nearby_attractions) in enumerate(zip(route_df.iterrows(), nearby_by_station), 1):
+        # YouBike 站點
+        spot = {
+            'id': f"You-{station['sno']}",
+            'name': station['sna'],
+            'description': f"可借: {station['available_rent_bikes']}輛 | 可還: {station['available_return_bikes']}位",
+            'type': 'youbike',
+            'lat': station['latitude'],
+            'lon': station['longitude']
+        }
+        spots.append(spot)
+
+        # 附近景點（最多3個）
+        for attr in nearby_attractions[:3]:
+            attraction_spot = {
+                # 使用穩定的雜湊，確保不同行程（執行池）產生相同的 ID
+                'id': f"attr-{idx}-{zlib.crc32(str(attr['name']).encode('utf-8')) % 10000}",
+                'name': attr['name'],
+                'description': f"{attr.get('address', '無地址')} (距離 {attr['distance']:.0f}m)",
+                'type': 'attraction',
+                'lat': attr['lat'],
+                'lon': attr['lon']
+            }
+            spots.append(attraction_spot)
+
+    return spots
+
+def resolve_start_station(lat: float, lon: float, snapshot: YouBikeSnapshot) -> pd.Series:
+    """找使用者最近的 YouBike 站點作為起點（使用快照的站點索引）"""
+    config = RouteConfig()
+    return find_nearest_youbike(
+        lat, lon, snapshot.df, config.min_available_bikes, snapshot.station_index
+    )
+
+def generate_routes_for_shapes(
+    shapes: List[str],
+    lat: float,
+    lon: float,
+    snapshot: Optional[YouBikeSnapshot] = None,
+    start_station: Optional[pd.Series] = None,
+    ride_times: Optional[pd.Series] = None,
+    snapshot_version: Optional[int] = None
+) -> Dict[str, Optional[Dict[str, Any]]]:
     """
-    為指定圖形生成路線
-    
+    一次為多個圖形生成路線
+
+    起點、候選站點與距離矩陣只計算一次，所有圖形共用
+
     Args:
-        shape: 圖形類型 (T, A, I, P, E, S, U, O, L)
+        shapes: 圖形類型列表 (T, A, I, P, E, S, U, O, L)
         lat: 使用者緯度
         lon: 使用者經度
-    
+        snapshot: YouBike 快照（可選，未提供時依 snapshot_version 或讀取目前快照）
+        start_station: 已找好的起始站點（可選，未提供時依使用者位置尋找）
+        ride_times: 起始站點到各站點的實際騎行時間（可選，未提供時以直線距離估算）
+        snapshot_version: 快照版本（在行程池中執行時由主行程傳入，工作行程讀取自己載入的快照）
+
     Returns:
-        包含路線資訊的字典，如果失敗則回傳 None
+        {圖形: 路線資訊字典}，生成失敗的圖形為 None
     """
+    results = {shape: None for shape in shapes}
+
     try:
-        print(f"  🎨 生成 {shape} 形路線...")
-        
-        # 設定配置（直接傳入 shape 參數）
-        config = RouteConfig(shape=shape)
+        print(f"  🎨 生成 {', '.join(shapes)} 形路線...")
+
+        # 各圖形只有點數不同，篩選與距離相關設定共用
+        config = RouteConfig()
         config.user_location = {'lat': lat, 'lon': lon}
-        
-        # 抓取資料
-        youbike_df = fetch_youbike_data()
-        attractions_df = fetch_attractions_from_csv()
-        
+
+        # 讀取資料（YouBike 使用背景更新的快照）
+        if snapshot is None:
+            snapshot = get_youbike_snapshot() if snapshot_version is None else get_snapshot_version(snapshot_version)
+        youbike_df = snapshot.df
+        attractions = get_attractions_repository()
+
         # 找最近的 YouBike 站點作為起點
-        start_station = find_nearest_youbike(lat, lon, youbike_df, config.min_available_bikes)
-        
-        # 生成圖形路線
-        route_df, similarity = generate_shape_route(youbike_df, start_station, shape, config)
-        
-        if route_df is None:
-            print(f"  ⚠️ {shape} 路線生成失敗")
-            return None
-        
-        # 為每個站點找附近景點
-        spots = []
-        
-        for idx, (_, station) in enumerate(route_df.iterrows(), 1):
-            # 找附近景點
-            nearby_attractions = find_nearby_attractions(
-                station['latitude'],
-                station['longitude'],
-                attractions_df,
-                config.attraction_radius
+        if start_station is None:
+            start_station = resolve_start_station(lat, lon, snapshot)
+
+        # 篩選可用站點（所有圖形共用）
+        candidates = select_route_candidates(youbike_df, start_station, config, ride_times)
+        if len(candidates) < 4:
+            print(f"  ⚠️ 可用站點不足，無法生成路線")
+            return results
+
+        # 縮放所有模板，合併成一個距離矩陣
+        valid_shapes = [shape for shape in shapes if shape in SHAPE_TEMPLATES]
+        for shape in shapes:
+            if shape not in SHAPE_TEMPLATES:
+                print(f"  ⚠️ 不支援的圖形: {shape}")
+        if not valid_shapes:
+            return results
+
+        scaled_templates = [
+            scale_template_to_geography(
+                SHAPE_TEMPLATES[shape],
+                start_station['latitude'],
+                start_station['longitude'],
+                config.max_segment_distance
             )
-            
-            # YouBike 站點
-            spot = {
-                'id': f"You-{station['sno']}",
-                'name': station['sna'],
-                'description': f"可借: {station['available_rent_bikes']}輛 | 可還: {station['available_return_bikes']}位",
-                'type': 'youbike',
-                'lat': station['latitude'],
-                'lon': station['longitude']
+            for shape in valid_shapes
+        ]
+        template_points = np.vstack(scaled_templates)
+        distance_matrix = haversine_many_to_many(
+            template_points[:, 0], template_points[:, 1],
+            candidates['latitude'].values, candidates['longitude'].values
+        )
+
+        # 依各圖形的模板點切出對應的距離矩陣
+        route_dfs = {}
+        offset = 0
+        for shape, scaled in zip(valid_shapes, scaled_templates):
+            shape_distances = distance_matrix[offset:offset + len(scaled)]
+            offset += len(scaled)
+            print(f"\n🎨 生成 '{shape}' 形狀路線...")
+            route_dfs[shape] = assemble_shape_route(
+                candidates, start_station, SHAPE_TEMPLATES[shape], shape_distances
+            )
+
+        # 所有路線的站點一次查詢附近景點
+        all_stations = pd.concat([route_df for route_df, _ in route_dfs.values()])
+        nearby_all = attractions.find_nearby_batch(
+            all_stations['latitude'].values,
+            all_stations['longitude'].values,
+            config.attraction_radius
+        )
+
+        offset = 0
+        for shape, (route_df, similarity) in route_dfs.items():
+            nearby_by_station = nearby_all[offset:offset + len(route_df)]
+            offset += len(route_df)
+            spots = build_route_spots(route_df, nearby_by_station)
+            print(f"  ✅ {shape} 路線完成 ({len(spots)} 個景點)")
+
+            results[shape] = {
+                'success': True,
+                'shape': shape,
+                'similarity': similarity,
+                'spots': spots,
+                'route_df': route_df,
+                'start_sno': str(start_station['sno']),
+                'data_version': snapshot.version
             }
-            spots.append(spot)
-            
-            # 附近景點（最多3個）
-            for attr in nearby_attractions[:3]:
-                attraction_spot = {
-                    'id': f"attr-{idx}-{abs(hash(attr['name'])) % 10000}",
-                    'name': attr['name'],
-                    'description': f"{attr.get('address', '無地址')} (距離 {attr['distance']:.0f}m)",
-                    'type': 'attraction',
-                    'lat': attr['lat'],
-                    'lon': attr['lon']
-                }
-                spots.append(attraction_spot)
-        
-        print(f"  ✅ {shape} 路線完成 ({len(spots)} 個景點)")
-        
-        return {
-            'success': True,
-            'shape': shape,
-            'similarity': similarity,
-            'spots': spots,
-            'route_df': route_df
-        }
-        
+
+        return results
+
     except Exception as e:
-        print(f"  ❌ 生成 {shape} 路線時發生錯誤: {e}")
+        print(f"  ❌ 生成路線時發生錯誤: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        return results
+
+def generate_route_for_shape(
+    shape: str,
+    lat: float,
+    lon: float,
+    snapshot: Optional[YouBikeSnapshot] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    為指定圖形生成路線
+
+    Args:
+        shape: 圖形類型 (T, A, I, P, E, S, U, O, L)
+        lat: 使用者緯度
+        lon: 使用者經度
+        snapshot: YouBike 快照（可選）
+
+    Returns:
+        包含路線資訊的字典，如果失敗則回傳 None
+    """
+    return generate_routes_for_shapes([shape], lat, lon, snapshot)[shape]
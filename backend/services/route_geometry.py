@@ -0,0 +1,220 @@
+"""
+路線幾何服務
+計算路線詳情的實際路線幾何，並依 geometry_format 回傳完整座標、簡化座標或 encoded polyline；
+同一串站點（同一條路線）的幾何依格式與容許誤差快取，重複請求不必再串接、簡化與編碼
+
+第一次取得實際路線幾何時，同時預先計算多個簡化層級（幾何金字塔），
+地圖可先下載粗略的層級，放大後再取得較精細的層級
+"""
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.lru_cache import TTLLRUCache
+from services.polyline import douglas_peucker_weights, encode_polyline, simplify_douglas_peucker
+from services.routing_backend import compute_route_async, get_routing_backend, route_points
+
+# 支援的幾何格式
+GEOMETRY_FORMATS = ("full", "simplified", "polyline")
+
+# 簡化的預設容許誤差（公尺）與幾何快取容量
+ROUTE_SIMPLIFY_TOLERANCE = float(os.getenv("ROUTE_SIMPLIFY_TOLERANCE", "5"))
+ROUTE_GEOMETRY_CACHE_SIZE = int(os.getenv("ROUTE_GEOMETRY_CACHE_SIZE", "4096"))
+
+# 幾何金字塔各層級的容許誤差（公尺，由粗到細），最後再加上一層完整幾何
+ROUTE_GEOMETRY_PYRAMID = [
+    float(value) for value in os.getenv("ROUTE_GEOMETRY_PYRAMID", "200,50,12,3").split(",") if value.strip()
+]
+# 依縮放等級選擇層級時，容許誤差最多相當於幾個像素
+ROUTE_GEOMETRY_PIXEL_TOLERANCE = float(os.getenv("ROUTE_GEOMETRY_PIXEL_TOLERANCE", "1"))
+
+# Web Mercator 縮放等級 0、赤道上每像素的公尺數（256 像素圖磚）
+METERS_PER_PIXEL_ZOOM_0 = 156543.03392
+
+route_geometry_cache = TTLLRUCache(ROUTE_GEOMETRY_CACHE_SIZE)
+
+
+def normalize_tolerance(tolerance: Optional[float]) -> Optional[float]:
+    """容許誤差取到 0.1 公尺（快取鍵與簡化使用同一個值，相近的容許誤差共用快取）"""
+    return None if tolerance is None else round(tolerance, 1)
+
+
+def route_geometry_key(route_df: pd.DataFrame, backend_name: str,
+                       geometry_format: str, tolerance: Optional[float]) -> tuple:
+    """幾何快取鍵（路線以站號序列識別，tolerance 需先經過 normalize_tolerance）"""
+    snos = tuple(str(sno) for sno in route_df['sno'].tolist())
+    return (backend_name, snos, geometry_format, tolerance)
+
+
+def format_geometry(coords: List[Tuple[float, float]], geometry_format: str,
+                    tolerance: Optional[float]) -> Dict:
+    """
+    依格式轉換路線座標
+
+    Returns:
+        {'route_geometry': [[lat, lon], ...]} 或 {'route_polyline': str}
+    """
+    if geometry_format == "simplified" or (geometry_format == "polyline" and tolerance is not None):
+        coords = simplify_douglas_peucker(coords, ROUTE_SIMPLIFY_TOLERANCE if tolerance is None else tolerance)
+
+    if geometry_format == "polyline":
+        return {'route_geometry': [], 'route_polyline': encode_polyline(coords)}
+    return {'route_geometry': [[lat, lon] for lat, lon in coords], 'route_polyline': None}
+
+
+def build_geometry_pyramid(coords: List[Tuple[float, float]],
+                           tolerances: List[float] = ROUTE_GEOMETRY_PYRAMID) -> List[Dict]:
+    """
+    預先計算幾何金字塔
+
+    Returns:
+        [{level, tolerance_m, coords}, ...]，level 0 最粗略，最後一層為完整幾何（tolerance_m = 0）
+    """
+    weights = douglas_peucker_weights(coords)
+    levels = []
+    for level, tolerance in enumerate(sorted(tolerances, reverse=True)):
+        keep = np.flatnonzero(weights > tolerance).tolist()
+        levels.append({'level': level, 'tolerance_m': tolerance, 'coords': [coords[i] for i in keep]})
+    levels.append({'level': len(levels), 'tolerance_m': 0.0, 'coords': list(coords)})
+    return levels
+
+
+def meters_per_pixel(zoom: float, lat: float) -> float:
+    """Web Mercator 指定縮放等級與緯度下每像素的公尺數"""
+    return METERS_PER_PIXEL_ZOOM_0 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def viewport_meters_per_pixel(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                              width_px: int, height_px: int) -> float:
+    """可視範圍每像素的公尺數（取寬、高中較精細者）"""
+    center_lat = math.radians((min_lat + max_lat) / 2)
+    meters_per_degree = math.pi / 180 * 6371000
+    width_m = abs(max_lon - min_lon) * meters_per_degree * math.cos(center_lat)
+    height_m = abs(max_lat - min_lat) * meters_per_degree
+    return min(width_m / max(width_px, 1), height_m / max(height_px, 1))
+
+
+def select_pyramid_level(pyramid: List[Dict], meters_per_px: float) -> Dict:
+    """選擇容許誤差不超過 ROUTE_GEOMETRY_PIXEL_TOLERANCE 像素的最粗略層級"""
+    max_tolerance = meters_per_px * ROUTE_GEOMETRY_PIXEL_TOLERANCE
+    for level in pyramid:
+        if level['tolerance_m'] <= max_tolerance:
+            return level
+    return pyramid[-1]
+
+
+async def _get_full_geometry(route_df: pd.DataFrame) -> Dict:
+    """
+    取得完整路線幾何與幾何金字塔（優先使用快取）
+
+    路線規劃失敗時以直線連接各站點（不快取，下次請求會再嘗試路線規劃）
+    """
+    full_key = route_geometry_key(route_df, get_routing_backend().name, "full", None)
+    full = route_geometry_cache.get(full_key)
+    if full is not None:
+        return full
+
+    route_result = await compute_route_async(route_df)
+    if not route_result or not route_result['success']:
+        # 如果路線規劃失敗，使用直線連接
+        coords = route_points(route_df)
+        return {
+            **format_geometry(coords, "full", None),
+            'pyramid': build_geometry_pyramid(coords),
+            'distance': 0,
+            'duration': 0,
+            'success': False
+        }
+
+    coords = [(lat, lon) for lat, lon in route_result['coords']]
+    full = {
+        **format_geometry(coords, "full", None),
+        'pyramid': build_geometry_pyramid(coords),
+        'distance': route_result['distance'],
+        'duration': route_result['duration'],
+        'success': True
+    }
+    route_geometry_cache.put(full_key, full)
+    return full
+
+
+async def get_route_geometry(route_df: pd.DataFrame, geometry_format: str = "full",
+                             tolerance: Optional[float] = None) -> Dict:
+    """
+    取得路線幾何（優先使用快取）
+
+    Args:
+        route_df: 路線站點
+        geometry_format: full / simplified / polyline
+        tolerance: 簡化容許誤差（公尺，取到 0.1 公尺），polyline 格式提供時會先簡化再編碼
+
+    Returns:
+        {route_geometry, route_polyline, distance, duration, success}
+    """
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise ValueError(f"不支援的幾何格式: {geometry_format}")
+    if geometry_format == "full":
+        tolerance = None
+    elif geometry_format == "simplified" and tolerance is None:
+        tolerance = ROUTE_SIMPLIFY_TOLERANCE
+    tolerance = normalize_tolerance(tolerance)
+
+    key = route_geometry_key(route_df, get_routing_backend().name, geometry_format, tolerance)
+    cached = route_geometry_cache.get(key)
+    if cached is not None:
+        return cached
+
+    full = await _get_full_geometry(route_df)
+    if geometry_format == "full":
+        return full
+
+    coords = [(lat, lon) for lat, lon in full['route_geometry']]
+    result = {
+        **format_geometry(coords, geometry_format, tolerance),
+        'distance': full['distance'],
+        'duration': full['duration'],
+        'success': full['success']
+    }
+    if full['success']:
+        route_geometry_cache.put(key, result)
+    return result
+
+
+async def get_route_geometry_level(route_df: pd.DataFrame, level: Optional[int] = None,
+                                   meters_per_px: Optional[float] = None,
+                                   encoded: bool = False) -> Dict:
+    """
+    取得幾何金字塔的一個層級
+
+    Args:
+        route_df: 路線站點
+        level: 層級編號（0 最粗略，超過範圍時使用最精細的層級）
+        meters_per_px: 未指定 level 時，依每像素公尺數選擇層級；兩者皆未指定時回傳最粗略的層級
+        encoded: 是否以 encoded polyline 回傳
+
+    Returns:
+        {level, levels, tolerance_m, route_geometry, route_polyline, num_points, distance, duration, success}
+    """
+    full = await _get_full_geometry(route_df)
+    pyramid = full['pyramid']
+
+    if level is not None:
+        selected = pyramid[min(level, len(pyramid) - 1)]
+    elif meters_per_px is not None:
+        selected = select_pyramid_level(pyramid, meters_per_px)
+    else:
+        selected = pyramid[0]
+
+    return {
+        'level': selected['level'],
+        'levels': [item['tolerance_m'] for item in pyramid],
+        'tolerance_m': selected['tolerance_m'],
+        **format_geometry(selected['coords'], "polyline" if encoded else "full", None),
+        'num_points': len(selected['coords']),
+        'distance': full['distance'],
+        'duration': full['duration'],
+        'success': full['success']
+    }
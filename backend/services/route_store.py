@@ -0,0 +1,36 @@
+"""
+路線代碼服務
+routeList 為每條路線產生一個不透明的代碼並保存路線結果，
+/api/v1/route/{shape} 帶上代碼時直接取用同一條路線，不必重新生成；
+代碼由路線快取鍵 (圖形, 起始站號, 快照版本) 計算，重複的 routeList 請求共用同一個項目
+"""
+import base64
+import hashlib
+import os
+from typing import Any, Dict, Optional
+
+from services.lru_cache import TTLLRUCache
+
+# 代碼存活時間（秒）與保存數量上限
+ROUTE_HANDLE_TTL = int(os.getenv("ROUTE_HANDLE_TTL", "1800"))
+ROUTE_HANDLE_STORE_SIZE = int(os.getenv("ROUTE_HANDLE_STORE_SIZE", "10000"))
+
+route_handle_store = TTLLRUCache(ROUTE_HANDLE_STORE_SIZE, ttl_seconds=ROUTE_HANDLE_TTL)
+
+
+def route_handle(shape: str, start_sno: str, data_version: int) -> str:
+    """同一個圖形、起始站點與快照版本的路線得到相同的代碼"""
+    digest = hashlib.sha256(f"{shape}:{start_sno}:{data_version}".encode('utf-8')).digest()
+    return base64.urlsafe_b64encode(digest[:16]).decode('ascii').rstrip("=")
+
+
+def create_route_handle(route_result: Dict[str, Any]) -> str:
+    """保存路線結果並回傳代碼（已保存時只更新存活時間）"""
+    handle = route_handle(route_result['shape'], route_result['start_sno'], route_result['data_version'])
+    route_handle_store.put(handle, route_result)
+    return handle
+
+
+def get_route_by_handle(handle: str) -> Optional[Dict[str, Any]]:
+    """以代碼取得路線結果，不存在或已過期時回傳 None"""
+    return route_handle_store.get(handle)
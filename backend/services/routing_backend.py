@@ -0,0 +1,253 @@
+"""
+路線規劃後端
+可在外部 OSRM 伺服器與本地道路圖之間切換（ROUTING_BACKEND=osrm / local），
+兩者都回傳 {coords, distance, duration, success}
+API 請求使用 compute_route_async（OSRM 走非同步用戶端），命令列與執行池內使用 compute_route
+"""
+import abc
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import requests
+
+from services.executor import job_executor
+from services.leg_cache import LegKey, leg_cache
+from services.local_router import LocalGraphRouter
+from services.routing_client import (
+    OSRM_TIMEOUT, OSRM_URL, CircuitBreaker, CircuitOpenError, get_routing_client
+)
+
+# 後端設定
+ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "osrm")  # osrm / local
+ROUTING_GRAPH_PATH = os.getenv("ROUTING_GRAPH_PATH", "")  # 本地道路圖（.geojson 或 .npz）
+LEG_ROUTING_CONCURRENCY = int(os.getenv("LEG_ROUTING_CONCURRENCY", "4"))
+
+
+class RoutingBackend(abc.ABC):
+    """路線規劃後端介面"""
+    name = "base"
+
+    @abc.abstractmethod
+    def route(self, points: Sequence[Tuple[float, float]]) -> Dict:
+        """
+        計算依序經過 points 的騎行路線
+
+        Args:
+            points: [(lat, lon), ...]
+
+        Returns:
+            {coords: [(lat, lon), ...], distance: 公里, duration: 分鐘, success}
+        """
+
+
+class OSRMBackend(RoutingBackend):
+    """外部 OSRM 伺服器"""
+    name = "osrm"
+
+    def __init__(self, base_url: str = OSRM_URL, timeout: float = OSRM_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def route(self, points: Sequence[Tuple[float, float]]) -> Dict:
+        coords_str = ";".join(f"{lon},{lat}" for lat, lon in points)
+        osrm_url = f"{self.base_url}/route/v1/cycling/{coords_str}?overview=full&geometries=geojson"
+
+        try:
+            response = self._session.get(osrm_url, timeout=self.timeout)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('code') == 'Ok':
+                    route_data = data['routes'][0]
+                    route_geometry = route_data['geometry']['coordinates']
+                    return {
+                        'coords': [(coord[1], coord[0]) for coord in route_geometry],
+                        'distance': route_data['distance'] / 1000,
+                        'duration': route_data['duration'] / 60,
+                        'success': True
+                    }
+            return {'success': False}
+        except Exception as e:
+            print(f"⚠️ OSRM 錯誤: {e}")
+            return {'success': False}
+
+
+class LocalBackend(RoutingBackend):
+    """本地道路圖（A*）"""
+    name = "local"
+
+    def __init__(self, router: LocalGraphRouter):
+        self.router = router
+
+    def route(self, points: Sequence[Tuple[float, float]]) -> Dict:
+        return self.router.route(points)
+
+
+_backend: Optional[RoutingBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_routing_backend(kind: str = ROUTING_BACKEND, graph_path: str = ROUTING_GRAPH_PATH) -> RoutingBackend:
+    """依設定建立後端（本地道路圖讀取失敗時改用 OSRM）"""
+    if kind == "local":
+        try:
+            router = LocalGraphRouter.load(graph_path)
+            print(f"✅ 已載入本地道路圖: {router.num_nodes} 個節點, {router.num_edges} 條邊")
+            return LocalBackend(router)
+        except Exception as e:
+            print(f"⚠️ 本地道路圖載入失敗（{graph_path}），改用 OSRM: {e}")
+    return OSRMBackend()
+
+
+def get_routing_backend() -> RoutingBackend:
+    """取得共用的路線規劃後端"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_routing_backend()
+    return _backend
+
+
+def route_points(route_df: pd.DataFrame) -> List[Tuple[float, float]]:
+    """取出路線站點座標 [(lat, lon), ...]"""
+    return list(zip(route_df['latitude'].tolist(), route_df['longitude'].tolist()))
+
+
+# 計算缺少路段用的執行緒池（與 job_executor 分開，避免在其中巢狀等待；第一次使用時建立）
+_leg_pool: Optional[ThreadPoolExecutor] = None
+_leg_pool_lock = threading.Lock()
+
+
+def _get_leg_pool() -> ThreadPoolExecutor:
+    global _leg_pool
+    if _leg_pool is None:
+        with _leg_pool_lock:
+            if _leg_pool is None:
+                _leg_pool = ThreadPoolExecutor(max_workers=LEG_ROUTING_CONCURRENCY, thread_name_prefix="leg")
+    return _leg_pool
+
+
+async def close_leg_pool():
+    """關閉路段執行緒池（於 lifespan 在 job_executor 關閉後呼叫，在背景執行緒等待，不阻塞事件迴圈）"""
+    global _leg_pool
+    with _leg_pool_lock:
+        pool, _leg_pool = _leg_pool, None
+    if pool is not None:
+        await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+
+def assemble_legs(legs: List[Dict]) -> Dict:
+    """將各路段串接成完整路線"""
+    coords: List[Tuple[float, float]] = []
+    for leg in legs:
+        leg_coords = list(leg['coords'])
+        if coords and leg_coords and coords[-1] == leg_coords[0]:
+            leg_coords = leg_coords[1:]
+        coords.extend(leg_coords)
+
+    return {
+        'coords': coords,
+        'distance': sum(leg['distance'] for leg in legs),
+        'duration': sum(leg['duration'] for leg in legs),
+        'success': True
+    }
+
+
+def _lookup_legs(route_df: pd.DataFrame, backend: RoutingBackend):
+    """取出路線站點、路段快取鍵與已快取的路段"""
+    points = route_points(route_df)
+    snos = [str(sno) for sno in route_df['sno'].tolist()]
+    keys = [(backend.name, snos[i], snos[i + 1]) for i in range(len(snos) - 1)]
+
+    legs = leg_cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if legs[key] is None]
+    print(f"   路段快取: 命中 {len(keys) - len(missing)} / {len(keys)}")
+    return points, snos, keys, legs, missing
+
+
+def _finish_route(backend: RoutingBackend, snos: List[str], keys: List[LegKey],
+                  legs: Dict, missing: List[int], fetched: List[Dict]) -> Dict:
+    """保存新計算的路段並串接成完整路線"""
+    failed = False
+    for i, leg in zip(missing, fetched):
+        if not leg.get('success'):
+            print(f"⚠️ 路段 {snos[i]} → {snos[i + 1]} 計算失敗")
+            failed = True
+            continue
+        leg_cache.put(keys[i], leg)
+        legs[keys[i]] = leg
+    if failed:
+        return {'success': False}
+
+    result = assemble_legs([legs[key] for key in keys])
+    print(f"✅ {backend.name} 成功")
+    print(f"   實際距離: {result['distance']:.2f} 公里")
+    print(f"   預估時間: {result['duration']:.1f} 分鐘")
+    return result
+
+
+def compute_route(route_df: pd.DataFrame) -> Dict:
+    """
+    使用目前的後端計算路線站點之間的實際騎行路線（阻塞，請在執行池呼叫）
+
+    以相鄰站點為單位查詢路段快取，只有快取中沒有的路段才向後端查詢（平行處理），
+    最後串接成完整路線
+    """
+    backend = get_routing_backend()
+    print(f"\n🗺️  使用 {backend.name} 計算實際路線...")
+
+    if len(route_df) < 2:
+        return {'success': False}
+
+    points, snos, keys, legs, missing = _lookup_legs(route_df, backend)
+    fetched = list(_get_leg_pool().map(lambda i: backend.route([points[i], points[i + 1]]), missing))
+    return _finish_route(backend, snos, keys, legs, missing, fetched)
+
+
+async def compute_route_async(route_df: pd.DataFrame) -> Dict:
+    """
+    非同步版本的 compute_route
+
+    OSRM 後端改用共用的非同步用戶端（連線池、併發限制、重試與斷路器）同時查詢缺少的路段；
+    斷路器開啟時不等待、直接回傳失敗，由呼叫端改用直線連接。本地道路圖仍在執行池中計算
+    """
+    backend = get_routing_backend()
+    if not isinstance(backend, OSRMBackend):
+        return await job_executor.run_io(compute_route, route_df)
+
+    print(f"\n🗺️  使用 {backend.name} 計算實際路線...")
+    if len(route_df) < 2:
+        return {'success': False}
+
+    points, snos, keys, legs, missing = _lookup_legs(route_df, backend)
+    client = get_routing_client()
+    if missing and client.breaker.state == CircuitBreaker.OPEN:
+        print("⚠️ 路線規劃服務暫停使用（斷路器開啟），改用直線連接")
+        return {'success': False, 'circuit_open': True}
+
+    fetched = await asyncio.gather(
+        *(client.route([points[i], points[i + 1]]) for i in missing), return_exceptions=True
+    )
+
+    circuit_open = False
+    results = []
+    for leg in fetched:
+        if isinstance(leg, CircuitOpenError):
+            circuit_open = True
+            leg = {'success': False}
+        elif isinstance(leg, BaseException):
+            raise leg
+        results.append(leg)
+    if circuit_open:
+        print("⚠️ 路線規劃服務暫停使用（斷路器開啟），改用直線連接")
+
+    # 斷路器開啟前已取得的路段仍會保存
+    result = _finish_route(backend, snos, keys, legs, missing, results)
+    if circuit_open:
+        result['circuit_open'] = True
+    return result
@@ -0,0 +1,293 @@
+"""
+非同步路線規劃 HTTP 用戶端
+以共用連線池（keep-alive）呼叫 OSRM，限制每個主機同時進行的請求數，失敗時以隨機抖動的
+指數退避重試，連續失敗達門檻時由斷路器直接拒絕請求，讓路線詳情立即改用直線連接
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+# 用戶端設定
+OSRM_URL = os.getenv("OSRM_URL", "http://router.project-osrm.org")
+OSRM_TIMEOUT = float(os.getenv("OSRM_TIMEOUT", "30"))
+OSRM_MAX_CONNECTIONS = int(os.getenv("OSRM_MAX_CONNECTIONS", "20"))
+OSRM_MAX_CONCURRENCY_PER_HOST = int(os.getenv("OSRM_MAX_CONCURRENCY_PER_HOST", "8"))
+OSRM_RETRIES = int(os.getenv("OSRM_RETRIES", "2"))
+OSRM_RETRY_BACKOFF = float(os.getenv("OSRM_RETRY_BACKOFF", "0.2"))  # 第一次重試前的基本等待（秒）
+OSRM_RETRY_BACKOFF_MAX = float(os.getenv("OSRM_RETRY_BACKOFF_MAX", "2"))
+
+# 斷路器設定
+OSRM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("OSRM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+OSRM_CIRCUIT_RESET_TIMEOUT = float(os.getenv("OSRM_CIRCUIT_RESET_TIMEOUT", "30"))
+
+# 可以重試的 HTTP 狀態碼
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，請求未送出"""
+
+
+class RoutingRequestError(Exception):
+    """路線規劃請求失敗（已用完重試次數）"""
+
+
+class CircuitBreaker:
+    """
+    斷路器
+    closed：正常送出請求；連續失敗達 failure_threshold 次後轉為 open
+    open：直接拒絕請求，經過 reset_timeout 秒後轉為 half_open
+    half_open：只放行一個試探請求，成功則回到 closed，失敗則重新 open
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = OSRM_CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = OSRM_CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_inflight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_inflight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """是否可以送出請求（half_open 時只放行一個試探請求）"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_inflight:
+            self._probe_inflight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probe_inflight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.times_opened += 1
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_inflight = False
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class AsyncRoutingClient:
+    """OSRM 非同步用戶端（需在同一個事件迴圈中使用）"""
+    def __init__(
+        self,
+        base_url: str = OSRM_URL,
+        timeout: float = OSRM_TIMEOUT,
+        max_connections: int = OSRM_MAX_CONNECTIONS,
+        max_concurrency_per_host: int = OSRM_MAX_CONCURRENCY_PER_HOST,
+        retries: int = OSRM_RETRIES,
+        backoff: float = OSRM_RETRY_BACKOFF,
+        backoff_max: float = OSRM_RETRY_BACKOFF_MAX,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    def _retry_delay(self, attempt: int) -> float:
+        """指數退避加上完整抖動（0 ~ backoff * 2^attempt）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    async def get_json(self, url: str) -> Dict:
+        """
+        送出 GET 請求並回傳 JSON
+
+        Raises:
+            CircuitOpenError: 斷路器開啟中
+            RoutingRequestError: 重試後仍失敗
+        """
+        # half_open 時本次請求就是唯一的試探請求
+        is_probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"路線規劃服務暫停使用（{self.base_url}）")
+
+        client = self._http_client()
+        last_error = ""
+        recorded = False
+        try:
+            async with self._host_semaphore(url):
+                for attempt in range(self.retries + 1):
+                    if attempt > 0:
+                        self.retried += 1
+                        await asyncio.sleep(self._retry_delay(attempt - 1))
+                    self.requests += 1
+                    try:
+                        response = await client.get(url)
+                    except httpx.HTTPError as e:
+                        last_error = f"{type(e).__name__}: {e}"
+                        continue
+                    if response.status_code in RETRYABLE_STATUS:
+                        last_error = f"HTTP {response.status_code}"
+                        continue
+                    if response.status_code != 200:
+                        # 其他 4xx 代表請求本身有問題，重試也不會成功，也不算服務故障
+                        recorded = True
+                        self.breaker.record_success()
+                        raise RoutingRequestError(f"HTTP {response.status_code}")
+                    try:
+                        data = response.json()
+                    except ValueError as e:
+                        last_error = f"回應格式錯誤: {e}"
+                        continue
+                    recorded = True
+                    self.breaker.record_success()
+                    return data
+
+            self.failed += 1
+            recorded = True
+            self.breaker.record_failure()
+            raise RoutingRequestError(last_error)
+        finally:
+            # 試探請求被取消或發生其他例外時視為失敗，否則斷路器會一直停在 half_open
+            if is_probe and not recorded:
+                self.breaker.record_failure()
+
+    async def route(self, points: Sequence[Tuple[float, float]]) -> Dict:
+        """
+        計算依序經過 points 的騎行路線（格式與 RoutingBackend.route 相同）
+
+        Raises:
+            CircuitOpenError: 斷路器開啟中
+        """
+        coords_str = ";".join(f"{lon},{lat}" for lat, lon in points)
+        url = f"{self.base_url}/route/v1/cycling/{coords_str}?overview=full&geometries=geojson"
+
+        try:
+            data = await self.get_json(url)
+        except RoutingRequestError as e:
+            print(f"⚠️ OSRM 錯誤: {e}")
+            return {'success': False}
+
+        if data.get('code') != 'Ok':
+            return {'success': False}
+        route_data = data['routes'][0]
+        return {
+            'coords': [(coord[1], coord[0]) for coord in route_data['geometry']['coordinates']],
+            'distance': route_data['distance'] / 1000,
+            'duration': route_data['duration'] / 60,
+            'success': True
+        }
+
+    async def table(self, sources: Sequence[Tuple[float, float]],
+                    destinations: Sequence[Tuple[float, float]]) -> Optional[Dict]:
+        """
+        以 OSRM table 服務計算多對多距離與時間
+
+        Returns:
+            {'distances': [[公尺]], 'durations': [[秒]]}（無法到達為 None），失敗時回傳 None
+
+        Raises:
+            CircuitOpenError: 斷路器開啟中
+        """
+        points = list(sources) + list(destinations)
+        coords_str = ";".join(f"{lon},{lat}" for lat, lon in points)
+        source_ids = ";".join(str(i) for i in range(len(sources)))
+        destination_ids = ";".join(str(i) for i in range(len(sources), len(points)))
+        url = (f"{self.base_url}/table/v1/cycling/{coords_str}"
+               f"?sources={source_ids}&destinations={destination_ids}&annotations=distance,duration")
+
+        try:
+            data = await self.get_json(url)
+        except RoutingRequestError as e:
+            print(f"⚠️ OSRM table 錯誤: {e}")
+            return None
+
+        if data.get('code') != 'Ok' or 'distances' not in data:
+            return None
+        return {'distances': data['distances'], 'durations': data.get('durations')}
+
+    async def aclose(self):
+        """關閉連線池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict:
+        return {
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "retried": self.retried,
+            "failed": self.failed,
+            "circuit": self.breaker.stats(),
+        }
+
+
+_client: Optional[AsyncRoutingClient] = None
+
+
+def get_routing_client() -> AsyncRoutingClient:
+    """取得共用的路線規劃用戶端"""
+    global _client
+    if _client is None:
+        _client = AsyncRoutingClient()
+    return _client
+
+
+async def close_routing_client():
+    """關閉共用的路線規劃用戶端"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
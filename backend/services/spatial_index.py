@@ -0,0 +1,134 @@
+"""
+空間索引服務
+將經緯度投影到平面（等距圓柱投影）後建立 KD-tree，用於半徑查詢與最近點查詢
+"""
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from services.geodesic import EARTH_RADIUS_KM, haversine_one_to_many
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+
+
+class GeoPointIndex:
+    """經緯度點索引（唯讀）"""
+    def __init__(self, lats, lons):
+        self.lat = np.ascontiguousarray(lats, dtype=np.float64)
+        self.lon = np.ascontiguousarray(lons, dtype=np.float64)
+
+        # 以資料中心為投影基準
+        self._lat0 = float(self.lat.mean()) if len(self.lat) else 0.0
+        self._lon0 = float(self.lon.mean()) if len(self.lon) else 0.0
+        self._cos0 = math.cos(math.radians(self._lat0))
+        abs_lat = np.abs(self.lat)
+        self._abs_lat_min = float(abs_lat.min()) if len(abs_lat) else 0.0
+        self._abs_lat_max = float(abs_lat.max()) if len(abs_lat) else 0.0
+
+        self._tree = cKDTree(self.project(self.lat, self.lon))
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def project(self, lats, lons) -> np.ndarray:
+        """投影到以公尺為單位的平面座標 (x, y)"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        x = np.radians(lons - self._lon0) * self._cos0 * EARTH_RADIUS_M
+        y = np.radians(lats - self._lat0) * EARTH_RADIUS_M
+        return np.column_stack([x, y])
+
+    def _distortion(self, lats, radius_m: float = 0) -> float:
+        """投影在查詢範圍內的最大縮放誤差（用來放大搜尋半徑，避免漏掉邊界上的點）"""
+        margin = math.degrees(radius_m / EARTH_RADIUS_M)
+        abs_lats = np.abs(np.asarray(lats, dtype=np.float64))
+        lat_max = min(max(float(abs_lats.max()), self._abs_lat_max) + margin, 89.0)
+        lat_min = max(min(float(abs_lats.min()), self._abs_lat_min) - margin, 0.0)
+        cos_max = math.cos(math.radians(lat_min))
+        cos_min = math.cos(math.radians(lat_max))
+        return max(self._cos0 / cos_min, cos_max / self._cos0) * 1.01
+
+    def query_radius(self, lats, lons, radius_m: float) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        批次半徑查詢
+
+        Args:
+            lats, lons: 查詢點座標陣列
+            radius_m: 半徑（公尺）
+
+        Returns:
+            每個查詢點一組 (索引陣列, 距離陣列[公尺])，依距離由近到遠排序
+            （距離相同時保持原始資料順序）
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64))
+
+        if len(self) == 0 or len(lats) == 0:
+            return [empty for _ in range(len(lats))]
+
+        # 先用 KD-tree 以放大的半徑取得候選點，再用 haversine 精確過濾
+        search_radius = radius_m * self._distortion(lats, radius_m)
+        candidate_lists = self._tree.query_ball_point(self.project(lats, lons), search_radius)
+
+        results = []
+        for lat, lon, candidates in zip(lats, lons, candidate_lists):
+            if not candidates:
+                results.append(empty)
+                continue
+            idx = np.sort(np.asarray(candidates, dtype=np.intp))
+            distances = haversine_one_to_many(lat, lon, self.lat[idx], self.lon[idx]) * 1000
+            mask = distances <= radius_m
+            idx, distances = idx[mask], distances[mask]
+            order = np.argsort(distances, kind='stable')
+            results.append((idx[order], distances[order]))
+        return results
+
+    def query_nearest(self, lat: float, lon: float, mask: Optional[np.ndarray] = None,
+                      k: int = 8) -> Optional[Tuple[int, float]]:
+        """
+        最近點查詢
+
+        Args:
+            lat, lon: 查詢點座標
+            mask: 布林陣列，只考慮 mask 為 True 的點（可選）
+            k: 第一次向 KD-tree 取的候選數，不足時自動擴大
+
+        Returns:
+            (索引, 距離[公尺])；沒有符合條件的點時回傳 None
+            距離相同時回傳原始資料順序較前的點
+        """
+        n = len(self)
+        if n == 0 or (mask is not None and not mask.any()):
+            return None
+
+        point = self.project([lat], [lon])[0]
+        distortion = self._distortion([lat])
+
+        while True:
+            k = min(k, n)
+            planar, idx = self._tree.query(point, k=k)
+            planar = np.atleast_1d(planar)
+            idx = np.atleast_1d(idx)
+
+            if mask is not None:
+                keep = mask[idx]
+                candidates = idx[keep]
+            else:
+                candidates = idx
+
+            if len(candidates) > 0:
+                candidates = np.sort(candidates)
+                distances = haversine_one_to_many(lat, lon, self.lat[candidates], self.lon[candidates]) * 1000
+                best = int(np.argmin(distances))
+                best_distance = float(distances[best])
+
+                # KD-tree 以外的點至少有 planar[-1] / distortion 遠，確認不會更近才回傳
+                if k == n or best_distance * distortion < planar[-1]:
+                    return int(candidates[best]), best_distance
+            elif k == n:
+                return None
+
+            k *= 4
@@ -1,72 +1,168 @@
 """
 SVG 圖形生成服務
+座標投影與格式化以 NumPy 陣列一次完成，路徑使用相對指令以縮短輸出；
+相同的站點序列（同一條路線）只繪製一次，之後直接使用快取
 """
+import hashlib
+import os
+from typing import Optional, Tuple
+
 import numpy as np
 import pandas as pd
-from typing import List
 
-def generate_route_svg(route_df: pd.DataFrame, width: int = 400, height: int = 400) -> str:
-    """
-    根據實際路線生成 SVG
-    
-    Args:
-        route_df: 包含 latitude, longitude 的 DataFrame
-        width: SVG 寬度
-        height: SVG 高度
-    
-    Returns:
-        SVG 字串
-    """
-    if route_df is None or len(route_df) == 0:
-        return ""
-    
-    # 取得座標範圍
-    lats = route_df['latitude'].values
-    lons = route_df['longitude'].values
-    
+from services.lru_cache import TTLLRUCache
+
+# 座標小數位數與快取容量
+SVG_PRECISION = int(os.getenv("SVG_PRECISION", "1"))
+SVG_CACHE_SIZE = int(os.getenv("SVG_CACHE_SIZE", "4096"))
+
+if SVG_PRECISION < 0:
+    print(f"⚠️ SVG_PRECISION 不可為負數（{SVG_PRECISION}），改用 0")
+    SVG_PRECISION = 0
+
+svg_cache = TTLLRUCache(SVG_CACHE_SIZE)
+
+
+def project_points(lats: np.ndarray, lons: np.ndarray, width: int, height: int,
+                   margin: float = 0.1) -> Tuple[np.ndarray, np.ndarray]:
+    """將經緯度線性投影到 SVG 畫布（四周保留 margin 比例的邊距，y 軸向下）"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
     lat_min, lat_max = lats.min(), lats.max()
     lon_min, lon_max = lons.min(), lons.max()
-    
-    # 加入邊距
+
     lat_range = lat_max - lat_min
     lon_range = lon_max - lon_min
-    
     if lat_range == 0:
         lat_range = 0.01
     if lon_range == 0:
         lon_range = 0.01
-    
-    margin = 0.1
+
     lat_min -= lat_range * margin
     lat_max += lat_range * margin
     lon_min -= lon_range * margin
     lon_max += lon_range * margin
-    
-    # 轉換為 SVG 座標
-    points = []
-    for _, row in route_df.iterrows():
-        x = ((row['longitude'] - lon_min) / (lon_max - lon_min)) * width
-        y = height - ((row['latitude'] - lat_min) / (lat_max - lat_min)) * height
-        points.append(f"{x:.2f},{y:.2f}")
-    
-    # 生成路徑
-    path_data = f"M {points[0]}"
-    for point in points[1:]:
-        path_data += f" L {point}"
-    
-    # 生成 SVG
+
+    xs = (lons - lon_min) / (lon_max - lon_min) * width
+    ys = height - (lats - lat_min) / (lat_max - lat_min) * height
+    return xs, ys
+
+
+def _format_numbers(scaled: np.ndarray, precision: int) -> np.ndarray:
+    """將放大 10^precision 倍的整數一次轉成最短的小數字串（去除多餘的 0）"""
+    if precision < 0:
+        # 10^precision 小於 1 時座標會被縮小，輸出的數字不再是原本的座標
+        raise ValueError(f"precision 不可為負數: {precision}")
+    if precision == 0:
+        return scaled.astype(str)
+    factor = 10 ** precision
+    magnitude = np.abs(scaled)
+    text = np.char.add(
+        np.char.add((magnitude // factor).astype(str), '.'),
+        np.char.zfill((magnitude % factor).astype(str), precision)
+    )
+    text = np.char.rstrip(np.char.rstrip(text, '0'), '.')
+    return np.char.add(np.where(scaled < 0, '-', ''), text)
+
+
+def _join_numbers(numbers: np.ndarray) -> str:
+    """以空白串接數字，負號本身即可分隔，前面不加空白"""
+    separators = np.where(np.char.startswith(numbers, '-'), '', ' ')
+    separators[:1] = ''
+    return ''.join(np.char.add(separators, numbers).tolist())
+
+
+def format_path(xs: np.ndarray, ys: np.ndarray, precision: int = SVG_PRECISION) -> Tuple[str, np.ndarray, np.ndarray]:
+    """
+    產生精簡的 SVG 路徑（第一點使用絕對座標 M，其後使用相對座標 l）
+
+    相對位移由四捨五入後的絕對座標相減得到，不會累積誤差
+
+    Returns:
+        (路徑字串, 四捨五入後的 x, 四捨五入後的 y)
+    """
+    factor = 10 ** precision
+    scaled = np.round(np.column_stack([xs, ys]) * factor).astype(np.int64)
+    deltas = np.diff(scaled, axis=0)
+
+    path_data = "M" + _join_numbers(_format_numbers(scaled[0], precision))
+    if len(deltas):
+        path_data += "l" + _join_numbers(_format_numbers(deltas.ravel(), precision))
+
+    rounded = scaled / factor
+    return path_data, rounded[:, 0], rounded[:, 1]
+
+
+def route_hash(route_df: pd.DataFrame, *params) -> str:
+    """站點序列（站號與座標）與繪製參數的雜湊（SHA-1 十六進位）"""
+    digest = hashlib.sha1()
+    digest.update('\n'.join(route_df['sno'].astype(str)).encode('utf-8'))
+    digest.update(np.ascontiguousarray(route_df['latitude'].values, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(route_df['longitude'].values, dtype=np.float64).tobytes())
+    digest.update(repr(params).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def route_svg_key(route_df: pd.DataFrame, width: int, height: int, precision: int) -> Optional[str]:
+    """以站點序列與繪製參數計算快取鍵，沒有站號時不快取"""
+    if 'sno' not in route_df.columns:
+        return None
+    return route_hash(route_df, 'svg', width, height, precision)
+
+
+def render_route_svg(route_df: pd.DataFrame, width: int = 400, height: int = 400,
+                     precision: int = SVG_PRECISION) -> str:
+    """繪製路線 SVG（不使用快取）"""
+    xs, ys = project_points(route_df['latitude'].values, route_df['longitude'].values, width, height)
+    path_data, xs, ys = format_path(xs, ys, precision)
+
+    factor = 10 ** precision
+    x_text = _format_numbers(np.round(xs * factor).astype(np.int64), precision).tolist()
+    y_text = _format_numbers(np.round(ys * factor).astype(np.int64), precision).tolist()
+    label_y_text = _format_numbers(np.round((ys - 10) * factor).astype(np.int64), precision).tolist()
+
     svg_parts = [
         f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
         f'  <path d="{path_data}" stroke="#3B82F6" stroke-width="3" fill="none" stroke-linecap="round" stroke-linejoin="round"/>'
     ]
-    
+
     # 添加站點標記
-    for i, point_str in enumerate(points):
-        x, y = point_str.split(',')
-        color = "#10B981" if i == 0 else "#EF4444" if i == len(points) - 1 else "#3B82F6"
+    last = len(x_text) - 1
+    for i, (x, y, label_y) in enumerate(zip(x_text, y_text, label_y_text)):
+        color = "#10B981" if i == 0 else "#EF4444" if i == last else "#3B82F6"
         svg_parts.append(f'  <circle cx="{x}" cy="{y}" r="5" fill="{color}"/>')
-        svg_parts.append(f'  <text x="{x}" y="{float(y)-10}" text-anchor="middle" font-size="12" fill="{color}">{i+1}</text>')
-    
+        svg_parts.append(f'  <text x="{x}" y="{label_y}" text-anchor="middle" font-size="12" fill="{color}">{i+1}</text>')
+
     svg_parts.append('</svg>')
-    
+
     return '\n'.join(svg_parts)
+
+
+def generate_route_svg(route_df: pd.DataFrame, width: int = 400, height: int = 400,
+                       precision: int = SVG_PRECISION) -> str:
+    """
+    根據實際路線生成 SVG（相同站點序列使用快取）
+
+    Args:
+        route_df: 包含 latitude, longitude（與 sno）的 DataFrame
+        width: SVG 寬度
+        height: SVG 高度
+        precision: 座標小數位數
+
+    Returns:
+        SVG 字串
+    """
+    if route_df is None or len(route_df) == 0:
+        return ""
+
+    key = route_svg_key(route_df, width, height, precision)
+    if key is not None:
+        cached = svg_cache.get(key)
+        if cached is not None:
+            return cached
+
+    svg = render_route_svg(route_df, width, height, precision)
+    if key is not None:
+        svg_cache.put(key, svg)
+    return svg
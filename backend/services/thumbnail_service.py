@@ -0,0 +1,166 @@
+"""
+路線縮圖服務
+將路線繪製成 PNG / WebP 縮圖，以路線雜湊（站點序列與繪製參數）為檔名保存在本機磁碟（DiskLRUCache，
+限制總容量並淘汰最久未使用的縮圖），routeList 的 Route.image 只放縮圖網址；
+同一條路線只繪製一次，內容不變因此可長期快取
+"""
+import io
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont, features
+
+from services.disk_cache import DiskLRUCache
+from services.executor import job_executor
+from services.paths import backend_path
+from services.svg_service import project_points, route_hash
+
+# Route.image 內容：url（縮圖網址）/ svg（內嵌 SVG）
+ROUTE_IMAGE_MODE = os.getenv("ROUTE_IMAGE_MODE", "url")
+
+# 縮圖設定（THUMBNAIL_BASE_URL 為空時回傳相對網址）
+THUMBNAIL_DIR = backend_path("THUMBNAIL_DIR", "cache", "thumbnails")
+THUMBNAIL_CACHE_MAX_MB = float(os.getenv("THUMBNAIL_CACHE_MAX_MB", "256"))
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "png").lower()  # png / webp
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+THUMBNAIL_BASE_URL = os.getenv("THUMBNAIL_BASE_URL", "").rstrip('/')
+
+if THUMBNAIL_FORMAT == "webp" and not features.check("webp"):
+    print("⚠️ Pillow 不支援 WebP，縮圖改用 PNG")
+    THUMBNAIL_FORMAT = "png"
+
+# 繪製方式改變時遞增，讓舊的縮圖自然失效
+THUMBNAIL_RENDER_VERSION = 1
+
+# 縮圖檔名：40 位 SHA-1 + 副檔名
+THUMBNAIL_NAME_PATTERN = re.compile(r"^[0-9a-f]{40}\.(png|webp)$")
+THUMBNAIL_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+# 繪製時放大的倍數（縮小後得到平滑的線條）
+_SUPERSAMPLE = 2
+
+thumbnail_cache = DiskLRUCache(THUMBNAIL_DIR, int(THUMBNAIL_CACHE_MAX_MB * 1024 * 1024))
+
+
+def thumbnail_name(route_df: pd.DataFrame, size: int = THUMBNAIL_SIZE,
+                   image_format: str = THUMBNAIL_FORMAT) -> str:
+    """縮圖檔名（內容定址：相同路線與繪製參數得到相同檔名）"""
+    return f"{route_hash(route_df, 'thumbnail', size, THUMBNAIL_RENDER_VERSION)}.{image_format}"
+
+
+def thumbnail_url(name: str) -> str:
+    """縮圖網址"""
+    return f"{THUMBNAIL_BASE_URL}/api/v1/thumbnails/{name}"
+
+
+def _load_font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 的預設字型無法指定大小
+        return ImageFont.load_default()
+
+
+def render_thumbnail(lats: Sequence[float], lons: Sequence[float], size: int = THUMBNAIL_SIZE,
+                     image_format: str = THUMBNAIL_FORMAT) -> bytes:
+    """將路線繪製成縮圖（配色與 SVG 相同），回傳圖片 bytes"""
+    canvas = size * _SUPERSAMPLE
+    scale = canvas / 400  # 線寬與標記以 400 像素的 SVG 為基準
+    xs, ys = project_points(lats, lons, canvas, canvas)
+    points = list(zip(xs.tolist(), ys.tolist()))
+
+    image = Image.new("RGBA", (canvas, canvas), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    if len(points) > 1:
+        draw.line(points, fill="#3B82F6", width=max(1, round(3 * scale)), joint="curve")
+
+    radius = 5 * scale
+    font = _load_font(max(8, round(12 * scale)))
+    last = len(points) - 1
+    for i, (x, y) in enumerate(points):
+        color = "#10B981" if i == 0 else "#EF4444" if i == last else "#3B82F6"
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+        draw.text((x, y - 10 * scale), str(i + 1), fill=color, font=font, anchor="ms")
+
+    image = image.resize((size, size), Image.LANCZOS)
+    output = io.BytesIO()
+    if image_format == "webp":
+        image.save(output, format="WEBP", quality=85, method=4)
+    else:
+        image.save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+
+def render_thumbnails(items: List[Tuple[str, np.ndarray, np.ndarray]],
+                      size: int = THUMBNAIL_SIZE) -> List[Tuple[str, bytes]]:
+    """
+    繪製多張縮圖（在執行池中呼叫，保存由主行程的 thumbnail_cache 負責）
+
+    Args:
+        items: [(檔名, 緯度陣列, 經度陣列), ...]
+
+    Returns:
+        [(檔名, 圖片 bytes), ...]
+    """
+    return [
+        (name, render_thumbnail(lats, lons, size, name.rsplit(".", 1)[1]))
+        for name, lats, lons in items
+    ]
+
+
+def missing_thumbnails(names: Sequence[str]) -> List[str]:
+    """找出尚未保存的縮圖"""
+    return [name for name in names if name not in thumbnail_cache]
+
+
+def store_thumbnails(rendered: List[Tuple[str, bytes]]):
+    """保存縮圖（阻塞，請在執行池呼叫）"""
+    for name, data in rendered:
+        thumbnail_cache.put(name, data)
+
+
+async def ensure_route_thumbnails(route_dfs: Dict[str, pd.DataFrame]) -> Dict[str, str]:
+    """
+    確保多條路線的縮圖已存在（缺少的一次送到執行池繪製）
+
+    Args:
+        route_dfs: {圖形: 路線站點}
+
+    Returns:
+        {圖形: 縮圖網址}
+    """
+    names = {shape: thumbnail_name(route_df) for shape, route_df in route_dfs.items()}
+    shapes_by_name = {name: shape for shape, name in names.items()}
+
+    missing = await job_executor.run_io(missing_thumbnails, list(shapes_by_name))
+    if missing:
+        items = [
+            (name, route_dfs[shapes_by_name[name]]['latitude'].values,
+             route_dfs[shapes_by_name[name]]['longitude'].values)
+            for name in missing
+        ]
+        rendered = await job_executor.run_cpu(render_thumbnails, items)
+        await job_executor.run_io(store_thumbnails, rendered)
+        print(f"  🖼️  繪製縮圖: {len(rendered)} 張")
+
+    return {shape: thumbnail_url(name) for shape, name in names.items()}
+
+
+def is_thumbnail_name(name: str) -> bool:
+    """檔名是否為合法的縮圖檔名"""
+    return bool(THUMBNAIL_NAME_PATTERN.match(name))
+
+
+def touch_thumbnail(name: str) -> bool:
+    """縮圖是否存在（存在時更新使用順序，不讀取內容）"""
+    return is_thumbnail_name(name) and thumbnail_cache.touch(name)
+
+
+def read_thumbnail(name: str) -> Optional[bytes]:
+    """讀取縮圖，檔名不合法或不存在時回傳 None"""
+    if not is_thumbnail_name(name):
+        return None
+    return thumbnail_cache.get(name)
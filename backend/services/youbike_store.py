@@ -0,0 +1,197 @@
+"""
+YouBike 即時資料快照服務
+由 lifespan 啟動的背景任務定期更新，路線生成直接讀取記憶體中的最新快照；
+每個版本另外保存成檔案，行程池的工作行程啟動時載入一次，之後只依版本號讀取新的版本，
+不必每次工作都傳送整份快照
+"""
+import asyncio
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from services.paths import backend_path
+from services.spatial_index import GeoPointIndex
+from tsp_taipei_route_new import fetch_youbike_data
+
+# 更新間隔（秒）
+YOUBIKE_REFRESH_INTERVAL = int(os.getenv("YOUBIKE_REFRESH_INTERVAL", "60"))
+
+# 提供給工作行程的快照檔目錄（每個主行程使用自己的子目錄）
+YOUBIKE_SNAPSHOT_DIR = backend_path("YOUBIKE_SNAPSHOT_DIR", "cache", "youbike_snapshots")
+
+# 保留的快照檔版本數（排隊中的工作可能仍使用前幾個版本）
+_KEEP_PUBLISHED_VERSIONS = 3
+
+
+class YouBikeSnapshot:
+    """YouBike 資料快照（建立後不可修改，讀取端請勿更動 df）"""
+    def __init__(self, df: pd.DataFrame, version: int, fetched_at: datetime,
+                 station_index: GeoPointIndex, station_fingerprint: str):
+        self.df = df
+        self.version = version
+        self.fetched_at = fetched_at
+        # 站點座標索引，列順序與 df 相同
+        self.station_index = station_index
+        self.station_fingerprint = station_fingerprint
+
+
+def station_fingerprint(df: pd.DataFrame) -> str:
+    """站點組成（站號與座標，依列順序）的雜湊，用來判斷索引是否需要重建"""
+    digest = hashlib.sha1()
+    digest.update('\n'.join(df['sno'].astype(str)).encode('utf-8'))
+    digest.update(np.ascontiguousarray(df['latitude'].values, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(df['longitude'].values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+# 目前的快照（整個行程共用）
+_snapshot: Optional[YouBikeSnapshot] = None
+_refresh_lock = threading.RLock()
+_refresh_task: Optional[asyncio.Task] = None
+
+# 快照檔目錄（工作行程由 init_snapshot_worker 改為主行程的目錄）
+_snapshot_dir = os.path.join(YOUBIKE_SNAPSHOT_DIR, str(os.getpid()))
+
+
+def snapshot_directory() -> str:
+    """目前行程的快照檔目錄（作為工作行程初始化的參數）"""
+    return _snapshot_dir
+
+
+def _published_path(version: int) -> str:
+    return os.path.join(_snapshot_dir, f"v{version}.pkl")
+
+
+def _publish_snapshot(snapshot: YouBikeSnapshot):
+    """將快照保存成檔案（先寫暫存檔再改名），並刪除過舊的版本"""
+    os.makedirs(_snapshot_dir, exist_ok=True)
+    path = _published_path(snapshot.version)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    try:
+        os.remove(_published_path(snapshot.version - _KEEP_PUBLISHED_VERSIONS))
+    except FileNotFoundError:
+        pass
+
+
+def _load_published(version: int) -> YouBikeSnapshot:
+    with open(_published_path(version), "rb") as f:
+        return pickle.load(f)
+
+
+def init_snapshot_worker(directory: str):
+    """工作行程的初始化函式：使用主行程的快照檔目錄，並載入目前最新的快照"""
+    global _snapshot_dir, _snapshot
+    _snapshot_dir = directory
+    versions = [
+        int(os.path.basename(path)[1:-4])
+        for path in glob.glob(os.path.join(directory, "v*.pkl"))
+    ]
+    if versions:
+        _snapshot = _load_published(max(versions))
+
+
+def get_snapshot_version(version: int) -> YouBikeSnapshot:
+    """
+    取得指定版本的快照
+
+    與記憶體中的快照版本相同時直接使用；否則讀取快照檔，
+    較新的版本會取代工作行程記憶體中的快照，之後的工作不必再讀取
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    loaded = _load_published(version)
+    if snapshot is None or version > snapshot.version:
+        _snapshot = loaded
+    return loaded
+
+
+def remove_published_snapshots():
+    """刪除這個行程保存的快照檔（執行池關閉後呼叫）"""
+    shutil.rmtree(_snapshot_dir, ignore_errors=True)
+
+
+def refresh_youbike_snapshot() -> YouBikeSnapshot:
+    """抓取最新資料並替換快照（阻塞，請在背景執行緒呼叫）"""
+    global _snapshot
+    with _refresh_lock:
+        df = fetch_youbike_data()
+        version = 1 if _snapshot is None else _snapshot.version + 1
+
+        # 站點組成沒變時沿用舊索引，只有可借/可還數量會更新
+        fingerprint = station_fingerprint(df)
+        if _snapshot is not None and _snapshot.station_fingerprint == fingerprint:
+            station_index = _snapshot.station_index
+        else:
+            station_index = GeoPointIndex(df['latitude'].values, df['longitude'].values)
+            print(f"🗂️ 已重建 YouBike 站點索引")
+
+        snapshot = YouBikeSnapshot(df, version, datetime.now(), station_index, fingerprint)
+        # 先保存檔案再公開新版本，工作行程收到新版本號時一定讀得到
+        _publish_snapshot(snapshot)
+        _snapshot = snapshot
+        print(f"🔄 YouBike 快照已更新 (v{version}, {len(df)} 個站點)")
+        return _snapshot
+
+
+def get_youbike_snapshot() -> YouBikeSnapshot:
+    """
+    取得目前的 YouBike 快照
+
+    背景任務已啟動時只是讀取記憶體，不會阻塞；
+    若尚未有任何快照（例如直接執行腳本），才會同步抓取一次。
+    """
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+
+    with _refresh_lock:
+        if _snapshot is not None:
+            return _snapshot
+        return refresh_youbike_snapshot()
+
+
+async def _refresh_loop(interval: int):
+    """定期更新快照"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(refresh_youbike_snapshot)
+        except Exception as e:
+            print(f"⚠️ YouBike 資料更新失敗，沿用舊快照: {e}")
+
+
+async def start_youbike_refresher(interval: int = YOUBIKE_REFRESH_INTERVAL):
+    """啟動背景更新任務（於 lifespan 呼叫）"""
+    global _refresh_task
+    try:
+        await asyncio.to_thread(refresh_youbike_snapshot)
+    except Exception as e:
+        print(f"⚠️ YouBike 初始資料抓取失敗: {e}")
+
+    _refresh_task = asyncio.create_task(_refresh_loop(interval))
+    print(f"✅ YouBike 背景更新已啟動（每 {interval} 秒）")
+
+
+async def stop_youbike_refresher():
+    """停止背景更新任務"""
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
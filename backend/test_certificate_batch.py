@@ -0,0 +1,55 @@
+"""
+測試批次發放證書（使用自行產生的模板圖片，會話以串列代替 MongoDB 游標）
+"""
+import os
+import zipfile
+from datetime import datetime
+
+from PIL import Image
+
+from services.certificate_batch import (
+    MANIFEST_NAME, certificate_file_name, load_manifest, render_certificates, write_archive
+)
+
+
+def make_template(path):
+    Image.new('RGB', (800, 600), (240, 230, 200)).save(path)
+    return str(path)
+
+
+def make_sessions(count, end_time=datetime(2025, 11, 8, 14, 30)):
+    return [
+        {"userId": f"user-{i}", "shape": "t", "end_time": end_time, "duration_hours": 3.0}
+        for i in range(count)
+    ]
+
+
+def test_file_name_is_safe():
+    assert certificate_file_name("demo-user-123", "t", "0" * 40) == "certificate_T_demo-user-123.png"
+    name = certificate_file_name("../evil/user", "T", "abcdef0123" + "0" * 30)
+    assert "/" not in name and name.endswith("_abcdef01.png")
+
+
+def test_render_resume_and_archive(tmp_path):
+    """第一次全部繪製，重新執行時略過，完成時間改變的會話重新繪製"""
+    template = make_template(tmp_path / 'template.png')
+    output_dir = str(tmp_path / 'out')
+
+    stats = render_certificates(make_sessions(5), output_dir, total=5, template_path=template,
+                                workers=2, max_pending=2)
+    assert (stats['rendered'], stats['skipped'], stats['failed']) == (5, 0, 0)
+    files = sorted(name for name in os.listdir(output_dir) if name.endswith('.png'))
+    assert files == [f"certificate_T_user-{i}.png" for i in range(5)]
+    with open(os.path.join(output_dir, files[0]), 'rb') as f:
+        assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+
+    sessions = make_sessions(5)
+    sessions[1]["end_time"] = datetime(2025, 11, 9, 9, 0)
+    stats = render_certificates(sessions, output_dir, template_path=template, workers=1)
+    assert (stats['rendered'], stats['skipped']) == (1, 4)
+    assert len(load_manifest(output_dir)) == 5
+
+    archive_path = str(tmp_path / 'certificates.zip')
+    assert write_archive(output_dir, archive_path) == 5
+    with zipfile.ZipFile(archive_path) as archive:
+        assert sorted(archive.namelist()) == sorted(files + [MANIFEST_NAME])
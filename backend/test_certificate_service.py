@@ -0,0 +1,137 @@
+"""
+測試證書繪製器
+使用自行產生的模板圖片（不依賴 Certificate template.png）；
+直接執行可看吞吐量比較：python test_certificate_service.py [模板路徑]
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageChops
+
+from services.certificate_cache import certificate_cache_key
+from services.certificate_service import CertificateRenderer, certificate_template_version
+
+TEMPLATE_SIZE = (2000, 1414)
+
+
+def make_template(path):
+    """產生漸層底色的模板圖片"""
+    width, height = TEMPLATE_SIZE
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x / width * 255, y / height * 255, np.full(x.shape, 200.0)], axis=-1).astype(np.uint8)
+    Image.fromarray(pixels).save(path)
+    return str(path)
+
+
+def decode(data):
+    return Image.open(io.BytesIO(data)).convert('RGB')
+
+
+def test_render_draws_only_name_and_date(tmp_path):
+    """不同名稱與日期只影響名稱與日期兩行，固定文字已預先合成"""
+    renderer = CertificateRenderer(make_template(tmp_path / 'template.png'))
+    first = decode(renderer.render("唐翔千", "2025-11-08T14:30:00"))
+    second = decode(renderer.render("王小明", "2024-01-02T08:00:00"))
+
+    assert first.size == TEMPLATE_SIZE
+    diff = np.asarray(ImageChops.difference(first, second)).any(axis=(1, 2))
+    changed_rows = np.flatnonzero(diff)
+    assert len(changed_rows) > 0
+    # 固定文字（800 ~ 1010 像素）不受影響
+    assert not diff[800:1010].any()
+    assert changed_rows.min() >= 600
+
+    template = decode(open(tmp_path / 'template.png', 'rb').read())
+    assert np.asarray(ImageChops.difference(template, decode(renderer.render("", "bad")))).any()
+
+
+def test_concurrent_renders_are_identical(tmp_path):
+    """多執行緒同時繪製的結果與單獨繪製相同"""
+    renderer = CertificateRenderer(make_template(tmp_path / 'template.png'), compress_level=1)
+    expected = renderer.render("唐翔千", "2025-11-08T14:30:00")
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: renderer.render("唐翔千", "2025-11-08T14:30:00"), range(8)))
+    assert all(result == expected for result in results)
+
+
+def test_template_version_follows_template_content(tmp_path):
+    path = make_template(tmp_path / 'template.png')
+    version = CertificateRenderer(path).template_version
+    assert CertificateRenderer(path).template_version == version
+
+    Image.new('RGB', TEMPLATE_SIZE, (255, 255, 255)).save(path)
+    assert CertificateRenderer(path).template_version != version
+
+
+def test_certificate_cache_key_and_template_version(tmp_path):
+    """快取鍵隨完成時間與模板版本改變，模板版本與繪製器相同"""
+    path = make_template(tmp_path / 'template.png')
+    version = certificate_template_version(path)
+    assert version == CertificateRenderer(path).template_version
+
+    end_time = datetime(2025, 11, 8, 14, 30)
+    key = certificate_cache_key("u1", "t", end_time, version)
+    assert key == certificate_cache_key("u1", "T", end_time, version)
+    assert key != certificate_cache_key("u1", "T", datetime(2025, 11, 9), version)
+    assert key != certificate_cache_key("u1", "T", end_time, "other")
+    assert key != certificate_cache_key("u2", "T", end_time, version)
+
+
+def benchmark(template_path, count=40):
+    """比較每次重新載入模板、共用繪製器與執行池（行程池）的吞吐量"""
+    from services.executor import JobExecutor
+    from services.certificate_service import generate_certificate
+
+    os.environ["CERTIFICATE_TEMPLATE_PATH"] = template_path
+    renderer = CertificateRenderer(template_path)
+
+    start = time.perf_counter()
+    for i in range(count // 4):
+        CertificateRenderer(template_path).render(f"使用者{i}", "2025-11-08T14:30:00")
+    reload_rate = (count // 4) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(count):
+        renderer.render(f"使用者{i}", "2025-11-08T14:30:00")
+    shared_rate = count / (time.perf_counter() - start)
+
+    async def run_pool():
+        executor = JobExecutor(cpu_executor="process", max_queued=count)
+        executor.start()
+        try:
+            # 先讓每個行程載入一次模板
+            await asyncio.gather(*(
+                executor.run_cpu(generate_certificate, "暖身", "T", "2025-11-08T14:30:00", 1.0)
+                for _ in range(executor.cpu_workers)
+            ))
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                executor.run_cpu(generate_certificate, f"使用者{i}", "T", "2025-11-08T14:30:00", 1.0)
+                for i in range(count)
+            ))
+            return count / (time.perf_counter() - start), executor.cpu_workers
+        finally:
+            await executor.shutdown()
+
+    pool_rate, workers = asyncio.run(run_pool())
+
+    print(f"模板尺寸: {renderer.base.size}")
+    print(f"每次重新載入模板: {reload_rate:.1f} 張/秒")
+    print(f"共用繪製器:       {shared_rate:.1f} 張/秒")
+    print(f"行程池（{workers} 個）: {pool_rate:.1f} 張/秒")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        benchmark(sys.argv[1])
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            benchmark(make_template(os.path.join(tmp, 'template.png')))
+
@@ -0,0 +1,201 @@
+"""
+測試打卡寫入緩衝（以記錄寫入內容的函式代替 MongoDB）
+直接執行可模擬尖峰打卡，比較直接寫入與緩衝寫入的延遲與寫入次數：python test_checkin_buffer.py
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.checkin_buffer import CheckinBufferClosedError, CheckinBufferFullError, CheckinWriteBuffer
+
+
+class RecordingWriter:
+    """記錄每一批寫入的打卡，可暫停寫入或指定前幾次失敗"""
+    def __init__(self, fail_first: int = 0):
+        self.batches = []
+        self.fail_first = fail_first
+        self.calls = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def __call__(self, batch):
+        self.calls += 1
+        await self.gate.wait()
+        if self.calls <= self.fail_first:
+            raise RuntimeError("寫入失敗")
+        self.batches.append([item["waypointId"] for item in batch])
+
+
+def checkin(i):
+    return {"userId": "u1", "shape": "T", "waypointId": f"wp{i}"}
+
+
+def test_flushes_by_size_and_by_time(tmp_path):
+    """累積到批次大小時立即寫入，不足一批時等待時間到再寫入"""
+    async def run():
+        writer = RecordingWriter()
+        buffer = CheckinWriteBuffer(max_size=100, batch_size=4, flush_interval=0.05, writer=writer,
+                                    spill_path=str(tmp_path / "spill.jsonl"))
+        buffer.start()
+        for i in range(6):
+            await buffer.submit(checkin(i))
+        await asyncio.sleep(0.01)
+        after_size_trigger = list(writer.batches)
+        await asyncio.sleep(0.1)
+        after_time_trigger = list(writer.batches)
+        await buffer.stop()
+        return after_size_trigger, after_time_trigger, buffer.stats()
+
+    after_size_trigger, after_time_trigger, stats = asyncio.run(run())
+    assert after_size_trigger == [["wp0", "wp1", "wp2", "wp3"]]
+    assert after_time_trigger == [["wp0", "wp1", "wp2", "wp3"], ["wp4", "wp5"]]
+    assert (stats["written"], stats["batches"], stats["queued"]) == (6, 2, 0)
+
+
+def test_backpressure_when_full_and_flush_on_stop(tmp_path):
+    """寫入卡住時佇列滿了會拒絕，停止時寫入所有剩下的打卡"""
+    async def run():
+        writer = RecordingWriter()
+        writer.gate.clear()
+        buffer = CheckinWriteBuffer(max_size=3, batch_size=2, flush_interval=0.01,
+                                    enqueue_timeout=0.05, writer=writer,
+                                    spill_path=str(tmp_path / "spill.jsonl"))
+        buffer.start()
+        accepted = 0
+        with pytest.raises(CheckinBufferFullError):
+            for i in range(10):
+                await buffer.submit(checkin(i))
+                accepted += 1
+        writer.gate.set()
+        await buffer.stop()
+        return accepted, writer.batches, buffer.stats()
+
+    accepted, batches, stats = asyncio.run(run())
+    # 一批（2 筆）正在寫入，佇列中還能放 3 筆
+    assert accepted == 5
+    assert [wp for batch in batches for wp in batch] == [f"wp{i}" for i in range(5)]
+    assert stats["rejected"] == 1 and stats["spilled"] == 0
+
+
+def test_retries_failed_batches_until_written(tmp_path):
+    """寫入失敗的批次持續重試，不會捨棄"""
+    async def run():
+        writer = RecordingWriter(fail_first=4)
+        buffer = CheckinWriteBuffer(batch_size=10, flush_interval=0.01, writer=writer, retries=1,
+                                    backoff_max=0.02, spill_path=str(tmp_path / "spill.jsonl"))
+        buffer.start()
+        await buffer.submit(checkin(0))
+        await asyncio.sleep(0.2)
+        await buffer.submit(checkin(1))
+        await buffer.stop()
+        return writer.batches, buffer.stats()
+
+    batches, stats = asyncio.run(run())
+    assert batches == [["wp0"], ["wp1"]]
+    assert (stats["written"], stats["retried"], stats["spilled"], stats["pending"]) == (2, 4, 0, 0)
+
+
+def test_spills_on_stop_and_recovers_on_start(tmp_path):
+    """停止時仍無法寫入的打卡保存到暫存檔，下次啟動時以相同的 _id 重新寫入"""
+    spill_path = tmp_path / "spill.jsonl"
+
+    async def run():
+        failing = RecordingWriter(fail_first=100)
+        buffer = CheckinWriteBuffer(batch_size=10, flush_interval=0.01, writer=failing, retries=1,
+                                    backoff_max=0.01, spill_path=str(spill_path))
+        buffer.start()
+        submitted = [checkin(i) for i in range(3)]
+        for item in submitted:
+            await buffer.submit(item)
+        await buffer.stop()
+        spilled_stats = buffer.stats()
+
+        written = []
+
+        async def writer(batch):
+            written.extend(batch)
+
+        buffer = CheckinWriteBuffer(batch_size=2, writer=writer, spill_path=str(spill_path))
+        buffer.start()
+        await buffer.stop()
+        return submitted, spilled_stats, written, buffer.stats()
+
+    submitted, spilled_stats, written, stats = asyncio.run(run())
+    assert (spilled_stats["written"], spilled_stats["spilled"], spilled_stats["pending"]) == (0, 3, 0)
+    assert [(item["_id"], item["waypointId"]) for item in written] == \
+        [(item["_id"], item["waypointId"]) for item in submitted]
+    assert (stats["recovered"], stats["written"], stats["batches"]) == (3, 3, 2)
+    assert not spill_path.exists()
+
+
+def test_submit_after_stop_is_rejected(tmp_path):
+    """停止後不再接收；停止前正在等待空間的打卡仍會寫入"""
+    async def run():
+        writer = RecordingWriter()
+        writer.gate.clear()
+        buffer = CheckinWriteBuffer(max_size=1, batch_size=1, flush_interval=0.01,
+                                    enqueue_timeout=1, writer=writer,
+                                    spill_path=str(tmp_path / "spill.jsonl"))
+        buffer.start()
+        await buffer.submit(checkin(0))
+        await asyncio.sleep(0.02)  # wp0 寫入中
+        await buffer.submit(checkin(1))  # 佇列已滿
+        waiting = asyncio.create_task(buffer.submit(checkin(2)))
+        await asyncio.sleep(0.01)
+        stopping = asyncio.create_task(buffer.stop())
+        await asyncio.sleep(0.01)
+        with pytest.raises(CheckinBufferClosedError):
+            await buffer.submit(checkin(3))
+        writer.gate.set()
+        await asyncio.gather(waiting, stopping)
+        return writer.batches, buffer.stats()
+
+    batches, stats = asyncio.run(run())
+    assert batches == [["wp0"], ["wp1"], ["wp2"]]
+    assert (stats["written"], stats["pending"]) == (3, 0)
+
+
+async def benchmark(requests=2000, concurrency=200, write_ms=5.0, max_inflight_writes=16):
+    """模擬資料庫：每次寫入耗時 write_ms，同時進行的寫入不超過 max_inflight_writes"""
+    limit = asyncio.Semaphore(max_inflight_writes)
+    writes = 0
+
+    async def database_write(_):
+        nonlocal writes
+        async with limit:
+            writes += 1
+            await asyncio.sleep(write_ms / 1000)
+
+    async def run(handle):
+        nonlocal writes
+        writes = 0
+        latencies = []
+        pending = asyncio.Semaphore(concurrency)
+
+        async def request(i):
+            async with pending:
+                start = time.perf_counter()
+                await handle(checkin(i))
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(request(i) for i in range(requests)))
+        latencies.sort()
+        return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+    direct = await run(lambda item: database_write([item]))
+    direct_writes = writes
+
+    buffer = CheckinWriteBuffer(writer=database_write)
+    buffer.start()
+    buffered = await run(buffer.submit)
+    await buffer.stop()
+    buffered_writes = writes
+
+    print(f"{requests} 次打卡，同時 {concurrency} 個請求，每次寫入 {write_ms} ms")
+    print(f"直接寫入: p50 {direct[0]:.1f} ms, p99 {direct[1]:.1f} ms, 寫入 {direct_writes} 次")
+    print(f"緩衝寫入: p50 {buffered[0]:.1f} ms, p99 {buffered[1]:.1f} ms, 寫入 {buffered_writes} 次")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
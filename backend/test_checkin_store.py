@@ -0,0 +1,256 @@
+"""
+測試打卡寫入（需要本機 MongoDB，連不上時略過；MONGODB_URL 指定其他伺服器）
+直接執行可比較舊版（多次往返）與新版的打卡延遲：python test_checkin_store.py [次數]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import AutoReconnect
+
+from database import Collections
+from services.checkin_store import (
+    IdempotencyKeyConflictError, checkin_batch_key, dedupe_checkins, record_checkin, record_checkin_batch,
+    write_checkins
+)
+
+TEST_DATABASE_NAME = "townpass2025_test_checkins"
+
+
+async def reset_database(client, total_waypoints=10, user_ids=("u1",)):
+    db = client[TEST_DATABASE_NAME]
+    await db[Collections.CHECKINS].delete_many({})
+    await db[Collections.USER_PROGRESS].delete_many({})
+    await db[Collections.USER_PROGRESS].insert_many([
+        {
+            "userId": user_id,
+            "shape": "T",
+            "checkins": [],
+            "total_waypoints": total_waypoints,
+            "completed_waypoints": 0,
+            "completion_rate": 0.0,
+            "last_updated": datetime(2025, 1, 1)
+        }
+        for user_id in user_ids
+    ])
+    return db
+
+
+def make_checkin(user_id, waypoint_id):
+    return {
+        "userId": user_id,
+        "waypointId": waypoint_id,
+        "shape": "T",
+        "timestamp": datetime.now().replace(microsecond=0),
+        "location": {"lat": 25.03, "lon": 121.56},
+        "verified": True,
+        "distance": 20.0
+    }
+
+
+def test_dedupe_and_batch_key():
+    """批次內同一使用者、圖形與路徑點只保留第一筆；冪等鍵隨內容改變"""
+    checkins = [make_checkin("u1", "wp1"), make_checkin("u1", "wp2"), make_checkin("u1", "wp1"),
+                make_checkin("u2", "wp1"), make_checkin("u1", "wp2")]
+    assert dedupe_checkins(checkins) == {2: 0, 4: 1}
+
+    items = [{"userId": "u1", "shape": "T", "waypointId": "wp1", "timestamp": None}]
+    assert checkin_batch_key(items) == checkin_batch_key([dict(items[0])])
+    assert checkin_batch_key(items) != checkin_batch_key([{**items[0], "timestamp": datetime(2025, 1, 1)}])
+
+
+class FailingInsertDatabase:
+    """打卡寫入失敗、記錄進度更新呼叫的資料庫（確認寫入順序，不需要 MongoDB）"""
+    def __init__(self):
+        self.progress_updates = []
+
+    def __getitem__(self, name):
+        return self
+
+    async def insert_one(self, document):
+        await asyncio.sleep(0)
+        raise AutoReconnect("連線中斷")
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(0)
+        raise AutoReconnect("連線中斷")
+
+    async def find_one_and_update(self, *args, **kwargs):
+        self.progress_updates.append(args)
+
+    async def bulk_write(self, requests, ordered=True):
+        self.progress_updates.append(requests)
+
+
+def test_failed_insert_does_not_advance_progress():
+    """打卡記錄寫入失敗時不更新進度"""
+    db = FailingInsertDatabase()
+    with pytest.raises(AutoReconnect):
+        asyncio.run(record_checkin(db, make_checkin("u1", "wp1")))
+    with pytest.raises(AutoReconnect):
+        asyncio.run(write_checkins(db, [make_checkin("u1", "wp1")]))
+    assert db.progress_updates == []
+
+
+def test_concurrent_checkins_are_counted_once(mongodb_url):
+    """同時打卡（含重複）時每個路徑點只計算一次，完成率在伺服器上計算"""
+    async def run():
+        client = AsyncIOMotorClient(mongodb_url)
+        try:
+            db = await reset_database(client, total_waypoints=8)
+            waypoints = [f"wp{i % 5}" for i in range(20)]
+            await asyncio.gather(*(record_checkin(db, make_checkin("u1", wp)) for wp in waypoints))
+            progress = await db[Collections.USER_PROGRESS].find_one({"userId": "u1", "shape": "T"})
+            checkin_count = await db[Collections.CHECKINS].count_documents({"userId": "u1"})
+            return progress, checkin_count
+        finally:
+            client.close()
+
+    progress, checkin_count = asyncio.run(run())
+    assert sorted(progress['checkins']) == [f"wp{i}" for i in range(5)]
+    assert progress['completed_waypoints'] == 5
+    assert progress['completion_rate'] == pytest.approx(5 / 8)
+    assert checkin_count == 20
+
+
+def test_duplicate_checkin_keeps_progress_and_missing_progress_returns_none(mongodb_url):
+    async def run():
+        client = AsyncIOMotorClient(mongodb_url)
+        try:
+            db = await reset_database(client)
+            first = await record_checkin(db, make_checkin("u1", "wp1"))
+            before = await db[Collections.USER_PROGRESS].find_one({"userId": "u1"})
+            again = await record_checkin(db, make_checkin("u1", "wp1"))
+            after = await db[Collections.USER_PROGRESS].find_one({"userId": "u1"})
+            missing = await record_checkin(db, make_checkin("nobody", "wp1"))
+            return first, before, again, after, missing
+        finally:
+            client.close()
+
+    first, before, again, after, missing = asyncio.run(run())
+    assert first == {"completed_waypoints": 1, "total_waypoints": 10, "completion_rate": 0.1}
+    assert again == first
+    assert after['checkins'] == ["wp1"]
+    assert after['last_updated'] == before['last_updated']
+    assert missing is None
+
+
+def test_checkin_batch_is_deduped_and_idempotent(mongodb_url):
+    """批次打卡只寫入不重複的記錄，以同一個冪等鍵重送時回傳先前的結果"""
+    async def run():
+        client = AsyncIOMotorClient(mongodb_url)
+        try:
+            db = await reset_database(client, total_waypoints=4, user_ids=("u1", "u2"))
+            await db[Collections.CHECKIN_BATCHES].delete_many({})
+            checkins = [make_checkin("u1", "wp1"), make_checkin("u1", "wp2"), make_checkin("u1", "wp1"),
+                        make_checkin("u2", "wp3")]
+            fingerprint = checkin_batch_key(checkins)
+            first, first_replayed = await record_checkin_batch(db, "batch-1", checkins, fingerprint)
+            again, again_replayed = await record_checkin_batch(db, "batch-1", checkins, fingerprint)
+            progress = {
+                p['userId']: p async for p in db[Collections.USER_PROGRESS].find({}, {"_id": 0})
+            }
+            checkin_count = await db[Collections.CHECKINS].count_documents({})
+            return first, first_replayed, again, again_replayed, progress, checkin_count
+        finally:
+            client.close()
+
+    first, first_replayed, again, again_replayed, progress, checkin_count = asyncio.run(run())
+    assert not first_replayed and again_replayed
+    assert again == first
+    assert (first['recorded'], first['duplicates']) == (3, 1)
+    assert [r['status'] for r in first['results']] == ["recorded", "recorded", "duplicate", "recorded"]
+    assert first['results'][2]['duplicateOf'] == 0
+    assert checkin_count == 3
+    assert progress['u1']['checkins'] == ["wp1", "wp2"]
+    assert progress['u1']['completion_rate'] == pytest.approx(0.5)
+    assert progress['u2']['completed_waypoints'] == 1
+
+
+def test_reused_idempotency_key_is_rejected_or_scoped_to_user(mongodb_url):
+    """同一使用者以相同冪等鍵送出不同內容時拒絕；其他使用者使用相同冪等鍵時正常寫入"""
+    async def run():
+        client = AsyncIOMotorClient(mongodb_url)
+        try:
+            db = await reset_database(client, total_waypoints=4, user_ids=("u1", "u2"))
+            await db[Collections.CHECKIN_BATCHES].delete_many({})
+            first = [make_checkin("u1", "wp1")]
+            await record_checkin_batch(db, "reused", first, checkin_batch_key(first))
+
+            changed = [make_checkin("u1", "wp2")]
+            with pytest.raises(IdempotencyKeyConflictError):
+                await record_checkin_batch(db, "reused", changed, checkin_batch_key(changed))
+
+            other = [make_checkin("u2", "wp1")]
+            result, replayed = await record_checkin_batch(db, "reused", other, checkin_batch_key(other))
+            progress = await db[Collections.USER_PROGRESS].find_one({"userId": "u2"})
+            checkin_count = await db[Collections.CHECKINS].count_documents({})
+            return result, replayed, progress, checkin_count
+        finally:
+            client.close()
+
+    result, replayed, progress, checkin_count = asyncio.run(run())
+    assert not replayed
+    assert result['recorded'] == 1
+    assert progress['checkins'] == ["wp1"]
+    assert checkin_count == 2
+
+
+async def legacy_checkin(db, checkin_data):
+    """舊版寫入流程（新增、讀取、更新、再讀取、再更新），作為比較基準"""
+    await db[Collections.CHECKINS].insert_one(checkin_data)
+    query = {"userId": checkin_data["userId"], "shape": checkin_data["shape"]}
+    progress = await db[Collections.USER_PROGRESS].find_one(query)
+    if progress and checkin_data["waypointId"] not in progress['checkins']:
+        await db[Collections.USER_PROGRESS].update_one(query, {
+            "$push": {"checkins": checkin_data["waypointId"]},
+            "$inc": {"completed_waypoints": 1},
+            "$set": {"last_updated": datetime.now()}
+        })
+        updated = await db[Collections.USER_PROGRESS].find_one(query)
+        await db[Collections.USER_PROGRESS].update_one(query, {
+            "$set": {"completion_rate": updated['completed_waypoints'] / updated['total_waypoints']}
+        })
+
+
+async def benchmark(mongodb_url, count=500, concurrency=20):
+    """比較舊版與新版的單次延遲與同時打卡的吞吐量"""
+    client = AsyncIOMotorClient(mongodb_url)
+    user_ids = [f"u{i}" for i in range(concurrency)]
+    try:
+        for name, write in (("舊版（最多 5 次往返）", legacy_checkin), ("新版（2 次往返：寫入打卡後更新進度）", record_checkin)):
+            db = await reset_database(client, total_waypoints=count, user_ids=user_ids)
+
+            latencies = []
+            for i in range(count):
+                start = time.perf_counter()
+                await write(db, make_checkin("u0", f"wp{i}"))
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            db = await reset_database(client, total_waypoints=count, user_ids=user_ids)
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                write(db, make_checkin(user_ids[i % concurrency], f"wp{i}")) for i in range(count)
+            ))
+            throughput = count / (time.perf_counter() - start)
+
+            latencies.sort()
+            print(f"{name}: p50 {statistics.median(latencies):.2f} ms, "
+                  f"p95 {latencies[int(len(latencies) * 0.95)]:.2f} ms, "
+                  f"同時 {concurrency} 位使用者 {throughput:.0f} 次/秒")
+        await client.drop_database(TEST_DATABASE_NAME)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    from conftest import MONGODB_URL, mongo_available
+
+    if not mongo_available():
+        print(f"❌ 無法連線到 MongoDB: {MONGODB_URL}")
+        sys.exit(1)
+    asyncio.run(benchmark(MONGODB_URL, int(sys.argv[1]) if len(sys.argv) > 1 else 500))
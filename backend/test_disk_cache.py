@@ -0,0 +1,54 @@
+"""
+測試磁碟 LRU 快取
+"""
+import os
+import time
+
+from services.disk_cache import DiskLRUCache
+
+
+def test_get_and_put(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=1000, suffix=".png")
+    assert cache.get("a") is None
+
+    cache.put("a", b"x" * 10)
+    assert cache.get("a") == b"x" * 10
+    assert "a" in cache
+    assert os.path.exists(tmp_path / "a.png")
+
+    cache.put("a", b"y" * 20)
+    assert cache.get("a") == b"y" * 20
+    assert cache.stats()["bytes"] == 20
+
+
+def test_evicts_least_recently_used(tmp_path):
+    """超過容量時刪除最久未讀取（或 touch）的檔案"""
+    cache = DiskLRUCache(str(tmp_path), max_bytes=300)
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 100)
+    cache.get("a")
+    assert cache.touch("b")
+    assert not cache.touch("missing")
+
+    cache.put("d", b"x" * 100)
+
+    assert "c" not in cache
+    assert not os.path.exists(tmp_path / "c")
+    assert all(key in cache for key in ("a", "b", "d"))
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 300
+
+
+def test_order_survives_restart(tmp_path):
+    """重新啟動後依檔案時間恢復使用順序"""
+    cache = DiskLRUCache(str(tmp_path), max_bytes=300)
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 100)
+        time.sleep(0.01)
+    cache.get("a")
+
+    restarted = DiskLRUCache(str(tmp_path), max_bytes=300)
+    restarted.put("d", b"x" * 100)
+    assert "b" not in restarted
+    assert restarted.get("a") == b"x" * 100
+    assert restarted.stats()["files"] == 3
@@ -0,0 +1,64 @@
+"""
+測試道路距離矩陣服務與可達性篩選
+"""
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+import services.distance_matrix as distance_matrix
+from services.geodesic import haversine_many_to_many
+from tsp_taipei_route_new import filter_youbike_by_time
+
+
+class FakeTableClient:
+    """以直線距離 x 1.3 模擬 OSRM table，並記錄每次請求的座標數"""
+    def __init__(self):
+        self.request_sizes = []
+
+    async def table(self, sources, destinations):
+        self.request_sizes.append(len(sources) + len(destinations))
+        src = np.array(sources)
+        dst = np.array(destinations)
+        distances = haversine_many_to_many(src[:, 0], src[:, 1], dst[:, 0], dst[:, 1]) * 1300
+        return {'distances': distances.tolist(), 'durations': (distances / 4).tolist()}
+
+
+def random_points(n, seed):
+    rng = np.random.default_rng(seed)
+    return list(zip(rng.uniform(25.0, 25.1, n), rng.uniform(121.5, 121.6, n)))
+
+
+def test_osrm_table_is_chunked_and_reassembled(monkeypatch):
+    """超過座標上限時切成多個請求，合併後與一次計算相同"""
+    client = FakeTableClient()
+    monkeypatch.setattr(distance_matrix, 'get_routing_client', lambda: client)
+    monkeypatch.setattr(distance_matrix, 'OSRM_TABLE_MAX_COORDS', 20)
+    sources, destinations = random_points(7, 0), random_points(45, 1)
+
+    distance_km, duration_min = asyncio.run(distance_matrix._osrm_table(sources, destinations))
+
+    src, dst = np.array(sources), np.array(destinations)
+    expected = haversine_many_to_many(src[:, 0], src[:, 1], dst[:, 0], dst[:, 1]) * 1.3
+    assert distance_km.shape == (7, 45)
+    assert np.allclose(distance_km, expected)
+    assert np.allclose(duration_min, expected * 1000 / 4 / 60)
+    assert max(client.request_sizes) <= 20
+    assert len(client.request_sizes) > 1
+
+
+def test_filter_uses_ride_times_when_given():
+    """提供實際騎行時間時以其篩選，未列出的站點視為無法到達"""
+    df = pd.DataFrame({
+        'sno': ['A', 'B', 'C', 'D'],
+        'latitude': [25.030, 25.031, 25.032, 25.033],
+        'longitude': [121.550, 121.551, 121.552, 121.553],
+    })
+
+    estimated = filter_youbike_by_time(df, 25.030, 121.550, max_time_min=20)
+    assert list(estimated['sno']) == ['A', 'B', 'C', 'D']
+
+    ride_times = pd.Series({'A': 0.0, 'B': 25.0, 'C': 5.0})
+    filtered = filter_youbike_by_time(df, 25.030, 121.550, max_time_min=20, ride_times=ride_times)
+    assert list(filtered['sno']) == ['A', 'C']
+    assert list(filtered['ride_time']) == [0.0, 5.0]
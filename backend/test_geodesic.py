@@ -0,0 +1,65 @@
+"""
+測試向量化 haversine
+結果需與 tsp_taipei_route_new.haversine_distance 一致
+"""
+import numpy as np
+
+from services.geodesic import haversine_many_to_many, haversine_one_to_many, haversine_pairwise
+from tsp_taipei_route_new import haversine_distance
+
+
+def random_points(n, seed=0):
+    """在台北市範圍內產生隨機座標"""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(24.96, 25.13, n), rng.uniform(121.45, 121.62, n)
+
+
+def test_one_to_many_matches_scalar():
+    """單點對多點距離與逐一計算相同"""
+    lats, lons = random_points(500)
+    lat, lon = 25.0330, 121.5654
+
+    result = haversine_one_to_many(lat, lon, lats, lons)
+    expected = [haversine_distance(lat, lon, a, b) for a, b in zip(lats, lons)]
+
+    assert result.shape == (500,)
+    np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_many_to_many_matches_scalar():
+    """距離矩陣與逐一計算相同"""
+    lats1, lons1 = random_points(12, seed=1)
+    lats2, lons2 = random_points(300, seed=2)
+
+    result = haversine_many_to_many(lats1, lons1, lats2, lons2)
+    expected = [
+        [haversine_distance(a, b, c, d) for c, d in zip(lats2, lons2)]
+        for a, b in zip(lats1, lons1)
+    ]
+
+    assert result.shape == (12, 300)
+    np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_pairwise_matches_scalar():
+    """逐對距離與逐一計算相同"""
+    lats1, lons1 = random_points(200, seed=3)
+    lats2, lons2 = random_points(200, seed=4)
+
+    result = haversine_pairwise(lats1, lons1, lats2, lons2)
+    expected = [haversine_distance(a, b, c, d) for a, b, c, d in zip(lats1, lons1, lats2, lons2)]
+
+    assert result.shape == (200,)
+    np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_same_point_is_zero():
+    """同一點距離為 0"""
+    assert haversine_one_to_many(25.0, 121.5, [25.0], [121.5])[0] == 0
+    assert haversine_many_to_many([25.0], [121.5], [25.0], [121.5])[0, 0] == 0
+
+
+def test_empty_input():
+    """空陣列回傳空結果"""
+    assert haversine_one_to_many(25.0, 121.5, [], []).shape == (0,)
+    assert haversine_many_to_many([25.0], [121.5], [], []).shape == (1, 0)
@@ -0,0 +1,104 @@
+"""
+測試 MongoDB 索引（explain 部分需要本機 MongoDB，連不上時略過）
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+from database import Collections
+from services.indexes import INDEXES, ensure_indexes
+
+TEST_DATABASE_NAME = "townpass2025_test_indexes"
+
+# 常用查詢：(集合, 查詢條件, 排序欄位)
+HOT_QUERIES = [
+    # get_route_detail / complete_route / get_certificate
+    (Collections.ROUTE_SESSIONS, {"userId": "u1", "shape": "T", "status": "completed"}, []),
+    # start_route
+    (Collections.ROUTE_SESSIONS, {"userId": "u1", "shape": "T"}, []),
+    # check_in 的進度更新、進度查詢（指定 / 不指定圖形）
+    (Collections.USER_PROGRESS, {"userId": "u1", "shape": "T"}, []),
+    (Collections.USER_PROGRESS, {"userId": "u1"}, []),
+    # 進度查詢的打卡分頁（指定 / 不指定圖形）
+    (Collections.CHECKINS, {"userId": "u1", "shape": "T"}, ["timestamp", "_id"]),
+    (Collections.CHECKINS, {"userId": "u1"}, ["timestamp", "_id"]),
+]
+
+
+def index_supports(index_keys, filter_fields, sort_fields):
+    """索引的前綴是否涵蓋查詢條件，且接著是排序欄位"""
+    prefix = []
+    for key in index_keys:
+        if key not in filter_fields:
+            break
+        prefix.append(key)
+    if not prefix:
+        return False
+    if not sort_fields:
+        return True
+    return set(prefix) == set(filter_fields) and index_keys[len(prefix):len(prefix) + len(sort_fields)] == sort_fields
+
+
+def test_every_hot_query_has_a_declared_index():
+    for collection, query, sort_fields in HOT_QUERIES:
+        declared = [list(model.document["key"].keys()) for model in INDEXES[collection]]
+        assert any(index_supports(keys, list(query), sort_fields) for keys in declared), (collection, query)
+
+
+def plan_stages(plan):
+    """explain 結果中所有的 stage 名稱"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def test_hot_queries_use_indexes(mongodb_url):
+    """建立索引可重複執行，每個常用查詢的執行計畫都使用索引"""
+    async def create():
+        client = AsyncIOMotorClient(mongodb_url)
+        try:
+            await client.drop_database(TEST_DATABASE_NAME)
+            db = client[TEST_DATABASE_NAME]
+            start = datetime(2025, 11, 8, 14, 0)
+            await db[Collections.ROUTE_SESSIONS].insert_many([
+                {"userId": f"u{i}", "shape": "T", "status": "completed", "start_time": start} for i in range(50)
+            ])
+            await db[Collections.USER_PROGRESS].insert_many([
+                {"userId": f"u{i}", "shape": "T", "checkins": []} for i in range(50)
+            ])
+            await db[Collections.CHECKINS].insert_many([
+                {"userId": f"u{i % 50}", "shape": "T", "waypointId": f"wp{i}", "timestamp": start + timedelta(minutes=i)}
+                for i in range(500)
+            ])
+            first = await ensure_indexes(db)
+            second = await ensure_indexes(db)
+            return first, second
+        finally:
+            client.close()
+
+    first, second = asyncio.run(create())
+    assert set(first) == set(INDEXES)
+    assert second == {}
+
+    client = MongoClient(mongodb_url)
+    try:
+        db = client[TEST_DATABASE_NAME]
+        for collection, query, sort_fields in HOT_QUERIES:
+            cursor = db[collection].find(query)
+            if sort_fields:
+                cursor = cursor.sort([(field, 1) for field in sort_fields])
+            stages = plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+            assert "IXSCAN" in stages, (collection, query, stages)
+            assert "COLLSCAN" not in stages and "SORT" not in stages, (collection, query, stages)
+        client.drop_database(TEST_DATABASE_NAME)
+    finally:
+        client.close()
@@ -0,0 +1,99 @@
+"""
+測試路段快取與路線串接
+"""
+import asyncio
+
+import pandas as pd
+import pytest
+
+import services.routing_backend as routing_backend
+from services.leg_cache import LegCache
+from services.routing_backend import RoutingBackend, assemble_legs, compute_route
+
+
+class CountingBackend(RoutingBackend):
+    """以直線回傳路段並記錄呼叫次數的測試後端"""
+    name = "test"
+
+    def __init__(self):
+        self.calls = []
+
+    def route(self, points):
+        self.calls.append(tuple(points))
+        return {'coords': list(points), 'distance': 1.0, 'duration': 5.0, 'success': True}
+
+
+def sample_route_df():
+    return pd.DataFrame({
+        'sno': ['A', 'B', 'C', 'D'],
+        'latitude': [25.00, 25.01, 25.02, 25.03],
+        'longitude': [121.50, 121.51, 121.52, 121.53],
+    })
+
+
+def test_assemble_legs_drops_shared_endpoints():
+    """串接時不重複相鄰路段的共用端點"""
+    legs = [
+        {'coords': [(0, 0), (0, 1)], 'distance': 1.0, 'duration': 2.0},
+        {'coords': [(0, 1), (1, 1)], 'distance': 0.5, 'duration': 1.0},
+    ]
+    result = assemble_legs(legs)
+    assert result['coords'] == [(0, 0), (0, 1), (1, 1)]
+    assert result['distance'] == 1.5
+    assert result['duration'] == 3.0
+
+
+def test_compute_route_only_routes_missing_legs(tmp_path, monkeypatch):
+    """已快取的路段不再呼叫後端"""
+    backend = CountingBackend()
+    cache = LegCache(str(tmp_path / 'legs.sqlite3'))
+    monkeypatch.setattr(routing_backend, '_backend', backend)
+    monkeypatch.setattr(routing_backend, 'leg_cache', cache)
+
+    first = compute_route(sample_route_df())
+    assert first['success']
+    assert len(backend.calls) == 3
+    assert first['distance'] == 3.0
+
+    second = compute_route(sample_route_df())
+    assert len(backend.calls) == 3
+    assert second['coords'] == first['coords']
+
+
+def test_backend_must_implement_route():
+    class IncompleteBackend(RoutingBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_leg_pool_is_closed_and_recreated(tmp_path, monkeypatch):
+    """關閉後路段執行緒池的執行緒結束，之後再計算路線時重新建立"""
+    monkeypatch.setattr(routing_backend, '_backend', CountingBackend())
+    monkeypatch.setattr(routing_backend, 'leg_cache', LegCache(str(tmp_path / 'legs.sqlite3')))
+
+    assert compute_route(sample_route_df())['success']
+    pool = routing_backend._leg_pool
+    asyncio.run(routing_backend.close_leg_pool())
+    assert routing_backend._leg_pool is None
+    assert all(not thread.is_alive() for thread in pool._threads)
+
+    monkeypatch.setattr(routing_backend, 'leg_cache', LegCache(str(tmp_path / 'legs2.sqlite3')))
+    assert compute_route(sample_route_df())['success']
+    assert routing_backend._leg_pool is not pool
+    asyncio.run(routing_backend.close_leg_pool())
+
+
+def test_leg_cache_persists_to_disk(tmp_path):
+    """路段會保存到磁碟，重新開啟後仍可讀取"""
+    path = str(tmp_path / 'legs.sqlite3')
+    cache = LegCache(path)
+    cache.put(('test', 'A', 'B'), {'coords': [(25.0, 121.5), (25.1, 121.6)], 'distance': 2.0, 'duration': 10.0})
+    cache.close()
+
+    reopened = LegCache(path)
+    leg = reopened.get(('test', 'A', 'B'))
+    assert leg['coords'] == [(25.0, 121.5), (25.1, 121.6)]
+    assert leg['distance'] == 2.0
+    assert reopened.get(('test', 'B', 'A')) is None
@@ -0,0 +1,105 @@
+"""
+測試本地道路圖路徑規劃
+"""
+import json
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from services.local_router import LocalGraphRouter
+
+BASE_LAT, BASE_LON = 25.03, 121.55
+STEP = 0.002  # 約 200 公尺
+
+
+def grid_geojson(path, size=8, oneway_row=None):
+    """產生 size x size 的棋盤道路 GeoJSON"""
+    features = []
+    for i in range(size):
+        row = [[BASE_LON + j * STEP, BASE_LAT + i * STEP] for j in range(size)]
+        col = [[BASE_LON + i * STEP, BASE_LAT + j * STEP] for j in range(size)]
+        row_props = {'highway': 'residential'}
+        if i == oneway_row:
+            row_props['oneway'] = 'yes'
+        features.append({'type': 'Feature', 'properties': row_props,
+                         'geometry': {'type': 'LineString', 'coordinates': row}})
+        features.append({'type': 'Feature', 'properties': {'highway': 'residential'},
+                         'geometry': {'type': 'LineString', 'coordinates': col}})
+    # 自行車不可通行的快速道路（對角線捷徑）
+    features.append({'type': 'Feature', 'properties': {'highway': 'motorway'},
+                     'geometry': {'type': 'LineString', 'coordinates': [
+                         [BASE_LON, BASE_LAT], [BASE_LON + (size - 1) * STEP, BASE_LAT + (size - 1) * STEP]]}})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+    return str(path)
+
+
+def test_astar_matches_dijkstra(tmp_path):
+    """A* 距離與 Dijkstra 相同"""
+    router = LocalGraphRouter.from_geojson(grid_geojson(tmp_path / 'roads.geojson'))
+    graph = csr_matrix((router.weights, router.indices, router.indptr),
+                       shape=(router.num_nodes, router.num_nodes))
+    expected = dijkstra(graph, indices=0)
+
+    for target in range(router.num_nodes):
+        result = router.shortest_path(0, target)
+        assert result is not None
+        assert abs(result[1] - expected[target]) < 1e-6
+
+
+def test_route_multi_waypoint(tmp_path):
+    """多點路線回傳與 OSRM 相同的格式，且不使用快速道路"""
+    router = LocalGraphRouter.from_geojson(grid_geojson(tmp_path / 'roads.geojson'))
+    points = [(BASE_LAT, BASE_LON), (BASE_LAT + 7 * STEP, BASE_LON + 7 * STEP), (BASE_LAT, BASE_LON + 7 * STEP)]
+
+    result = router.route(points)
+
+    assert result['success']
+    assert result['coords'][0] == (BASE_LAT, BASE_LON)
+    assert result['coords'][-1] == (BASE_LAT, BASE_LON + 7 * STEP)
+    # 只能沿棋盤走：兩段各 14 格 + 7 格
+    single_step_km = router.weights.min() / 1000
+    assert result['distance'] > 20 * single_step_km
+    assert abs(result['duration'] - result['distance'] / 12 * 60) < 1e-9
+
+
+def test_oneway_street(tmp_path):
+    """單行道只能單向通行"""
+    router = LocalGraphRouter.from_geojson(grid_geojson(tmp_path / 'roads.geojson', size=2, oneway_row=0))
+    a = router.nearest_node(BASE_LAT, BASE_LON)
+    b = router.nearest_node(BASE_LAT, BASE_LON + STEP)
+
+    forward = router.shortest_path(a, b)
+    backward = router.shortest_path(b, a)
+    assert forward[1] < backward[1]
+
+
+def test_npz_roundtrip(tmp_path):
+    """儲存與讀取 .npz 道路圖"""
+    router = LocalGraphRouter.from_geojson(grid_geojson(tmp_path / 'roads.geojson'))
+    router.save_npz(str(tmp_path / 'roads.npz'))
+    loaded = LocalGraphRouter.load(str(tmp_path / 'roads.npz'))
+
+    np.testing.assert_array_equal(loaded.indptr, router.indptr)
+    np.testing.assert_array_equal(loaded.indices, router.indices)
+    points = [(BASE_LAT, BASE_LON), (BASE_LAT + 5 * STEP, BASE_LON + 3 * STEP)]
+    assert loaded.route(points)['distance'] == router.route(points)['distance']
+
+
+def test_table_matches_shortest_path(tmp_path):
+    """距離矩陣與逐對 A* 的結果相同，超過搜尋上限為 NaN"""
+    router = LocalGraphRouter.from_geojson(grid_geojson(tmp_path / 'roads.geojson', oneway_row=3))
+    points = [(BASE_LAT + i * STEP, BASE_LON + j * STEP) for i, j in [(0, 0), (3, 5), (7, 7), (2, 6), (5, 1)]]
+
+    distance_km, duration_min = router.table(points[:2], points)
+
+    for a in range(2):
+        for b in range(len(points)):
+            _, expected_m = router.shortest_path(router.nearest_node(*points[a]), router.nearest_node(*points[b]))
+            assert abs(distance_km[a, b] - expected_m / 1000) < 1e-9
+    assert np.allclose(duration_min, distance_km / router.speed_kmh * 60)
+
+    limited_km, _ = router.table(points[:1], points, max_distance_m=1000)
+    assert np.isnan(limited_km[0, 2])
+    assert limited_km[0, 0] == 0
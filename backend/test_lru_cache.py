@@ -0,0 +1,44 @@
+"""
+測試 LRU 快取
+"""
+import time
+
+from services.lru_cache import TTLLRUCache
+
+
+def test_evicts_least_recently_used():
+    """超過容量時淘汰最久未使用的項目"""
+    cache = TTLLRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_expires_after_ttl():
+    """超過存活時間的項目視為未命中"""
+    cache = TTLLRUCache(max_size=10, ttl_seconds=0.05)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+
+
+def test_hit_miss_counters():
+    """命中與未命中統計"""
+    cache = TTLLRUCache(max_size=10)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
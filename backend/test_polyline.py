@@ -0,0 +1,134 @@
+"""
+測試 encoded polyline、Douglas–Peucker 簡化與幾何金字塔
+"""
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.polyline import (
+    decode_polyline, douglas_peucker_weights, encode_polyline, simplify_douglas_peucker
+)
+import services.route_geometry as route_geometry
+from services.route_geometry import (
+    build_geometry_pyramid, format_geometry, get_route_geometry, meters_per_pixel, route_geometry_cache,
+    select_pyramid_level
+)
+from tsp_taipei_route_new import haversine_distance
+
+# Google 官方文件的範例
+GOOGLE_EXAMPLE = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+GOOGLE_EXAMPLE_ENCODED = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_encode_matches_reference():
+    assert encode_polyline(GOOGLE_EXAMPLE) == GOOGLE_EXAMPLE_ENCODED
+    assert encode_polyline([]) == ""
+
+
+def test_decode_roundtrip():
+    rng = np.random.default_rng(0)
+    coords = list(zip(rng.uniform(24.9, 25.2, 500), rng.uniform(121.4, 121.7, 500)))
+    decoded = decode_polyline(encode_polyline(coords))
+    assert len(decoded) == len(coords)
+    assert np.allclose(decoded, coords, atol=0.5e-5 + 1e-12)
+    assert decode_polyline(GOOGLE_EXAMPLE_ENCODED) == pytest.approx(GOOGLE_EXAMPLE)
+
+
+def test_simplify_collinear_points():
+    """共線的點只保留端點"""
+    coords = [(25.0 + i * 0.0001, 121.5 + i * 0.0001) for i in range(100)]
+    assert simplify_douglas_peucker(coords, 1.0) == [coords[0], coords[-1]]
+
+
+def _point_to_polyline_m(point, polyline):
+    """點到折線的近似距離（公尺，以細分取樣）"""
+    best = float('inf')
+    for (lat1, lon1), (lat2, lon2) in zip(polyline, polyline[1:]):
+        for t in np.linspace(0, 1, 100):
+            lat = lat1 + (lat2 - lat1) * t
+            lon = lon1 + (lon2 - lon1) * t
+            best = min(best, haversine_distance(point[0], point[1], lat, lon) * 1000)
+    return best
+
+
+def test_simplify_respects_tolerance():
+    """簡化後每個原始點與簡化路線的距離都在容許誤差內"""
+    rng = np.random.default_rng(1)
+    steps = rng.normal(0, 0.0002, size=(300, 2))
+    coords = [tuple(p) for p in np.cumsum(steps, axis=0) + (25.03, 121.55)]
+
+    tolerance = 10.0
+    simplified = simplify_douglas_peucker(coords, tolerance)
+    assert simplified[0] == coords[0] and simplified[-1] == coords[-1]
+    assert 2 <= len(simplified) < len(coords)
+    assert set(simplified) <= set(coords)
+    for point in coords[::25]:
+        assert _point_to_polyline_m(point, simplified) <= tolerance + 0.5
+
+
+def test_simplify_short_inputs():
+    assert simplify_douglas_peucker([], 5) == []
+    assert simplify_douglas_peucker([(25.0, 121.5)], 5) == [(25.0, 121.5)]
+    assert simplify_douglas_peucker([(25.0, 121.5), (25.1, 121.6)], 5) == [(25.0, 121.5), (25.1, 121.6)]
+
+
+def test_weights_match_simplify_at_every_tolerance():
+    """同一份權重取得的各層級與單獨簡化的結果相同"""
+    rng = np.random.default_rng(2)
+    for _ in range(10):
+        steps = rng.normal(0, 0.0003, size=(int(rng.integers(3, 300)), 2))
+        coords = [tuple(p) for p in np.cumsum(steps, axis=0) + (25.03, 121.55)]
+        weights = douglas_peucker_weights(coords)
+        for tolerance in (1, 5, 20, 100):
+            kept = [coords[i] for i in np.flatnonzero(weights > tolerance)]
+            assert kept == simplify_douglas_peucker(coords, tolerance)
+
+
+def test_geometry_pyramid_levels_are_nested():
+    """金字塔由粗到細，每一層都包含上一層的點，最後一層為完整幾何"""
+    rng = np.random.default_rng(4)
+    coords = [tuple(p) for p in np.cumsum(rng.normal(0, 0.0002, size=(500, 2)), axis=0) + (25.03, 121.55)]
+    pyramid = build_geometry_pyramid(coords, [3, 200, 12, 50])
+
+    assert [level['tolerance_m'] for level in pyramid] == [200, 50, 12, 3, 0.0]
+    assert pyramid[-1]['coords'] == coords
+    for coarse, fine in zip(pyramid, pyramid[1:]):
+        assert set(coarse['coords']) <= set(fine['coords'])
+        assert len(coarse['coords']) <= len(fine['coords'])
+
+
+def test_select_pyramid_level_by_zoom():
+    """縮放越大選擇越精細的層級"""
+    pyramid = [{'level': i, 'tolerance_m': t, 'coords': []} for i, t in enumerate([200, 50, 12, 3, 0.0])]
+    levels = [select_pyramid_level(pyramid, meters_per_pixel(zoom, 25.03))['level'] for zoom in range(8, 20)]
+    assert levels == sorted(levels)
+    assert levels[0] == 0 and levels[-1] == 4
+
+
+def test_simplified_geometry_uses_the_cached_tolerance(monkeypatch):
+    """取到同一個 0.1 公尺的容許誤差共用快取，內容以該容許誤差簡化"""
+    rng = np.random.default_rng(5)
+    coords = [tuple(p) for p in np.cumsum(rng.normal(0, 0.0002, size=(300, 2)), axis=0) + (25.03, 121.55)]
+    full = {**format_geometry(coords, "full", None), 'distance': 1.0, 'duration': 1.0, 'success': True}
+
+    async def fake_full_geometry(route_df):
+        return full
+
+    monkeypatch.setattr(route_geometry, '_get_full_geometry', fake_full_geometry)
+    route_geometry_cache.clear()
+    route_df = pd.DataFrame({'sno': ["500101001", "500101002"]})
+
+    # 找一個權重略大於 0.1 公尺刻度的點：以 weight + 0.005 簡化會捨去它，以刻度值簡化則會保留
+    weight = next(w for w in sorted(douglas_peucker_weights(coords))
+                  if w > 1 and 0.01 < w - np.floor(w * 10) / 10 < 0.04)
+    tolerance = round(weight + 0.005, 1)
+    assert tolerance < weight
+
+    first = asyncio.run(get_route_geometry(route_df, "simplified", weight + 0.005))
+    second = asyncio.run(get_route_geometry(route_df, "simplified", tolerance - 0.04))
+    expected = [[lat, lon] for lat, lon in simplify_douglas_peucker(coords, tolerance)]
+    assert first['route_geometry'] == expected
+    assert second is first
+    route_geometry_cache.clear()
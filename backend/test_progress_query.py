@@ -0,0 +1,89 @@
+"""
+測試使用者進度查詢（aggregation 部分需要本機 MongoDB，連不上時略過）
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from database import Collections
+from services.progress_query import decode_cursor, encode_cursor, get_user_progress, progress_pipeline
+
+TEST_DATABASE_NAME = "townpass2025_test_progress"
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2025, 11, 8, 14, 30, 0, 123000)
+    object_id = ObjectId()
+    assert decode_cursor(encode_cursor(timestamp, object_id)) == (timestamp, object_id)
+    assert decode_cursor(encode_cursor(timestamp, "batch:3")) == (timestamp, "batch:3")
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_pipeline_filters_checkins_after_cursor():
+    after = (datetime(2025, 11, 8), "batch:3")
+    pipeline = progress_pipeline("u1", "t", limit=20, after=after)
+    assert pipeline[0] == {"$match": {"userId": "u1", "shape": "T"}}
+    page = pipeline[2]["$unionWith"]["pipeline"]
+    assert page[0]["$match"]["$or"][1] == {"timestamp": after[0], "_id": {"$gt": "batch:3"}}
+    assert page[2] == {"$limit": 21}
+    # 總數不受游標影響
+    assert pipeline[3]["$unionWith"]["pipeline"][0] == {"$match": {"userId": "u1", "shape": "T"}}
+
+
+def test_progress_pages_through_checkins(mongodb_url):
+    """依打卡時間分頁（相同時間依 _id），日期與 _id 在伺服器上轉成字串"""
+    async def run():
+        client = AsyncIOMotorClient(mongodb_url)
+        try:
+            db = client[TEST_DATABASE_NAME]
+            for name in (Collections.USER_PROGRESS, Collections.CHECKINS, Collections.ROUTE_SESSIONS):
+                await db[name].delete_many({})
+            start = datetime(2025, 11, 8, 14, 0)
+            await db[Collections.USER_PROGRESS].insert_one({
+                "userId": "u1", "shape": "T", "checkins": [], "total_waypoints": 4, "last_updated": start
+            })
+            await db[Collections.ROUTE_SESSIONS].insert_one({
+                "userId": "u1", "shape": "T", "status": "started", "start_time": start, "end_time": None
+            })
+            await db[Collections.CHECKINS].insert_many(
+                [{"userId": "u1", "shape": "T", "waypointId": f"wp{i}", "timestamp": start + timedelta(minutes=i // 2)}
+                 for i in range(7)]
+                + [{"userId": "u2", "shape": "T", "waypointId": "wp0", "timestamp": start}]
+            )
+
+            pages, after = [], None
+            while not pages or pages[-1]["has_more"]:
+                page = await get_user_progress(db, "u1", "t", limit=3, after=after)
+                pages.append(page)
+                after = page["next_cursor"]
+
+            # 已取得全部打卡後，以最後的游標查詢只會取得新的打卡
+            caught_up = await get_user_progress(db, "u1", "t", limit=3, after=after)
+            await db[Collections.CHECKINS].insert_one(
+                {"userId": "u1", "shape": "T", "waypointId": "wp7", "timestamp": start + timedelta(hours=1)}
+            )
+            polled = await get_user_progress(db, "u1", "t", limit=3, after=caught_up["next_cursor"])
+            return pages, caught_up, after, polled
+        finally:
+            client.close()
+
+    pages, caught_up, last_cursor, polled = asyncio.run(run())
+    assert [len(page["checkins"]) for page in pages] == [3, 3, 1]
+    assert [page["has_more"] for page in pages] == [True, True, False]
+    assert pages[-1]["next_cursor"] is not None
+    assert caught_up["checkins"] == [] and caught_up["next_cursor"] == last_cursor
+    assert [c["waypointId"] for c in polled["checkins"]] == ["wp7"]
+    assert not polled["has_more"]
+    assert [c["waypointId"] for page in pages for c in page["checkins"]] == [f"wp{i}" for i in range(7)]
+    assert all(page["total_checkins"] == 7 for page in pages)
+
+    first = pages[0]
+    assert first["checkins"][0]["timestamp"] == "2025-11-08T14:00:00.000"
+    assert isinstance(first["checkins"][0]["_id"], str)
+    assert first["progress"][0]["last_updated"] == "2025-11-08T14:00:00.000"
+    assert first["sessions"][0]["start_time"] == "2025-11-08T14:00:00.000"
+    assert first["sessions"][0]["end_time"] is None
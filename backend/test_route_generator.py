@@ -0,0 +1,53 @@
+"""
+測試批次路線生成
+以固定的快照一次生成所有圖形，結果需與逐一生成每個圖形相同
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from services.route_generator import generate_route_for_shape, generate_routes_for_shapes
+from services.spatial_index import GeoPointIndex
+from services.youbike_store import YouBikeSnapshot
+from tsp_taipei_route_new import SHAPE_TEMPLATES, RouteConfig, generate_shape_route
+
+USER_LAT, USER_LON = 25.033, 121.5654
+
+
+def fixed_snapshot(n=1500, seed=0):
+    """在台北市範圍內產生固定的站點快照"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'sno': [f"5001{i:05d}" for i in range(n)],
+        'sna': [f"站{i}" for i in range(n)],
+        'sarea': '大安區',
+        'latitude': rng.uniform(24.96, 25.13, n),
+        'longitude': rng.uniform(121.45, 121.62, n),
+        'available_rent_bikes': rng.integers(0, 20, n),
+        'available_return_bikes': rng.integers(0, 20, n),
+    })
+    index = GeoPointIndex(df['latitude'].values, df['longitude'].values)
+    return YouBikeSnapshot(df, 1, datetime(2025, 11, 8), index, "fixed")
+
+
+def test_batched_generation_matches_per_shape():
+    snapshot = fixed_snapshot()
+    shapes = list(SHAPE_TEMPLATES)
+    batched = generate_routes_for_shapes(shapes, USER_LAT, USER_LON, snapshot)
+
+    config = RouteConfig()
+    config.user_location = {'lat': USER_LAT, 'lon': USER_LON}
+    for shape in shapes:
+        result = batched[shape]
+        assert result is not None and result['success'], shape
+
+        # 與原本逐一生成的流程（各自篩選站點、各自計算距離矩陣）相同
+        start_station = snapshot.df[snapshot.df['sno'] == result['start_sno']].iloc[0]
+        route_df, similarity = generate_shape_route(snapshot.df, start_station, shape, config)
+        pd.testing.assert_frame_equal(result['route_df'], route_df)
+        assert result['similarity'] == similarity
+
+        # 景點一次查詢後依路線切開，需與單獨生成該圖形相同
+        single = generate_route_for_shape(shape, USER_LAT, USER_LON, snapshot)
+        assert result['spots'] == single['spots']
@@ -0,0 +1,23 @@
+"""
+測試路線代碼
+"""
+from services.route_store import create_route_handle, get_route_by_handle, route_handle_store
+
+
+def make_result(shape="T", start_sno="500101001", data_version=1):
+    return {'success': True, 'shape': shape, 'start_sno': start_sno, 'data_version': data_version}
+
+
+def test_same_route_reuses_one_handle():
+    """同一條路線重複取得代碼時共用同一個項目，快照版本或起點不同時代碼不同"""
+    route_handle_store.clear()
+    first = create_route_handle(make_result())
+    again = create_route_handle(make_result())
+
+    assert first == again
+    assert len(route_handle_store) == 1
+    assert get_route_by_handle(first)['shape'] == "T"
+    assert create_route_handle(make_result(data_version=2)) != first
+    assert create_route_handle(make_result(start_sno="500101002")) != first
+    assert create_route_handle(make_result(shape="A")) != first
+    route_handle_store.clear()
@@ -0,0 +1,214 @@
+"""
+測試非同步路線規劃用戶端（使用本機的 OSRM 模擬伺服器）
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.routing_client import (
+    AsyncRoutingClient, CircuitBreaker, CircuitOpenError
+)
+
+POINTS = [(25.03, 121.56), (25.04, 121.57)]
+
+
+class StubOSRM:
+    """模擬 OSRM 的本機伺服器，可指定前幾個請求回傳的狀態碼與回應延遲"""
+    def __init__(self, fail_first: int = 0, fail_status: int = 503, delay: float = 0.0):
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.delay = delay
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.client_ports = set()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    number = stub.requests
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                    stub.client_ports.add(self.client_address[1])
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    if number <= stub.fail_first:
+                        self._send(stub.fail_status, {"code": "Error"})
+                    elif self.path.startswith("/table/"):
+                        self._send(200, {
+                            "code": "Ok",
+                            "distances": [[0.0, 1200.0, None]],
+                            "durations": [[0.0, 240.0, None]]
+                        })
+                    else:
+                        self._send(200, {
+                            "code": "Ok",
+                            "routes": [{
+                                "distance": 1500.0,
+                                "duration": 300.0,
+                                "geometry": {"coordinates": [[121.56, 25.03], [121.57, 25.04]]}
+                            }]
+                        })
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_client(url, **kwargs):
+    kwargs.setdefault('backoff', 0.01)
+    kwargs.setdefault('backoff_max', 0.02)
+    return AsyncRoutingClient(base_url=url, timeout=5, **kwargs)
+
+
+def test_route_parses_response_and_reuses_connection():
+    """回應轉換為 (lat, lon) 並沿用 keep-alive 連線"""
+    async def run():
+        client = make_client(stub.url)
+        try:
+            results = [await client.route(POINTS) for _ in range(5)]
+        finally:
+            await client.aclose()
+        return results
+
+    with StubOSRM() as stub:
+        results = asyncio.run(run())
+
+    assert all(r['success'] for r in results)
+    assert results[0]['coords'] == [(25.03, 121.56), (25.04, 121.57)]
+    assert results[0]['distance'] == pytest.approx(1.5)
+    assert results[0]['duration'] == pytest.approx(5.0)
+    assert stub.requests == 5
+    assert len(stub.client_ports) == 1
+
+
+def test_concurrency_is_limited_per_host():
+    """同一主機同時進行的請求不超過上限"""
+    async def run():
+        client = make_client(stub.url, max_concurrency_per_host=2)
+        try:
+            return await asyncio.gather(*(client.route(POINTS) for _ in range(8)))
+        finally:
+            await client.aclose()
+
+    with StubOSRM(delay=0.05) as stub:
+        results = asyncio.run(run())
+
+    assert all(r['success'] for r in results)
+    assert stub.max_active == 2
+
+
+def test_retries_transient_errors():
+    """503 會重試，成功後斷路器維持關閉"""
+    async def run():
+        client = make_client(stub.url, retries=2)
+        try:
+            return await client.route(POINTS), client
+        finally:
+            await client.aclose()
+
+    with StubOSRM(fail_first=2) as stub:
+        result, client = asyncio.run(run())
+
+    assert result['success']
+    assert stub.requests == 3
+    assert client.retried == 2
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_opens_and_fails_fast():
+    """連續失敗達門檻後不再送出請求，等待後放行試探請求"""
+    async def run():
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+        client = make_client(stub.url, retries=0, breaker=breaker)
+        try:
+            assert not (await client.route(POINTS))['success']
+            assert not (await client.route(POINTS))['success']
+            assert breaker.state == CircuitBreaker.OPEN
+
+            sent = stub.requests
+            with pytest.raises(CircuitOpenError):
+                await client.route(POINTS)
+            assert stub.requests == sent
+
+            await asyncio.sleep(0.25)
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+            assert (await client.route(POINTS))['success']
+            assert breaker.state == CircuitBreaker.CLOSED
+        finally:
+            await client.aclose()
+
+    with StubOSRM(fail_first=2) as stub:
+        asyncio.run(run())
+
+
+def test_cancelled_probe_reopens_circuit():
+    """試探請求被取消時視為失敗，斷路器重新開啟而不是一直停在 half_open"""
+    async def run():
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        client = make_client(stub.url, retries=0, breaker=breaker)
+        try:
+            breaker.record_failure()
+            await asyncio.sleep(0.15)
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.route(POINTS), 0.05)
+            assert breaker.state == CircuitBreaker.OPEN
+
+            await asyncio.sleep(0.15)
+            stub.delay = 0
+            assert (await client.route(POINTS))['success']
+            assert breaker.state == CircuitBreaker.CLOSED
+        finally:
+            await client.aclose()
+
+    with StubOSRM(delay=0.3) as stub:
+        asyncio.run(run())
+
+
+def test_table_request():
+    """table 請求帶上起點與終點索引，無法到達的值保留為 None"""
+    async def run():
+        client = make_client(stub.url)
+        try:
+            return await client.table([POINTS[0]], [POINTS[0], POINTS[1], (25.2, 121.9)])
+        finally:
+            await client.aclose()
+
+    with StubOSRM() as stub:
+        result = asyncio.run(run())
+
+    assert result['distances'] == [[0.0, 1200.0, None]]
+    assert result['durations'][0][1] == 240.0
@@ -0,0 +1,109 @@
+"""
+測試空間索引
+景點批次半徑查詢需與 find_nearby_attractions 完全一致，站點最近查詢需與 find_nearest_youbike 一致；
+直接執行可看效能比較
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.attractions_repository import load_attractions_repository
+from services.spatial_index import GeoPointIndex
+from tsp_taipei_route_new import find_nearby_attractions, find_nearest_youbike
+
+RADIUS_METERS = 500
+
+
+def random_stations(n, seed=0):
+    """在台北市範圍內產生隨機站點座標"""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(24.96, 25.13, n), rng.uniform(121.45, 121.62, n)
+
+
+def test_find_nearby_batch_matches_scalar():
+    """批次查詢與逐一查詢結果相同"""
+    repo = load_attractions_repository()
+    lats, lons = random_stations(200)
+
+    batch = repo.find_nearby_batch(lats, lons, RADIUS_METERS)
+
+    assert len(batch) == len(lats)
+    for lat, lon, nearby in zip(lats, lons, batch):
+        expected = find_nearby_attractions(lat, lon, repo.df, RADIUS_METERS)
+        assert [a['name'] for a in nearby] == [a['name'] for a in expected]
+        np.testing.assert_allclose(
+            [a['distance'] for a in nearby],
+            [a['distance'] for a in expected],
+            rtol=1e-12
+        )
+
+
+def test_find_nearby_batch_empty_query():
+    """沒有站點時回傳空列表"""
+    repo = load_attractions_repository()
+    assert repo.find_nearby_batch([], [], RADIUS_METERS) == []
+
+
+def random_youbike_df(n=1500, seed=0):
+    """產生隨機的 YouBike 站點資料"""
+    rng = np.random.default_rng(seed)
+    lats, lons = random_stations(n, seed)
+    return pd.DataFrame({
+        'sno': [f"500{i:06d}" for i in range(n)],
+        'sna': [f"測試站{i}" for i in range(n)],
+        'latitude': lats,
+        'longitude': lons,
+        'available_rent_bikes': rng.integers(0, 20, n),
+        'available_return_bikes': rng.integers(0, 20, n),
+    })
+
+
+def test_find_nearest_youbike_with_index_matches_scan():
+    """使用站點索引找到的起點與逐站掃描相同"""
+    youbike_df = random_youbike_df()
+    station_index = GeoPointIndex(youbike_df['latitude'].values, youbike_df['longitude'].values)
+    user_lats, user_lons = random_stations(100, seed=3)
+
+    for lat, lon in zip(user_lats, user_lons):
+        for min_bikes in (0, 3, 18):
+            expected = find_nearest_youbike(lat, lon, youbike_df, min_bikes)
+            result = find_nearest_youbike(lat, lon, youbike_df, min_bikes, station_index)
+            assert result['sno'] == expected['sno']
+            assert abs(result['distance'] - expected['distance']) < 1e-9
+
+
+def test_find_nearest_youbike_falls_back_without_available_bikes():
+    """沒有站點符合可借數量時，回傳不篩選的最近站點"""
+    youbike_df = random_youbike_df(200)
+    station_index = GeoPointIndex(youbike_df['latitude'].values, youbike_df['longitude'].values)
+
+    expected = find_nearest_youbike(25.03, 121.56, youbike_df, 100)
+    result = find_nearest_youbike(25.03, 121.56, youbike_df, 100, station_index)
+    assert result['sno'] == expected['sno']
+
+
+def benchmark(n_stations=10, repeat=20):
+    """比較逐一查詢與批次查詢的耗時"""
+    repo = load_attractions_repository()
+    lats, lons = random_stations(n_stations)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for lat, lon in zip(lats, lons):
+            find_nearby_attractions(lat, lon, repo.df, RADIUS_METERS)
+    scalar_ms = (time.perf_counter() - start) / repeat * 1000
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        repo.find_nearby_batch(lats, lons, RADIUS_METERS)
+    batch_ms = (time.perf_counter() - start) / repeat * 1000
+
+    print(f"景點數: {len(repo)}，每條路線站點數: {n_stations}")
+    print(f"逐一查詢: {scalar_ms:.2f} ms / 路線")
+    print(f"批次查詢: {batch_ms:.2f} ms / 路線")
+    print(f"加速: {scalar_ms / batch_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,86 @@
+"""
+測試路線 SVG 生成
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.svg_service import (
+    _format_numbers, _join_numbers, generate_route_svg, project_points, render_route_svg, svg_cache
+)
+
+
+def sample_route_df(n=12, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'sno': [f"5001{i:05d}" for i in range(n)],
+        'latitude': rng.uniform(25.0, 25.1, n),
+        'longitude': rng.uniform(121.5, 121.6, n),
+    })
+
+
+def path_points(svg):
+    """將 M/l 路徑還原為絕對座標"""
+    path_data = re.search(r' d="([^"]+)"', svg).group(1)
+    assert re.fullmatch(r'M[-\d. ]+(l[-\d. ]+)?', path_data)
+    numbers = np.array([float(v) for v in re.findall(r'-?\d+(?:\.\d+)?', path_data)]).reshape(-1, 2)
+    return np.cumsum(numbers, axis=0)
+
+
+def test_format_numbers_drops_trailing_zeros():
+    scaled = np.array([0, 5, -5, 120, -1200, 123456, -100000])
+    assert _format_numbers(scaled, 2).tolist() == ["0", "0.05", "-0.05", "1.2", "-12", "1234.56", "-1000"]
+    assert _format_numbers(scaled, 0).tolist() == ["0", "5", "-5", "120", "-1200", "123456", "-100000"]
+    assert _join_numbers(_format_numbers(scaled, 2)) == "0 0.05-0.05 1.2-12 1234.56-1000"
+
+
+def test_negative_precision_is_rejected():
+    """負的精度會把座標縮小後當成原值輸出，直接拒絕"""
+    with pytest.raises(ValueError):
+        render_route_svg(sample_route_df(), precision=-1)
+
+
+def test_relative_path_matches_projection():
+    """相對路徑還原後與投影座標的誤差不超過精度的一半"""
+    route_df = sample_route_df()
+    xs, ys = project_points(route_df['latitude'].values, route_df['longitude'].values, 400, 400)
+
+    for precision in (0, 1, 2):
+        points = path_points(render_route_svg(route_df, precision=precision))
+        assert points.shape == (len(route_df), 2)
+        assert np.abs(points - np.column_stack([xs, ys])).max() <= 0.5 * 10 ** -precision + 1e-9
+
+
+def test_markers_follow_path():
+    """站點標記與路徑頂點位置相同，起點綠色、終點紅色"""
+    route_df = sample_route_df()
+    svg = render_route_svg(route_df)
+    circles = re.findall(r'<circle cx="([^"]+)" cy="([^"]+)" r="5" fill="([^"]+)"/>', svg)
+
+    assert len(circles) == len(route_df)
+    assert np.allclose(np.array([c[:2] for c in circles], dtype=float), path_points(svg))
+    assert circles[0][2] == "#10B981"
+    assert circles[-1][2] == "#EF4444"
+
+
+def test_single_station_route():
+    svg = render_route_svg(sample_route_df(n=1))
+    assert 'l' not in re.search(r' d="([^"]+)"', svg).group(1)
+    assert svg.count('<circle') == 1
+
+
+def test_svg_is_cached_by_station_sequence():
+    """相同站點序列直接回傳快取，順序不同則重新繪製"""
+    svg_cache.clear()
+    route_df = sample_route_df()
+
+    first = generate_route_svg(route_df)
+    hits = svg_cache.hits
+    assert generate_route_svg(route_df.copy()) is first
+    assert svg_cache.hits == hits + 1
+
+    reversed_svg = generate_route_svg(route_df.iloc[::-1])
+    assert reversed_svg != first
+    assert generate_route_svg(pd.DataFrame()) == ""
@@ -0,0 +1,73 @@
+"""
+測試路線縮圖繪製與內容定址保存
+"""
+import asyncio
+import io
+import os
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+import services.thumbnail_service as thumbnail_service
+from services.disk_cache import DiskLRUCache
+from services.thumbnail_service import (
+    ensure_route_thumbnails, read_thumbnail, render_thumbnail, thumbnail_name, touch_thumbnail
+)
+
+
+def sample_route_df(seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'sno': [f"5001{i:05d}" for i in range(8)],
+        'latitude': rng.uniform(25.0, 25.1, 8),
+        'longitude': rng.uniform(121.5, 121.6, 8),
+    })
+
+
+def test_render_png_and_webp():
+    route_df = sample_route_df()
+    for image_format, pil_format in (("png", "PNG"), ("webp", "WEBP")):
+        data = render_thumbnail(route_df['latitude'].values, route_df['longitude'].values, 128, image_format)
+        image = Image.open(io.BytesIO(data))
+        assert image.format == pil_format
+        assert image.size == (128, 128)
+
+
+def test_thumbnail_name_is_content_addressed():
+    """相同站點序列得到相同檔名，不同路線或格式得到不同檔名"""
+    route_df = sample_route_df()
+    name = thumbnail_name(route_df, image_format="png")
+    assert thumbnail_service.THUMBNAIL_NAME_PATTERN.match(name)
+    assert thumbnail_name(route_df.copy(), image_format="png") == name
+    assert thumbnail_name(sample_route_df(seed=1), image_format="png") != name
+    assert thumbnail_name(route_df, image_format="webp") != name
+
+
+def test_store_is_idempotent_and_capped(tmp_path, monkeypatch):
+    """已存在的縮圖不重新繪製，超過容量時淘汰最久未使用的縮圖，讀取時拒絕不合法的檔名"""
+    cache = DiskLRUCache(str(tmp_path), max_bytes=10 ** 6)
+    monkeypatch.setattr(thumbnail_service, 'thumbnail_cache', cache)
+    route_dfs = {"T": sample_route_df(), "A": sample_route_df(seed=1)}
+    names = {shape: thumbnail_name(route_df) for shape, route_df in route_dfs.items()}
+
+    urls = asyncio.run(ensure_route_thumbnails(route_dfs))
+    assert urls["T"].endswith(names["T"])
+    assert cache.stats()["files"] == 2
+    asyncio.run(ensure_route_thumbnails(route_dfs))
+    assert cache.stats()["files"] == 2 and cache.stats()["misses"] == 0
+
+    data = read_thumbnail(names["T"])
+    size = thumbnail_service.THUMBNAIL_SIZE
+    assert Image.open(io.BytesIO(data)).size == (size, size)
+    assert touch_thumbnail(names["A"])
+    assert read_thumbnail("../" + names["T"]) is None
+    assert read_thumbnail("0" * 40 + ".png") is None
+    assert not touch_thumbnail("0" * 40 + ".png")
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+    # 容量縮小後再寫入時淘汰較久未使用的 T（A 剛 touch 過）
+    cache.max_bytes = len(read_thumbnail(names["A"])) + 1
+    cache.put(names["A"], read_thumbnail(names["A"]))
+    assert read_thumbnail(names["T"]) is None
+    assert read_thumbnail(names["A"]) is not None
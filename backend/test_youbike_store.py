@@ -0,0 +1,42 @@
+"""
+測試 YouBike 快照檔（以隨機站點代替 YouBike API）
+工作行程只收到版本號，需讀到與主行程相同的快照
+"""
+import numpy as np
+import pandas as pd
+
+import services.youbike_store as youbike_store
+
+
+def random_youbike_df(seed, n=50):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'sno': [f"5001{i:05d}" for i in range(n)],
+        'latitude': rng.uniform(24.96, 25.13, n),
+        'longitude': rng.uniform(121.45, 121.62, n),
+        'available_rent_bikes': rng.integers(0, 20, n),
+    })
+
+
+def test_worker_loads_snapshots_by_version(tmp_path, monkeypatch):
+    seeds = iter(range(10))
+    monkeypatch.setattr(youbike_store, "fetch_youbike_data", lambda: random_youbike_df(next(seeds)))
+    monkeypatch.setattr(youbike_store, "_snapshot", None)
+    monkeypatch.setattr(youbike_store, "_snapshot_dir", str(tmp_path / "main"))
+
+    published = [youbike_store.refresh_youbike_snapshot() for _ in range(5)]
+    # 只保留最近的版本
+    assert sorted(p.name for p in (tmp_path / "main").iterdir()) == ["v3.pkl", "v4.pkl", "v5.pkl"]
+
+    # 模擬工作行程：初始化時載入最新版本，之後依版本號讀取
+    youbike_store._snapshot = None
+    youbike_store.init_snapshot_worker(str(tmp_path / "main"))
+    assert youbike_store._snapshot.version == 5
+    assert youbike_store.get_snapshot_version(5) is youbike_store._snapshot
+
+    older = youbike_store.get_snapshot_version(4)
+    pd.testing.assert_frame_equal(older.df, published[3].df)
+    assert youbike_store._snapshot.version == 5
+
+    youbike_store.remove_published_snapshots()
+    assert not (tmp_path / "main").exists()
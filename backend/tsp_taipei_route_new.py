@@ -29,6 +29,8 @@ import argparse
 from scipy.interpolate import interp1d
 import geocoder
 
+from services.geodesic import haversine_one_to_many, haversine_many_to_many
+
 # ===================================================================
 # 配置參數類別
 # ===================================================================
@@ -179,7 +181,7 @@ def fetch_youbike_data():
     """抓取 YouBike 2.0 即時資料"""
     print("🚲 正在抓取 YouBike 即時資料...")
     url = "https://tcgbusfs.blob.core.windows.net/dotapp/youbike/v2/youbike_immediate.json"
-    data = requests.get(url).json()
+    data = requests.get(url, timeout=30).json()
     df = pd.DataFrame(data)
     df = df[['sno', 'sna', 'sarea', 'latitude', 'longitude', 'available_rent_bikes', 'available_return_bikes']]
     
@@ -195,18 +197,6 @@ def fetch_youbike_data():
     print(f"✅ 獲取 {len(df)} 個 YouBike 站點")
     return df
 
-def fetch_attractions_from_csv():
-    """從本地 CSV 讀取景點資料"""
-    print("🏛️ 正在讀取台北景點資料...")
-    try:
-        df = pd.read_csv("taipei_attractions.csv")
-        df = df[pd.notna(df['nlat']) & pd.notna(df['elong'])]
-        print(f"✅ 讀取 {len(df)} 個景點")
-        return df
-    except FileNotFoundError:
-        print("❌ 找不到 taipei_attractions.csv")
-        return pd.DataFrame()
-
 # ===================================================================
 # 位置與距離計算
 # ===================================================================
@@ -221,18 +211,37 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return R * c
 
-def find_nearest_youbike(user_lat, user_lon, youbike_df, min_bikes=3):
-    """找最近的 YouBike 站點"""
+def find_nearest_youbike(user_lat, user_lon, youbike_df, min_bikes=3, station_index=None):
+    """
+    找最近的 YouBike 站點
+    
+    station_index 為 youbike_df 站點座標的 GeoPointIndex（列順序需相同），
+    有提供時直接查索引，不必掃描所有站點
+    """
     print(f"\n🔍 尋找最近的 YouBike 站點...")
     print(f"   使用者位置: ({user_lat:.4f}, {user_lon:.4f})")
     
+    if station_index is not None and len(station_index) == len(youbike_df):
+        available = youbike_df['available_rent_bikes'].values >= min_bikes
+        result = station_index.query_nearest(user_lat, user_lon, available)
+        if result is None:
+            result = station_index.query_nearest(user_lat, user_lon)
+        position, distance_m = result
+        nearest = youbike_df.iloc[position].copy()
+        nearest['distance'] = distance_m / 1000
+        print(f"✅ 找到: {nearest['sna']}")
+        print(f"   距離: {nearest['distance']*1000:.0f} 公尺")
+        print(f"   可借: {nearest['available_rent_bikes']} 輛")
+        return nearest
+    
     available_stations = youbike_df[youbike_df['available_rent_bikes'] >= min_bikes].copy()
     if len(available_stations) == 0:
         available_stations = youbike_df.copy()
     
-    available_stations['distance'] = available_stations.apply(
-        lambda row: haversine_distance(user_lat, user_lon, row['latitude'], row['longitude']),
-        axis=1
+    available_stations['distance'] = haversine_one_to_many(
+        user_lat, user_lon,
+        available_stations['latitude'].values,
+        available_stations['longitude'].values
     )
     
     nearest = available_stations.nsmallest(1, 'distance').iloc[0]
@@ -246,19 +255,24 @@ def calculate_ride_time(distance_km, speed_kmh=12):
     """計算騎行時間（分鐘）"""
     return (distance_km / speed_kmh) * 60
 
-def filter_youbike_by_time(youbike_df, center_lat, center_lon, max_time_min=20, speed_kmh=12):
-    """篩選在騎行時間內的站點"""
-    max_distance_km = (max_time_min / 60) * speed_kmh
+def filter_youbike_by_time(youbike_df, center_lat, center_lon, max_time_min=20, speed_kmh=12, ride_times=None):
+    """
+    篩選在騎行時間內的站點
     
+    ride_times: 以站號為索引的實際騎行時間（分鐘，可選），提供時取代直線距離估算，
+                沒有列在其中的站點視為無法到達
+    """
     youbike_df = youbike_df.copy()
-    youbike_df['distance_from_center'] = youbike_df.apply(
-        lambda row: haversine_distance(center_lat, center_lon, row['latitude'], row['longitude']),
-        axis=1
+    youbike_df['distance_from_center'] = haversine_one_to_many(
+        center_lat, center_lon,
+        youbike_df['latitude'].values,
+        youbike_df['longitude'].values
     )
     
-    youbike_df['ride_time'] = youbike_df['distance_from_center'].apply(
-        lambda d: calculate_ride_time(d, speed_kmh)
-    )
+    if ride_times is not None:
+        youbike_df['ride_time'] = youbike_df['sno'].astype(str).map(ride_times)
+    else:
+        youbike_df['ride_time'] = calculate_ride_time(youbike_df['distance_from_center'], speed_kmh)
     
     filtered = youbike_df[youbike_df['ride_time'] <= max_time_min].copy()
     print(f"   篩選結果: {len(filtered)}/{len(youbike_df)} 個站點")
@@ -337,23 +351,15 @@ def scale_template_to_geography(template, center_lat, center_lon, max_distance_k
     
     return np.array(scaled)
 
-def generate_shape_route(youbike_df, start_station, target_shape, config):
-    """生成圖形路線"""
-    print(f"\n🎨 生成 '{target_shape}' 形狀路線...")
-    
-    if target_shape not in SHAPE_TEMPLATES:
-        print(f"⚠️ 不支援的圖形: {target_shape}")
-        return None, 0
-    
-    template = SHAPE_TEMPLATES[target_shape]
-    
-    # 篩選可用站點
+def select_route_candidates(youbike_df, start_station, config, ride_times=None):
+    """篩選可作為路線節點的站點（騎行時間內且車位充足，ride_times 見 filter_youbike_by_time）"""
     candidates = filter_youbike_by_time(
         youbike_df, 
         start_station['latitude'], 
         start_station['longitude'],
         config.max_segment_time,
-        config.cycling_speed
+        config.cycling_speed,
+        ride_times
     )
     
     candidates = candidates[
@@ -362,57 +368,46 @@ def generate_shape_route(youbike_df, start_station, target_shape, config):
     ].copy()
     
     print(f"   可用站點: {len(candidates)} 個")
-    
-    if len(candidates) < 4:
-        print(f"⚠️ 可用站點不足")
-        return None, 0
-    
-    # 縮放模板
-    template_scaled = scale_template_to_geography(
-        template, 
-        start_station['latitude'], 
-        start_station['longitude'],
-        config.max_segment_distance
-    )
-    
-    # 為每個模板點找最近的站點
+    return candidates
+
+def assemble_shape_route(candidates, start_station, template, distance_matrix):
+    """
+    依模板點到候選站點的距離矩陣挑選路線站點
+    
+    Args:
+        candidates: select_route_candidates 篩選出的站點
+        start_station: 起始站點
+        template: 原始（標準化）圖形模板，用於計算相似度
+        distance_matrix: (模板點數, 候選站點數) 的距離矩陣（公里）
+    
+    Returns:
+        (route_df, similarity)
+    """
     selected_stations = []
     used_indices = set()
     
     # 首先加入起始站點（確保從使用者附近開始）
-    start_idx = None
-    for idx in candidates.index:
-        if (candidates.loc[idx]['sno'] == start_station['sno']):
-            selected_stations.append(candidates.loc[idx])
-            used_indices.add(idx)
-            start_idx = idx
-            print(f"   ✅ 起始站點: {start_station['sna']}")
-            break
-    
-    # 如果起始站點不在候選列表中，找最近的候選站點作為起始點
-    if start_idx is None:
-        distances_from_start = candidates.apply(
-            lambda row: haversine_distance(
-                start_station['latitude'], start_station['longitude'],
-                row['latitude'], row['longitude']
-            ),
-            axis=1
+    start_matches = candidates.index[candidates['sno'].values == start_station['sno']]
+    if len(start_matches) > 0:
+        start_idx = start_matches[0]
+        selected_stations.append(candidates.loc[start_idx])
+        used_indices.add(start_idx)
+        print(f"   ✅ 起始站點: {start_station['sna']}")
+    else:
+        # 如果起始站點不在候選列表中，找最近的候選站點作為起始點
+        distances_from_start = haversine_one_to_many(
+            start_station['latitude'], start_station['longitude'],
+            candidates['latitude'].values, candidates['longitude'].values
         )
-        start_idx = distances_from_start.idxmin()
+        start_idx = candidates.index[np.argmin(distances_from_start)]
         selected_stations.append(candidates.loc[start_idx])
         used_indices.add(start_idx)
         print(f"   ✅ 起始站點（替代）: {candidates.loc[start_idx]['sna']}")
     
-    for template_point in template_scaled:
-        distances = candidates.apply(
-            lambda row: haversine_distance(
-                template_point[0], template_point[1],
-                row['latitude'], row['longitude']
-            ),
-            axis=1
-        )
-        
-        for idx in distances.nsmallest(10).index:
+    # 為每個模板點找最近的站點
+    for distances in distance_matrix:
+        nearest_positions = np.argsort(distances, kind='stable')[:10]
+        for idx in candidates.index[nearest_positions]:
             if idx not in used_indices:
                 selected_stations.append(candidates.loc[idx])
                 used_indices.add(idx)
@@ -430,6 +425,39 @@ def generate_shape_route(youbike_df, start_station, target_shape, config):
     
     return route_df, similarity
 
+def generate_shape_route(youbike_df, start_station, target_shape, config, ride_times=None):
+    """生成圖形路線（ride_times 見 filter_youbike_by_time）"""
+    print(f"\n🎨 生成 '{target_shape}' 形狀路線...")
+    
+    if target_shape not in SHAPE_TEMPLATES:
+        print(f"⚠️ 不支援的圖形: {target_shape}")
+        return None, 0
+    
+    template = SHAPE_TEMPLATES[target_shape]
+    
+    # 篩選可用站點
+    candidates = select_route_candidates(youbike_df, start_station, config, ride_times)
+    
+    if len(candidates) < 4:
+        print(f"⚠️ 可用站點不足")
+        return None, 0
+    
+    # 縮放模板
+    template_scaled = scale_template_to_geography(
+        template, 
+        start_station['latitude'], 
+        start_station['longitude'],
+        config.max_segment_distance
+    )
+    
+    # 所有模板點到所有候選站點的距離矩陣（一次算完）
+    distance_matrix = haversine_many_to_many(
+        template_scaled[:, 0], template_scaled[:, 1],
+        candidates['latitude'].values, candidates['longitude'].values
+    )
+    
+    return assemble_shape_route(candidates, start_station, template, distance_matrix)
+
 # ===================================================================
 # OSRM 路線計算
 # ===================================================================
@@ -608,16 +636,20 @@ def main():
     print()
     
     try:
-        # 1. 抓取資料
-        youbike_df = fetch_youbike_data()
-        attractions_df = fetch_attractions_from_csv()
+        # 1. 抓取資料（與 API 共用 YouBike 快照）
+        from services.youbike_store import get_youbike_snapshot
+        from services.attractions_repository import get_attractions_repository
+        snapshot = get_youbike_snapshot()
+        youbike_df = snapshot.df
+        attractions = get_attractions_repository()
         
         # 2. 找最近的 YouBike 站點作為起點
         start_station = find_nearest_youbike(
             config.user_location['lat'],
             config.user_location['lon'],
             youbike_df,
-            config.min_available_bikes
+            config.min_available_bikes,
+            snapshot.station_index
         )
         
         # 3. 生成圖形路線
@@ -635,13 +667,12 @@ def main():
         # 4. 為每個站點找附近景點
         print("\n🏛️  尋找附近景點...")
         attractions_dict = {}
-        for idx, (_, station) in enumerate(route_df.iterrows(), 1):
-            nearby = find_nearby_attractions(
-                station['latitude'],
-                station['longitude'],
-                attractions_df,
-                config.attraction_radius
-            )
+        nearby_by_station = attractions.find_nearby_batch(
+            route_df['latitude'].values,
+            route_df['longitude'].values,
+            config.attraction_radius
+        )
+        for idx, nearby in enumerate(nearby_by_station, 1):
             if nearby:
                 attractions_dict[idx] = nearby
                 print(f"   站點 {idx}: 找到 {len(nearby)} 個景點")